@@ -28,17 +28,22 @@
 
 # TODO:  code cleanup
 
-# TODO:  according to spec, packets may be bzip2 compressed.
-# TODO:: not implemented yet because I couldn't find a server that does this.
-
-import socket, struct, time
+import bz2, collections, random, socket, struct, time, zlib
 import StringIO
 
+from clock import monotonic
+
 PACKETSIZE=1400
 
 WHOLE=-1
 SPLIT=-2
 
+# split packets with this bit set in their request id are bzip2 compressed
+COMPRESSED=0x80000000
+
+# the most split messages being reassembled at once, to bound stray packets
+MAXSPLITMESSAGES=8
+
 # A2S_INFO
 A2S_INFO = ord('T')
 A2S_INFO_STRING = 'Source Engine Query'
@@ -56,6 +61,11 @@ A2S_RULES_REPLY = ord('E')
 CHALLENGE = -1
 S2C_CHALLENGE = ord('A')
 
+# hedged requests are resent at this percentile of recent round trip times,
+# but no sooner than MINHEDGESECS
+HEDGEPERCENTILE = 0.95
+MINHEDGESECS = 0.01
+
 class SourceQueryPacket(StringIO.StringIO):
     # putting and getting values
     def putByte(self, val):
@@ -96,9 +106,252 @@ class SourceQueryPacket(StringIO.StringIO):
         self.seek(end+1)
         return val
 
+# precompiled formats for SourceQueryReader
+BYTE = struct.Struct('<B')
+SHORT = struct.Struct('<h')
+LONG = struct.Struct('<l')
+LONGLONG = struct.Struct('<Q')
+FLOAT = struct.Struct('<f')
+PLAYER_SCORE = struct.Struct('<lf')
+SPLIT_HEADER = struct.Struct('<lBBh')
+COMPRESSION_HEADER = struct.Struct('<lL')
+
+class SourceQueryReader(object):
+    """Decodes a received packet without copying it.
+
+    The packet is a str or a bytearray. Values are unpacked in place with
+    precompiled structs while tracking the offset, so that only the decoded
+    strings are copied. The getters match those of SourceQueryPacket."""
+
+    __slots__ = ('data', 'offset')
+
+    def __init__(self, data, offset=0):
+        self.data = data
+        self.offset = offset
+
+    def tell(self):
+        return self.offset
+
+    def seek(self, offset):
+        self.offset = offset
+
+    def read(self):
+        val = self.data[self.offset:]
+        self.offset = len(self.data)
+        return str(val)
+
+    def getByte(self):
+        val = BYTE.unpack_from(self.data, self.offset)[0]
+        self.offset += 1
+        return val
+
+    def getShort(self):
+        val = SHORT.unpack_from(self.data, self.offset)[0]
+        self.offset += 2
+        return val
+
+    def getLong(self):
+        val = LONG.unpack_from(self.data, self.offset)[0]
+        self.offset += 4
+        return val
+
+    def getLongLong(self):
+        val = LONGLONG.unpack_from(self.data, self.offset)[0]
+        self.offset += 8
+        return val
+
+    def getFloat(self):
+        val = FLOAT.unpack_from(self.data, self.offset)[0]
+        self.offset += 4
+        return val
+
+    def getString(self):
+        start = self.offset
+        end = self.data.index('\0', start)
+        self.offset = end + 1
+        return str(self.data[start:end])
+
+    def getPlayer(self):
+        """Return the index, name, kills and time of a player record."""
+        data = self.data
+        start = self.offset
+        index = BYTE.unpack_from(data, start)[0]
+        end = data.index('\0', start + 1)
+        kills, connect_time = PLAYER_SCORE.unpack_from(data, end + 1)
+        self.offset = end + 9
+        return index, str(data[start + 1:end]), kills, connect_time
+
 class SourceQueryError(Exception):
     pass
 
+class CircuitOpenError(SourceQueryError):
+    """Raised instead of sending a request to a server that stopped replying."""
+    pass
+
+class RttEstimator(object):
+    """Estimates percentiles of the recent round trip times of a request type."""
+
+    def __init__(self, max_samples=64, min_samples=8):
+        self.samples = collections.deque(maxlen=max_samples)
+        self.min_samples = min_samples
+
+    def add(self, rtt):
+        self.samples.append(rtt)
+
+    def percentile(self, fraction):
+        """Return the given percentile as a fraction, or None if too few samples."""
+        if len(self.samples) < self.min_samples:
+            return None
+        samples = sorted(self.samples)
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+class CircuitBreaker(object):
+    """Stops sending requests to a server after consecutive failures.
+
+    After failure_threshold requests in a row fail, the circuit opens, and
+    requests fail at once with CircuitOpenError. After reset_secs, one request
+    is sent as a probe. If it succeeds the circuit closes, and otherwise it
+    opens again for twice as long, up to max_reset_secs."""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=3, reset_secs=10.0, max_reset_secs=300.0,
+                 clock=monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_secs = reset_secs
+        self.max_reset_secs = max_reset_secs
+        self._clock = clock
+        self.state = CircuitBreaker.CLOSED
+        self.num_failures = 0
+        self._open_secs = reset_secs
+        self._probe_time = None
+
+    def allow(self):
+        """Return whether a request may be sent."""
+        if self.state == CircuitBreaker.OPEN:
+            if self._clock() < self._probe_time:
+                return False
+            self.state = CircuitBreaker.HALF_OPEN
+        return True
+
+    def record_success(self):
+        self.state = CircuitBreaker.CLOSED
+        self.num_failures = 0
+        self._open_secs = self.reset_secs
+
+    def record_failure(self):
+        self.num_failures += 1
+        if self.state == CircuitBreaker.HALF_OPEN:
+            # the probe failed, so wait longer before the next one
+            self._open_secs = min(2 * self._open_secs, self.max_reset_secs)
+        elif self.num_failures < self.failure_threshold:
+            return
+        self.state = CircuitBreaker.OPEN
+        self._probe_time = self._clock() + self._open_secs
+
+class QueryObserver(object):
+    """Observes queries, such as to update metrics.
+
+    Each method is called on an event of a query, and does nothing here; a
+    subclass overrides the methods of the events it needs. Times are in
+    seconds, and typ is the request type, such as 'player'."""
+
+    def round_trip(self, typ, rtt_secs):
+        """Called with the round trip time of a request and its reply."""
+
+    def timeout(self, typ):
+        """Called when no whole reply arrives before the timeout."""
+
+    def hedge(self, typ):
+        """Called when a request was resent after the hedge deadline."""
+
+    def retry(self, typ):
+        """Called when a request is retried after a timeout."""
+
+    def short_circuit(self):
+        """Called when a request is not sent because the circuit is open."""
+
+    def invalid_packet(self):
+        """Called when a received packet is malformed."""
+
+    def split_reply(self, num_fragments):
+        """Called when a split reply is reassembled."""
+
+    def parse(self, typ, parse_secs):
+        """Called with the time to parse a reply."""
+
+# the observer of queries that are given none, which ignores all events
+NULL_OBSERVER = QueryObserver()
+
+class SplitPacketBuffer(object):
+    """Reassembles split packets into whole packets.
+
+    Fragments are kept by request id, so that they may arrive in any order and
+    interleaved with fragments of other messages. Duplicate fragments and
+    fragments that are inconsistent with earlier ones are ignored. Each
+    reassembled reply is reported to the observer, if one is given."""
+
+    def __init__(self, observer=NULL_OBSERVER):
+        self.observer = observer
+        # fragments of each message by request id, in the order first received
+        self.messages = {}
+        self.reqids = []
+
+    def add(self, packet):
+        """Add a split packet positioned after its type.
+
+        Return the reassembled packet positioned after its type, or None if
+        fragments are missing or the reassembled packet is corrupt or not
+        whole."""
+        reqid, total, num, splitsize = SPLIT_HEADER.unpack_from(
+            packet.data, packet.offset)
+        packet.offset += SPLIT_HEADER.size
+        if num >= total:
+            return None
+
+        fragments = self.messages.get(reqid)
+        if fragments is None:
+            if len(self.reqids) >= MAXSPLITMESSAGES:
+                del self.messages[self.reqids.pop(0)]
+            fragments = self.messages[reqid] = [None] * total
+            self.reqids.append(reqid)
+        elif len(fragments) != total or fragments[num] is not None:
+            return None
+        fragments[num] = packet.read()
+
+        if None in fragments:
+            return None
+        del self.messages[reqid]
+        self.reqids.remove(reqid)
+
+        self.observer.split_reply(total)
+        data = ''.join(fragments)
+        if reqid & COMPRESSED:
+            try:
+                data = self.decompress(data)
+            except SourceQueryError:
+                # ignore it like any other malformed packet
+                self.observer.invalid_packet()
+                return None
+        packet = SourceQueryReader(data)
+        if packet.getLong() != WHOLE:
+            self.observer.invalid_packet()
+            return None
+        return packet
+
+    def decompress(self, data):
+        # the first fragment starts with the decompressed size and its CRC32
+        size, crc = COMPRESSION_HEADER.unpack_from(data)
+        try:
+            data = bz2.decompress(data[COMPRESSION_HEADER.size:])
+        except (IOError, EOFError, ValueError):
+            raise SourceQueryError('Invalid compressed split packet')
+        if len(data) != size or zlib.crc32(data) & 0xffffffff != crc:
+            raise SourceQueryError('Invalid checksum of compressed split packet')
+        return data
+
 class SourceQuery(object):
     """Example usage:
 
@@ -108,78 +361,221 @@ class SourceQuery(object):
        print server.info()
        print server.player()
        print server.rules()
+
+       If persistent is True, then the socket stays open between queries, the
+       host is resolved only once, and the challenge number is reused until the
+       server rejects it. A player or rules query then takes one round trip.
+
+       Over a lossy link, these options recover from lost packets:
+
+       If hedge is True, then a request with no reply by the 95th percentile
+       of recent round trip times of its type is sent once more, and whichever
+       reply arrives first is returned. Until enough round trips are measured,
+       the request is resent after half the timeout.
+
+       If retries is positive, then a request that times out is sent again up
+       to that many times, after a random backoff of up to backoff_secs that
+       doubles with each retry, up to max_backoff_secs.
+
+       If circuit_breaker is a CircuitBreaker, then after consecutive failures
+       requests raise CircuitOpenError without being sent, until it probes the
+       server again.
+
+       If observer is a QueryObserver, then it is called on each round trip,
+       timeout, invalid packet and parse, such as to update metrics.
     """
 
-    def __init__(self, host, port=27015, timeout=1.0):
+    def __init__(self, host, port=27015, timeout=1.0, persistent=False,
+                 hedge=False, retries=0, backoff_secs=0.05, max_backoff_secs=0.5,
+                 circuit_breaker=None, observer=NULL_OBSERVER):
         self.host = host
         self.port = port
         self.timeout = timeout
+        self.persistent = persistent
+        self.hedge = hedge
+        self.retries = retries
+        self.backoff_secs = backoff_secs
+        self.max_backoff_secs = max_backoff_secs
+        self.circuit_breaker = circuit_breaker
+        self.observer = observer
         self.udp = False
+        self.address = None
+        self.cached_challenge = None
+        # recent round trip times by request type, for the hedge deadline
+        self.rtt_estimators = collections.defaultdict(RttEstimator)
+        self.num_hedges = 0
+        self._random = random.Random()
 
     def disconnect(self):
         if self.udp:
             self.udp.close()
             self.udp = False
 
-    def connect(self, challenge=False):
+    def resolve(self):
+        if self.address is None or not self.persistent:
+            self.address = (socket.gethostbyname(self.host), self.port)
+        return self.address
+
+    def open_socket(self, address):
         self.disconnect()
         self.udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.udp.settimeout(self.timeout)
-        self.udp.connect((self.host, self.port))
+        self.udp.connect(address)
+
+    def connect(self, challenge=False):
+        if self.persistent and self.udp:
+            self.drain()
+        else:
+            self.open_socket(self.resolve())
 
         if challenge:
             return self.challenge()
 
-    def receive(self):
-        packet = SourceQueryPacket(self.udp.recv(PACKETSIZE))
-        typ = packet.getLong()
-
-        if typ == WHOLE:
-            return packet
-
-        elif typ == SPLIT:
-            # handle split packets
-            reqid = packet.getLong()
-            total = packet.getByte()
-            num = packet.getByte()
-            splitsize = packet.getShort()
-            result = [0 for x in xrange(total)]
-
-            result[num] = packet.read()
-
-            # fetch all remaining splits
-            while 0 in result:
-                packet = SourceQueryPacket(self.udp.recv(PACKETSIZE))
-
-                if packet.getLong() == SPLIT and packet.getLong() == reqid:
-                    total = packet.getByte()
-                    num = packet.getByte()
-                    splitsize = packet.getShort()
-                    result[num] = packet.read()
-
-                else:
-                    raise SourceQueryError('Invalid split packet')
-
-            packet = SourceQueryPacket("".join(result))
-
-            if packet.getLong() == WHOLE:
-                return packet
-
-            else:
-                raise SourceQueryError('Invalid split packet')
+    def drain(self):
+        # discard any replies that arrived after an earlier request timed out,
+        # so they are not mistaken for the reply to the next request
+        self.udp.setblocking(False)
+        try:
+            while 1:
+                self.udp.recv(PACKETSIZE)
+        except socket.error:
+            pass
+        finally:
+            self.udp.settimeout(self.timeout)
+
+    def receive(self, request=None, hedge_secs=None):
+        # the whole reply, including all of its split packets, must arrive
+        # before the timeout; stray and invalid packets are ignored. if
+        # hedge_secs is given and no whole reply arrives by then, the request
+        # is sent once more, and whichever reply completes first is returned
+        now = monotonic()
+        deadline = now + self.timeout
+        hedge_time = None
+        if hedge_secs is not None:
+            hedge_time = now + hedge_secs
+        splits = SplitPacketBuffer(self.observer)
+        try:
+            while 1:
+                now = monotonic()
+                remaining = deadline - now
+                if remaining <= 0:
+                    raise socket.timeout('timed out')
+                if hedge_time is not None:
+                    if now >= hedge_time:
+                        self.udp.send(request)
+                        self.num_hedges += 1
+                        hedge_time = None
+                        continue
+                    remaining = min(remaining, hedge_time - now)
+                self.udp.settimeout(remaining)
+                try:
+                    data = self.udp.recv(PACKETSIZE)
+                except socket.timeout:
+                    # the loop raises if the deadline passed, or else hedges
+                    continue
+                packet = SourceQueryReader(data)
 
+                try:
+                    typ = packet.getLong()
+                except struct.error:
+                    self.observer.invalid_packet()
+                    continue
+                if typ == WHOLE:
+                    return packet
+                elif typ == SPLIT:
+                    try:
+                        packet = splits.add(packet)
+                    except struct.error:
+                        self.observer.invalid_packet()
+                        continue
+                    if packet is not None:
+                        return packet
+        finally:
+            self.udp.settimeout(self.timeout)
+
+    def hedge_secs(self, typ):
+        """Return the seconds to wait for a reply before hedging, or None."""
+        if not self.hedge:
+            return None
+        hedge_secs = self.rtt_estimators[typ].percentile(HEDGEPERCENTILE)
+        if hedge_secs is None:
+            return self.timeout / 2
+        hedge_secs = max(hedge_secs, MINHEDGESECS)
+        if hedge_secs >= self.timeout:
+            return None
+        return hedge_secs
+
+    def backoff(self, retry):
+        """Return the seconds to wait before the given retry, from 1."""
+        max_secs = min(self.backoff_secs * 2 ** (retry - 1), self.max_backoff_secs)
+        # full jitter, so that clients that lost packets together spread out
+        return self._random.uniform(0, max_secs)
+
+    def round_trip(self, request, typ):
+        """Send a request of the given type and return its reply packet.
+
+        The request is hedged, retried and short-circuited as configured. The
+        round trip time and any timeout are reported to the observer."""
+        breaker = self.circuit_breaker
+        if breaker is not None and not breaker.allow():
+            self.observer.short_circuit()
+            raise CircuitOpenError('Circuit open for %s:%s' % (self.host, self.port))
+
+        first_num_hedges = self.num_hedges
+        retry = 0
+        try:
+            while 1:
+                num_hedges = self.num_hedges
+                before = monotonic()
+                try:
+                    self.udp.send(request)
+                    packet = self.receive(request, self.hedge_secs(typ))
+                except socket.timeout:
+                    self.observer.timeout(typ)
+                    if self.num_hedges != num_hedges:
+                        self.observer.hedge(typ)
+                    if retry < self.retries:
+                        retry += 1
+                        self.observer.retry(typ)
+                        time.sleep(self.backoff(retry))
+                        continue
+                    if breaker is not None:
+                        breaker.record_failure()
+                    raise
+                except socket.error:
+                    # such as a refused connection from a server that is down
+                    if breaker is not None:
+                        breaker.record_failure()
+                    raise
+                break
+        finally:
+            if retry or self.num_hedges != first_num_hedges:
+                # the server may still reply to the other copies of the
+                # request, so move to a new port where those replies cannot be
+                # mistaken for the reply to the next request
+                self.open_socket(self.address)
+
+        rtt = monotonic() - before
+        self.observer.round_trip(typ, rtt)
+        if self.num_hedges == num_hedges:
+            self.rtt_estimators[typ].add(rtt)
         else:
-            raise SourceQueryError("Received invalid packet type %d" % (typ,))
+            # like Karn's algorithm, do not estimate from an ambiguous reply
+            self.observer.hedge(typ)
+        if breaker is not None:
+            breaker.record_success()
+        return packet
+
+    def parse(self, parse_reply, packet, typ):
+        """Return the reply parsed by parse_reply, reporting the parse time."""
+        before = monotonic()
+        result = parse_reply(packet)
+        self.observer.parse(typ, monotonic() - before)
+        return result
 
     def challenge(self):
         # use A2S_PLAYER to obtain a challenge
-        packet = SourceQueryPacket()
-        packet.putLong(WHOLE)
-        packet.putByte(A2S_PLAYER)
-        packet.putLong(CHALLENGE)
-
-        self.udp.send(packet.getvalue())
-        packet = self.receive()
+        packet = self.round_trip(build_player_request(CHALLENGE), 'challenge')
 
         # this is our challenge packet
         if packet.getByte() == S2C_CHALLENGE:
@@ -187,119 +583,173 @@ class SourceQuery(object):
             return challenge
 
     def info(self):
-        """Return a dict with server info and ping."""
-        self.connect()
+        """Return a dict with server info and ping.
 
-        packet = SourceQueryPacket()
-        packet.putLong(WHOLE)
-        packet.putByte(A2S_INFO)
-        packet.putString(A2S_INFO_STRING)
-
-        before = time.time()
-
-        self.udp.send(packet.getvalue())
-        packet = self.receive()
-
-        after = time.time()
-
-        if packet.getByte() == A2S_INFO_REPLY:
-            result = {}
+        Current servers reply to an A2S_INFO without a challenge with one, and
+        the request is then sent again with it. If persistent is True, then the
+        cached challenge is sent from the start."""
+        self.connect()
+        challenge = None
+        if self.persistent:
+            challenge = self.cached_challenge
+
+        for attempt in xrange(2):
+            before = monotonic()
+            packet = self.round_trip(build_info_request(challenge), 'info')
+            after = monotonic()
+            reply_type = packet.getByte()
+            if reply_type != S2C_CHALLENGE:
+                break
+            challenge = packet.getLong()
+            if self.persistent:
+                self.cached_challenge = challenge
+        else:
+            raise SourceQueryError('Server rejected the challenge')
 
+        if reply_type == A2S_INFO_REPLY:
+            result = self.parse(parse_info_reply, packet, 'info')
             result['ping'] = after - before
+            return result
 
-            result['network_version'] = packet.getByte()
-            result['hostname'] = packet.getString()
-            result['map'] = packet.getString()
-            result['gamedir'] = packet.getString()
-            result['gamedesc'] = packet.getString()
-            result['appid'] = packet.getShort()
-            result['numplayers'] = packet.getByte()
-            result['maxplayers'] = packet.getByte()
-            result['numbots'] = packet.getByte()
-            result['dedicated'] = chr(packet.getByte())
-            result['os'] = chr(packet.getByte())
-            result['passworded'] = packet.getByte()
-            result['secure'] = packet.getByte()
-            result['version'] = packet.getString()
-
-            # edf may or may not be present
-            # contents undefined (see wiki page)
-            # this protocol is horrible
-            try:
-                edf = packet.getByte()
-                result['edf'] = edf
-
-                if edf & 0x80:
-                    result['port'] = packet.getShort()
-                if edf & 0x10:
-                    result['steamid'] = packet.getLongLong()
-                if edf & 0x40:
-                    result['specport'] = packet.getShort()
-                    result['specname'] = packet.getString()
-                if edf & 0x20:
-                    result['tag'] = packet.getString()
-            except:
-                # let's just ignore all errors...
-                pass
+    def challenged_request(self, build_request, typ):
+        """Send a request that needs a challenge, and return the reply packet.
 
-            return result
+        The returned packet is positioned at the type byte of the reply."""
+        if not self.persistent:
+            challenge = self.connect(True)
+            return self.round_trip(build_request(challenge), typ)
 
-    def player(self):
-        challenge = self.connect(True)
+        self.connect()
+        challenge = self.cached_challenge
+        if challenge is None:
+            challenge = CHALLENGE
+
+        # if the challenge is missing or stale, the server replies with a new one
+        for attempt in xrange(2):
+            packet = self.round_trip(build_request(challenge), typ)
+            start = packet.tell()
+            if packet.getByte() != S2C_CHALLENGE:
+                packet.seek(start)
+                return packet
+            challenge = self.cached_challenge = packet.getLong()
 
-        # now obtain the actual player info
-        packet = SourceQueryPacket()
-        packet.putLong(WHOLE)
-        packet.putByte(A2S_PLAYER)
-        packet.putLong(challenge)
+        raise SourceQueryError('Server rejected the challenge')
 
-        self.udp.send(packet.getvalue())
-        packet = self.receive()
+    def player(self):
+        packet = self.challenged_request(build_player_request, 'player')
 
         # this is our player info
         if packet.getByte() == A2S_PLAYER_REPLY:
-            numplayers = packet.getByte()
-
-            result = []
-
-            # TF2 32player servers may send an incomplete reply
-            try:
-                for x in xrange(numplayers):
-                    player = {}
-                    player['index'] = packet.getByte()
-                    player['name'] = packet.getString()
-                    player['kills'] = packet.getLong()
-                    player['time'] = packet.getFloat()
-                    result.append(player)
-
-            except:
-                pass
-
-            return result
+            return self.parse(parse_player_reply, packet, 'player')
 
     def rules(self):
-        challenge = self.connect(True)
-
-        # now obtain the actual rules
-        packet = SourceQueryPacket()
-        packet.putLong(WHOLE)
-        packet.putByte(A2S_RULES)
-        packet.putLong(challenge)
-
-        self.udp.send(packet.getvalue())
-        packet = self.receive()
+        packet = self.challenged_request(build_rules_request, 'rules')
 
         # this is our rules
         if packet.getByte() == A2S_RULES_REPLY:
-            rules = {}
-            numrules = packet.getShort()
+            return self.parse(parse_rules_reply, packet, 'rules')
 
-            # TF2 sends incomplete packets, so we have to ignore numrules
-            while 1:
-                try:
-                    key = packet.getString()
-                    rules[key] = packet.getString()
-                except:
-                    break
+# building requests and parsing replies, shared by all query clients
 
-            return rules
+def build_info_request(challenge=None):
+    packet = SourceQueryPacket()
+    packet.putLong(WHOLE)
+    packet.putByte(A2S_INFO)
+    packet.putString(A2S_INFO_STRING)
+    # newer servers reply to an A2S_INFO without a challenge with S2C_CHALLENGE
+    if challenge is not None:
+        packet.putLong(challenge)
+    return packet.getvalue()
+
+def build_player_request(challenge):
+    packet = SourceQueryPacket()
+    packet.putLong(WHOLE)
+    packet.putByte(A2S_PLAYER)
+    packet.putLong(challenge)
+    return packet.getvalue()
+
+def build_rules_request(challenge):
+    packet = SourceQueryPacket()
+    packet.putLong(WHOLE)
+    packet.putByte(A2S_RULES)
+    packet.putLong(challenge)
+    return packet.getvalue()
+
+def parse_info_reply(packet):
+    """Parse an A2S_INFO reply positioned after its type byte."""
+    result = {}
+
+    result['network_version'] = packet.getByte()
+    result['hostname'] = packet.getString()
+    result['map'] = packet.getString()
+    result['gamedir'] = packet.getString()
+    result['gamedesc'] = packet.getString()
+    result['appid'] = packet.getShort()
+    result['numplayers'] = packet.getByte()
+    result['maxplayers'] = packet.getByte()
+    result['numbots'] = packet.getByte()
+    result['dedicated'] = chr(packet.getByte())
+    result['os'] = chr(packet.getByte())
+    result['passworded'] = packet.getByte()
+    result['secure'] = packet.getByte()
+    result['version'] = packet.getString()
+
+    # edf may or may not be present
+    # contents undefined (see wiki page)
+    # this protocol is horrible
+    try:
+        edf = packet.getByte()
+        result['edf'] = edf
+
+        if edf & 0x80:
+            result['port'] = packet.getShort()
+        if edf & 0x10:
+            result['steamid'] = packet.getLongLong()
+        if edf & 0x40:
+            result['specport'] = packet.getShort()
+            result['specname'] = packet.getString()
+        if edf & 0x20:
+            result['tag'] = packet.getString()
+    except:
+        # let's just ignore all errors...
+        pass
+
+    return result
+
+def parse_player_reply(packet):
+    """Parse an A2S_PLAYER reply positioned after its type byte.
+
+    The packet must be a SourceQueryReader."""
+    numplayers = packet.getByte()
+
+    result = []
+
+    # TF2 32player servers may send an incomplete reply
+    try:
+        for x in xrange(numplayers):
+            index, name, kills, connect_time = packet.getPlayer()
+            result.append({
+                'index': index,
+                'name': name,
+                'kills': kills,
+                'time': connect_time})
+
+    except:
+        pass
+
+    return result
+
+def parse_rules_reply(packet):
+    """Parse an A2S_RULES reply positioned after its type byte."""
+    rules = {}
+    numrules = packet.getShort()
+
+    # TF2 sends incomplete packets, so we have to ignore numrules
+    while 1:
+        try:
+            key = packet.getString()
+            rules[key] = packet.getString()
+        except:
+            break
+
+    return rules
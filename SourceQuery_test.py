@@ -0,0 +1,397 @@
+import socket
+import time
+import unittest
+
+from SourceQuery import *
+from fake_server import FakeSourceServer, MAX_PLAYERS
+
+
+class SourceQueryReaderTest(unittest.TestCase):
+  """Test case for SourceQueryReader."""
+
+  def _make_reader(self, packet):
+    return SourceQueryReader(packet.getvalue())
+
+  def test_get_values(self):
+    packet = SourceQueryPacket()
+    packet.putByte(200)
+    packet.putShort(-2)
+    packet.putLong(-3)
+    packet.putFloat(1.5)
+    packet.putString('name')
+    packet.putString('')
+
+    reader = self._make_reader(packet)
+    self.assertEqual(200, reader.getByte())
+    self.assertEqual(-2, reader.getShort())
+    self.assertEqual(-3, reader.getLong())
+    self.assertEqual(1.5, reader.getFloat())
+    self.assertEqual('name', reader.getString())
+    self.assertEqual('', reader.getString())
+    self.assertEqual(len(packet.getvalue()), reader.tell())
+    self.assertEqual('', reader.read())
+
+  def test_bytearray(self):
+    packet = SourceQueryPacket()
+    packet.putLong(7)
+    packet.putString('name')
+
+    reader = SourceQueryReader(bytearray(packet.getvalue()))
+    self.assertEqual(7, reader.getLong())
+    self.assertEqual('name', reader.getString())
+
+  def test_get_player(self):
+    packet = SourceQueryPacket()
+    for index, name, kills, connect_time in ((1, 'player1', 5, 10.0), (2, '', 0, 2.5)):
+      packet.putByte(index)
+      packet.putString(name)
+      packet.putLong(kills)
+      packet.putFloat(connect_time)
+
+    reader = self._make_reader(packet)
+    self.assertEqual((1, 'player1', 5, 10.0), reader.getPlayer())
+    self.assertEqual((2, '', 0, 2.5), reader.getPlayer())
+    self.assertEqual('', reader.read())
+
+  def test_read_past_end(self):
+    reader = SourceQueryReader('\x01')
+    self.assertEqual(1, reader.getByte())
+    self.assertRaises(struct.error, reader.getLong)
+    self.assertRaises(ValueError, reader.getString)
+
+  def test_parse_incomplete_player_reply(self):
+    # The reply claims three players, but the last is truncated.
+    packet = SourceQueryPacket()
+    packet.putByte(3)
+    for index, name in ((0, 'player1'), (1, 'player2')):
+      packet.putByte(index)
+      packet.putString(name)
+      packet.putLong(index)
+      packet.putFloat(1.0)
+    packet.putByte(2)
+    packet.putString('player3')
+
+    players = parse_player_reply(self._make_reader(packet))
+    self.assertEqual(['player1', 'player2'], [player['name'] for player in players])
+
+
+class SplitPacketBufferTest(unittest.TestCase):
+  """Test case for SplitPacketBuffer."""
+
+  def setUp(self):
+    self.splits = SplitPacketBuffer()
+    self.message = struct.pack('<lB', WHOLE, A2S_RULES_REPLY) + 'x' * 100
+
+  def _make_fragments(self, reqid, payload, num_fragments):
+    """Returns the data of each split packet of the payload."""
+    size = (len(payload) + num_fragments - 1) // num_fragments
+    fragments = []
+    for num in xrange(num_fragments):
+      data = struct.pack('<llBBh', SPLIT, reqid, num_fragments, num, size)
+      data += payload[num * size:(num + 1) * size]
+      fragments.append(data)
+    return fragments
+
+  def _add(self, data):
+    packet = SourceQueryReader(data)
+    self.assertEqual(SPLIT, packet.getLong())
+    return self.splits.add(packet)
+
+  def test_out_of_order(self):
+    fragments = self._make_fragments(1, self.message, 3)
+    self.assertIsNone(self._add(fragments[2]))
+    self.assertIsNone(self._add(fragments[0]))
+    packet = self._add(fragments[1])
+    self.assertEqual(self.message[4:], packet.read())
+
+  def test_duplicates_and_interleaved(self):
+    fragments = self._make_fragments(1, self.message, 2)
+    other_fragments = self._make_fragments(2, self.message, 2)
+    self.assertIsNone(self._add(fragments[0]))
+    self.assertIsNone(self._add(other_fragments[1]))
+    self.assertIsNone(self._add(fragments[0]))
+    packet = self._add(fragments[1])
+    self.assertEqual(self.message[4:], packet.read())
+    packet = self._add(other_fragments[0])
+    self.assertEqual(self.message[4:], packet.read())
+
+  def test_invalid_number(self):
+    data = struct.pack('<llBBh', SPLIT, 1, 2, 2, 100)
+    self.assertIsNone(self._add(data))
+    self.assertEqual({}, self.splits.messages)
+
+  def test_not_whole(self):
+    class Observer(QueryObserver):
+      num_invalid_packets = 0
+      def invalid_packet(self):
+        self.num_invalid_packets += 1
+    observer = Observer()
+    self.splits = SplitPacketBuffer(observer)
+
+    message = struct.pack('<l', SPLIT) + self.message[4:]
+    for data in self._make_fragments(1, message, 2):
+      self.assertIsNone(self._add(data))
+    self.assertEqual(1, observer.num_invalid_packets)
+    self.assertEqual({}, self.splits.messages)
+
+    # A later whole message is reassembled.
+    for data in self._make_fragments(2, self.message, 2):
+      packet = self._add(data)
+    self.assertEqual(self.message[4:], packet.read())
+
+  def _compress(self, message):
+    return (struct.pack('<lL', len(message), zlib.crc32(message) & 0xffffffff) +
+        bz2.compress(message))
+
+  def test_compressed(self):
+    reqid = struct.unpack('<l', struct.pack('<L', COMPRESSED | 1))[0]
+    fragments = self._make_fragments(reqid, self._compress(self.message), 2)
+    self.assertIsNone(self._add(fragments[1]))
+    packet = self._add(fragments[0])
+    self.assertEqual(A2S_RULES_REPLY, packet.getByte())
+    self.assertEqual(self.message[5:], packet.read())
+
+  def test_compressed_invalid_checksum(self):
+    reqid = struct.unpack('<l', struct.pack('<L', COMPRESSED | 1))[0]
+    payload = self._compress(self.message)
+    payload = payload[:4] + struct.pack('<L', 0) + payload[8:]
+    fragments = self._make_fragments(reqid, payload, 1)
+    # The corrupt message is dropped, so that a later whole one is awaited.
+    self.assertIsNone(self._add(fragments[0]))
+    self.assertEqual({}, self.splits.messages)
+
+
+class RttEstimatorTest(unittest.TestCase):
+  """Test case for RttEstimator."""
+
+  def test_percentile(self):
+    estimator = RttEstimator(max_samples=10, min_samples=4)
+    for rtt in (0.3, 0.1, 0.2):
+      estimator.add(rtt)
+    self.assertIsNone(estimator.percentile(0.95))
+    estimator.add(0.4)
+    self.assertEqual(0.4, estimator.percentile(0.95))
+    self.assertEqual(0.3, estimator.percentile(0.5))
+    self.assertEqual(0.1, estimator.percentile(0.0))
+
+  def test_max_samples(self):
+    estimator = RttEstimator(max_samples=4, min_samples=1)
+    for rtt in (1.0, 0.1, 0.2, 0.3, 0.4):
+      estimator.add(rtt)
+    # The oldest and slowest round trip was discarded.
+    self.assertEqual(0.4, estimator.percentile(0.95))
+
+
+class CircuitBreakerTest(unittest.TestCase):
+  """Test case for CircuitBreaker."""
+
+  def setUp(self):
+    self.now = 0.0
+    self.breaker = CircuitBreaker(failure_threshold=2, reset_secs=10,
+        max_reset_secs=30, clock=lambda: self.now)
+
+  def test_open_after_failures(self):
+    self.breaker.record_failure()
+    self.assertTrue(self.breaker.allow())
+    # A success resets the consecutive failures.
+    self.breaker.record_success()
+    self.breaker.record_failure()
+    self.assertTrue(self.breaker.allow())
+    self.breaker.record_failure()
+    self.assertEqual(CircuitBreaker.OPEN, self.breaker.state)
+    self.assertFalse(self.breaker.allow())
+
+  def test_probe(self):
+    self.breaker.record_failure()
+    self.breaker.record_failure()
+    self.now = 10
+    self.assertTrue(self.breaker.allow())
+    self.assertEqual(CircuitBreaker.HALF_OPEN, self.breaker.state)
+
+    # The failed probe opens the circuit for twice as long.
+    self.breaker.record_failure()
+    self.now = 29
+    self.assertFalse(self.breaker.allow())
+    self.now = 30
+    self.assertTrue(self.breaker.allow())
+    self.breaker.record_failure()
+    # The circuit opens for at most 30 seconds.
+    self.now = 60
+    self.assertTrue(self.breaker.allow())
+
+    self.breaker.record_success()
+    self.assertEqual(CircuitBreaker.CLOSED, self.breaker.state)
+    self.breaker.record_failure()
+    self.assertTrue(self.breaker.allow())
+
+
+class SourceQueryTest(unittest.TestCase):
+  """Test case for SourceQuery against a FakeSourceServer."""
+
+  def _start_server(self, **kwargs):
+    self.server = FakeSourceServer(**kwargs)
+    self.server.start()
+    self.addCleanup(self.server.stop)
+    host, port = self.server.address
+    return host, port
+
+  def test_info(self):
+    host, port = self._start_server(num_players=5)
+    info = SourceQuery(host, port).info()
+    self.assertEqual(self.server.map, info['map'])
+    self.assertEqual(5, info['numplayers'])
+
+  def test_challenged_info(self):
+    host, port = self._start_server(num_players=5)
+    self.server.challenge_info = True
+    info = SourceQuery(host, port).info()
+    self.assertEqual(5, info['numplayers'])
+    self.assertEqual(2, self.server.num_requests)
+
+    # A persistent query reuses the challenge of its player queries.
+    source_query = SourceQuery(host, port, persistent=True)
+    source_query.player()
+    num_requests = self.server.num_requests
+    self.assertEqual(5, source_query.info()['numplayers'])
+    self.assertEqual(num_requests + 1, self.server.num_requests)
+
+  def test_player(self):
+    host, port = self._start_server(num_players=5)
+    players = SourceQuery(host, port).player()
+    self.assertEqual(
+        [player.name for player in self.server.players],
+        [player['name'] for player in players])
+
+  def test_max_players(self):
+    self.assertRaises(
+        ValueError, FakeSourceServer, num_players=MAX_PLAYERS + 1)
+    host, port = self._start_server(num_players=MAX_PLAYERS)
+    source_query = SourceQuery(host, port)
+    self.assertEqual(MAX_PLAYERS, source_query.info()['numplayers'])
+    self.assertEqual(MAX_PLAYERS, len(source_query.player()))
+
+    # A player added after construction is not sent.
+    self.server.players.append(self.server.players[0])
+    self.assertEqual(MAX_PLAYERS, source_query.info()['numplayers'])
+    self.assertEqual(MAX_PLAYERS, len(source_query.player()))
+
+  def test_split_rules(self):
+    host, port = self._start_server(num_rules=200, split_size=500)
+    self.assertEqual(self.server.rules, SourceQuery(host, port).rules())
+
+  def test_compressed_split_rules(self):
+    host, port = self._start_server(num_rules=200, split_size=500, compress=True)
+    self.assertEqual(self.server.rules, SourceQuery(host, port).rules())
+
+  def test_persistent_challenge(self):
+    host, port = self._start_server(num_players=5)
+    source_query = SourceQuery(host, port, persistent=True)
+
+    # The first query must obtain a challenge.
+    self.assertEqual(5, len(source_query.player()))
+    self.assertEqual(2, self.server.num_requests)
+    # The next query reuses the challenge.
+    self.assertEqual(5, len(source_query.player()))
+    self.assertEqual(3, self.server.num_requests)
+    # The server rejects the challenge, so the query obtains another.
+    self.server.change_challenge()
+    self.assertEqual(5, len(source_query.player()))
+    self.assertEqual(5, self.server.num_requests)
+
+  def test_persistent_resolve(self):
+    host, port = self._start_server(num_players=5)
+    hosts = []
+    def gethostbyname(name):
+      hosts.append(name)
+      return gethostbyname_orig(name)
+    gethostbyname_orig = socket.gethostbyname
+    socket.gethostbyname = gethostbyname
+    self.addCleanup(setattr, socket, 'gethostbyname', gethostbyname_orig)
+
+    source_query = SourceQuery(host, port, persistent=True)
+    source_query.info()
+    udp = source_query.udp
+    source_query.player()
+    # The host is resolved once, and the socket stays open.
+    self.assertEqual([host], hosts)
+    self.assertIs(udp, source_query.udp)
+
+    # Without persistence, each query resolves the host again.
+    source_query = SourceQuery(host, port)
+    source_query.info()
+    source_query.info()
+    self.assertEqual([host] * 3, hosts)
+
+  def test_persistent_drain(self):
+    host, port = self._start_server(num_players=5)
+    source_query = SourceQuery(host, port, persistent=True)
+    self.assertEqual(5, len(source_query.player()))
+
+    # A stale reply that arrived after the last query is discarded, and is not
+    # read as the reply to the next query.
+    self.server._udp.sendto(
+        self.server._info_reply(), source_query.udp.getsockname())
+    time.sleep(0.05)
+    num_requests = self.server.num_requests
+    self.assertEqual(5, len(source_query.player()))
+    self.assertEqual(num_requests + 1, self.server.num_requests)
+
+  def test_hedge(self):
+    host, port = self._start_server(num_players=5)
+    source_query = SourceQuery(host, port, timeout=2.0, persistent=True, hedge=True)
+    for i in xrange(8):
+      source_query.player()
+    self.assertEqual(0, source_query.num_hedges)
+    self.assertLess(source_query.hedge_secs('player'), 0.5)
+
+    # The lost request is resent long before the timeout.
+    self.server.drop_requests = 1
+    before = time.time()
+    self.assertEqual(5, len(source_query.player()))
+    self.assertLess(time.time() - before, 1.0)
+    self.assertEqual(1, source_query.num_hedges)
+
+  def test_hedge_late_reply(self):
+    host, port = self._start_server(num_players=5)
+    for persistent in (False, True):
+      source_query = SourceQuery(host, port, timeout=1.0, persistent=persistent,
+          hedge=True)
+      # The reply to the challenge is late, not lost, so both copies of the
+      # request are answered.
+      self.server.delay_requests = 1
+      self.server.delay_secs = 0.65
+      self.assertEqual(5, len(source_query.player()))
+      self.assertEqual(1, source_query.num_hedges)
+      self.assertEqual(5, len(source_query.player()))
+
+  def test_retries(self):
+    host, port = self._start_server(num_players=5)
+    source_query = SourceQuery(host, port, timeout=0.1, retries=1)
+    self.server.drop_requests = 1
+    self.assertEqual(5, len(source_query.player()))
+    self.assertLess(source_query.backoff(1), 0.05)
+
+    self.server.drop_requests = 2
+    self.assertRaises(socket.timeout, source_query.info)
+
+    # The late reply to the first copy is not read as the reply to the next.
+    self.server.delay_requests = 1
+    self.server.delay_secs = 0.15
+    self.assertEqual(5, len(source_query.player()))
+
+  def test_circuit_breaker(self):
+    host, port = self._start_server(num_players=5)
+    source_query = SourceQuery(host, port, timeout=0.05,
+        circuit_breaker=CircuitBreaker(failure_threshold=2))
+    self.server.drop_requests = 2
+    self.assertRaises(socket.timeout, source_query.info)
+    self.assertRaises(socket.timeout, source_query.info)
+
+    # The dead server is no longer queried.
+    num_requests = self.server.num_requests
+    self.assertRaises(CircuitOpenError, source_query.info)
+    self.assertEqual(num_requests, self.server.num_requests)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,125 @@
+"""Ranks the players of many servers at once using NumPy.
+
+Monitor.rank_players ranks the players of one server with Python sorts and
+dicts. When ranking hundreds of servers per tick, rank_batch instead ranks all
+of them in one vectorized pass. The ranks are identical to those returned by
+Monitor.rank_players: players with equal values share the best rank of their
+group, and the next group's rank skips past them.
+
+The servers are packed into two-dimensional arrays, with one row per server and
+one column per player. Rows with fewer players are padded, and the padding is
+ignored by passing the number of players in each row.
+
+NumPy is an optional dependency, so importing this module succeeds without it,
+but calling its functions raises ImportError.
+"""
+
+try:
+  import numpy as np
+except ImportError:
+  np = None
+
+from monitor import Monitor
+
+
+def _require_numpy():
+  if np is None:
+    raise ImportError('batch_rank requires numpy')
+
+def _valid_mask(num_players, num_columns):
+  """Returns a mask of the columns of each row that contain a player."""
+  return np.arange(num_columns)[np.newaxis, :] < num_players[:, np.newaxis]
+
+def competition_ranks(values, num_players):
+  """Ranks the values of each row in descending order.
+
+  Parameter values is a two-dimensional array with a row for each server.
+  Parameter num_players is the number of players in each row.
+
+  Returns an integer array where the rank of each player starts at 1, and
+  where the rank of each padded column is 0.
+  """
+  _require_numpy()
+  values = np.asarray(values, dtype=np.float64)
+  num_players = np.asarray(num_players)
+  num_rows, num_columns = values.shape
+  valid = _valid_mask(num_players, num_columns)
+  if not num_columns:
+    return np.zeros(values.shape, dtype=np.int64)
+
+  # Sort each row in descending order, with padding sorted last.
+  masked_values = np.where(valid, values, -np.inf)
+  order = np.argsort(-masked_values, axis=1, kind='mergesort')
+  sorted_values = np.take_along_axis(masked_values, order, axis=1)
+
+  # Each player that differs from the preceding player starts a new group, whose
+  # rank is its position. All other players share the rank of their group.
+  starts_group = np.ones(values.shape, dtype=bool)
+  starts_group[:, 1:] = sorted_values[:, 1:] != sorted_values[:, :-1]
+  positions = np.arange(1, num_columns + 1, dtype=np.int64)[np.newaxis, :]
+  sorted_ranks = np.maximum.accumulate(
+      np.where(starts_group, positions, 0), axis=1)
+
+  # Return each rank to the column of its player.
+  ranks = np.empty_like(sorted_ranks)
+  np.put_along_axis(ranks, order, sorted_ranks, axis=1)
+  ranks[~valid] = 0
+  return ranks
+
+def rank_batch(new_kills, num_stddevs, num_players, stddev_weights):
+  """Returns the joint rank of each player on each server.
+
+  Parameter new_kills is a two-dimensional array of the new kills by each
+  player, with a row for each server.
+  Parameter num_stddevs is a two-dimensional array of the number of standard
+  deviations of the new kills by each player.
+  Parameter num_players is the number of players in each row.
+  Parameter stddev_weights is the weight for standard deviation of each server,
+  or a single weight for all servers, in [0, 100].
+
+  Returns an integer array of ranks as returned by competition_ranks.
+  """
+  _require_numpy()
+  num_players = np.asarray(num_players, dtype=np.int64)
+  stddev_weights = np.broadcast_to(
+      np.asarray(stddev_weights, dtype=np.int64), num_players.shape)
+
+  kill_ranks = competition_ranks(new_kills, num_players)
+  stddev_ranks = competition_ranks(num_stddevs, num_players)
+
+  # Weighting by 0 or by the maximum yields the ranks of the other attribute.
+  num_players_plus_one = (num_players + 1)[:, np.newaxis]
+  stddev_weights = stddev_weights[:, np.newaxis]
+  kill_weights = Monitor._MAX_STDDEV_WEIGHT - stddev_weights
+  weighted_totals = (kill_weights * (num_players_plus_one - kill_ranks) +
+      stddev_weights * (num_players_plus_one - stddev_ranks))
+  return competition_ranks(weighted_totals, num_players)
+
+def rank_player_kills_batch(all_player_kills, stddev_weights):
+  """Ranks the players of many servers.
+
+  Parameter all_player_kills is a sequence with a sequence of PlayerKill
+  instances for each server.
+  Parameter stddev_weights is the weight for standard deviation of each server,
+  or a single weight for all servers.
+
+  Returns a map from each player id to its rank for each server, like
+  Monitor.rank_players.
+  """
+  _require_numpy()
+  num_players = np.fromiter(
+      (len(player_kills) for player_kills in all_player_kills),
+      dtype=np.int64, count=len(all_player_kills))
+  num_columns = num_players.max() if len(num_players) else 0
+  new_kills = np.zeros((len(all_player_kills), num_columns))
+  num_stddevs = np.zeros((len(all_player_kills), num_columns))
+  for row, player_kills in enumerate(all_player_kills):
+    for column, player_kill in enumerate(player_kills):
+      new_kills[row, column] = player_kill.new_kills
+      num_stddevs[row, column] = player_kill.num_stddevs
+
+  ranks = rank_batch(new_kills, num_stddevs, num_players, stddev_weights)
+  return [
+      {player_kill.player_id: rank for player_kill, rank in zip(player_kills, row_ranks)}
+      for player_kills, row_ranks in zip(all_player_kills, ranks.tolist())
+  ]
@@ -0,0 +1,54 @@
+import random
+import unittest
+
+from batch_rank import *
+from monitor import Monitor, PlayerKills
+
+
+@unittest.skipIf(np is None, 'requires numpy')
+class BatchRankTest(unittest.TestCase):
+  """Test case for batch ranking."""
+
+  def test_competition_ranks(self):
+    values = [[150, 200, 150, 100], [3, 3, 0, 0]]
+    ranks = competition_ranks(values, [4, 2])
+    self.assertSequenceEqual([[2, 1, 2, 4], [1, 1, 0, 0]], ranks.tolist())
+
+  def test_competition_ranks_empty(self):
+    ranks = competition_ranks(np.zeros((2, 0)), [0, 0])
+    self.assertEqual((2, 0), ranks.shape)
+
+  def test_same_as_monitor(self):
+    rng = random.Random(0)
+    all_player_kills = []
+    for i in xrange(50):
+      num_players = rng.randint(0, 32)
+      all_player_kills.append([
+          PlayerKills('player_name%d' % j, rng.randint(0, 4),
+              rng.choice((0, 0.5, 1.0, 1.5, rng.random())))
+          for j in xrange(num_players)
+      ])
+
+    monitor = Monitor(None, -1, -1)
+    for stddev_weight in (0, 25, 50, 75, 100):
+      monitor.set_stddev_weight(stddev_weight)
+      expected_ranks = [monitor.rank_players(player_kills)
+          for player_kills in all_player_kills]
+      ranks = rank_player_kills_batch(all_player_kills, stddev_weight)
+      self.assertEqual(expected_ranks, ranks)
+
+  def test_stddev_weight_per_server(self):
+    player_kills = [
+        PlayerKills('player_name1', 3, 1),
+        PlayerKills('player_name2', 2, 2),
+        PlayerKills('player_name3', 1, 3)
+    ]
+    ranks = rank_player_kills_batch([player_kills, player_kills], [0, 100])
+    self.assertDictEqual(
+        {'player_name1': 1, 'player_name2': 2, 'player_name3': 3}, ranks[0])
+    self.assertDictEqual(
+        {'player_name1': 3, 'player_name2': 2, 'player_name3': 1}, ranks[1])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,213 @@
+"""A console entry point for running Monitor without a GUI.
+
+There are two subcommands:
+
+  * run polls a server and writes the best player to spectate to a file, and
+    optionally to a named pipe or Unix socket, until interrupted.
+  * query queries a server once, and prints its info, players or rules as JSON.
+
+Options of run may also be read from a JSON file given by --config, whose keys
+are the option names with underscores, such as poll_secs. Options given on the
+command line override the file.
+
+Only argparse is imported at startup. Each subcommand imports what it uses, so
+query does not import the ranking, scheduling or output modules, and neither
+subcommand imports Qt. Pass --timing to print the startup and run time.
+
+Run with: python cli.py run [options] HOST[:PORT]
+      or: python cli.py query HOST[:PORT] {info,player,rules}
+"""
+
+import argparse
+import sys
+import time
+
+_START_TIME = time.time()
+
+_DEFAULT_PORT = 27015
+
+
+def _parse_address(address):
+  """Returns the host and port of an address of the form host[:port]."""
+  host, sep, port = address.rpartition(':')
+  if not sep:
+    return address, _DEFAULT_PORT
+  try:
+    return host, int(port)
+  except ValueError:
+    raise argparse.ArgumentTypeError('Server must have the form host[:port]')
+
+def _decode(value):
+  """Returns the reply with each string decoded from UTF-8 for JSON."""
+  if isinstance(value, str):
+    return value.decode('utf-8', 'replace')
+  elif isinstance(value, dict):
+    return {_decode(key): _decode(item) for key, item in value.iteritems()}
+  elif isinstance(value, list):
+    return [_decode(item) for item in value]
+  return value
+
+def _write_timing(name, start_time):
+  sys.stderr.write('%s: %.1f msecs\n' % (name, 1000 * (time.time() - start_time)))
+
+
+def query(args):
+  """Queries the server once, and prints the reply as JSON."""
+  import json
+  from SourceQuery import SourceQuery
+
+  host, port = args.server
+  source_query = SourceQuery(host, port, timeout=args.timeout)
+  try:
+    reply = getattr(source_query, args.kind)()
+  finally:
+    source_query.disconnect()
+  if reply is None:
+    sys.stderr.write('No %s reply from %s:%d\n' % (args.kind, host, port))
+    return 1
+  json.dump(_decode(reply), sys.stdout, indent=2, sort_keys=True)
+  sys.stdout.write('\n')
+  return 0
+
+
+def _make_sinks(args):
+  from spec_output import FifoSink, FileSink, UnixSocketSink
+
+  sinks = []
+  if args.output:
+    sinks.append(FileSink(args.output))
+  if args.fifo:
+    sinks.append(FifoSink(args.fifo))
+  if args.socket:
+    sinks.append(UnixSocketSink(args.socket))
+  return sinks
+
+def _update(monitor, spec_output, scheduler, flush_job, quiet):
+  """Polls the server, and writes the best player to spectate."""
+  if monitor.update() is not None:
+    best_player = monitor.top_k(1)[0]
+    if not quiet:
+      sys.stdout.write('%.3f\t%s\n' % (time.time(), best_player.name))
+      sys.stdout.flush()
+    secs_until_flush = spec_output.set_player(best_player.name)
+    if secs_until_flush is not None:
+      scheduler.reschedule(flush_job, secs_until_flush)
+
+def run(args):
+  """Polls the server and writes the best player to spectate, until interrupted."""
+  from monitor import AdaptiveInterval, InfoGate, Monitor
+  from scheduler import Scheduler
+  from spec_output import SpecOutput
+
+  host, port = args.server
+  monitor = Monitor(host, port, args.poll_secs)
+  monitor.set_stddev_weight(args.stddev_weight)
+  if args.max_poll_secs:
+    monitor.set_adaptive_interval(AdaptiveInterval(args.poll_secs, args.max_poll_secs))
+  if args.info_gate:
+    monitor.set_info_gate(InfoGate())
+  if args.hedge or args.retries or args.circuit_breaker:
+    from SourceQuery import CircuitBreaker
+    monitor.set_query_options(hedge=args.hedge, retries=args.retries,
+        circuit_breaker=CircuitBreaker() if args.circuit_breaker else None)
+  if args.record:
+    from recording import PollRecorder, recording_path
+    monitor.set_recorder(PollRecorder(recording_path(args.record, host, port)))
+  if args.metrics_port is not None:
+    from metrics import start_http_server
+    start_http_server(args.metrics_port)
+
+  spec_output = SpecOutput(_make_sinks(args), min_dwell_secs=args.min_dwell_secs)
+  scheduler = Scheduler()
+  flush_job = scheduler.schedule(0, spec_output.flush, name='flush_spec')
+
+  scheduler.schedule(
+      0, lambda: _update(monitor, spec_output, scheduler, flush_job, args.quiet),
+      name='update_monitor', interval=monitor.next_interval_secs)
+  if args.timing:
+    _write_timing('startup', _START_TIME)
+  try:
+    while True:
+      time.sleep(max(0, scheduler.run_pending()))
+  except KeyboardInterrupt:
+    pass
+  finally:
+    spec_output.close()
+  return 0
+
+
+def _make_parser():
+  parser = argparse.ArgumentParser(description='Monitors Source servers without a GUI.')
+  parser.add_argument('--timing', action='store_true',
+      help='print the startup and run time to stderr')
+  subparsers = parser.add_subparsers(dest='command')
+
+  query_parser = subparsers.add_parser('query', help='query a server once as JSON')
+  query_parser.add_argument('--timeout', type=float, default=1.0)
+  query_parser.add_argument('server', type=_parse_address, help='host[:port]')
+  query_parser.add_argument('kind', choices=('info', 'player', 'rules'))
+  query_parser.set_defaults(func=query)
+
+  run_parser = subparsers.add_parser('run',
+      help='poll a server and write the player to spectate')
+  run_parser.add_argument('--config', help='a JSON file of options')
+  run_parser.add_argument('--poll-secs', type=float, default=20,
+      help='the seconds between polls, or the least if adaptive')
+  run_parser.add_argument('--max-poll-secs', type=float, default=None,
+      help='adapt the poll interval to activity, up to these seconds')
+  run_parser.add_argument('--info-gate', action='store_true',
+      help='skip querying players while the server info shows no activity')
+  run_parser.add_argument('--stddev-weight', type=int, default=50)
+  run_parser.add_argument('--hedge', action='store_true',
+      help='resend a query with no reply by the 95th percentile round trip time')
+  run_parser.add_argument('--retries', type=int, default=0,
+      help='retry a query that times out this many times, with backoff')
+  run_parser.add_argument('--circuit-breaker', action='store_true',
+      help='stop querying the server after consecutive failures, and probe it')
+  run_parser.add_argument('--output', help='the file to write the spec command to')
+  run_parser.add_argument('--fifo', help='a named pipe to push the spec command to')
+  run_parser.add_argument('--socket', help='a Unix socket to push the spec command to')
+  run_parser.add_argument('--min-dwell-secs', type=float, default=5.0,
+      help='the least seconds between changes of the spectated player')
+  run_parser.add_argument('--record', metavar='DIRECTORY',
+      help='record each poll in this directory')
+  run_parser.add_argument('--metrics-port', type=int, default=None,
+      help='serve metrics on this local port')
+  run_parser.add_argument('--quiet', action='store_true',
+      help='do not print the best player after each poll')
+  run_parser.add_argument('server', type=_parse_address, nargs='?', help='host[:port]')
+  run_parser.set_defaults(func=run)
+  return parser, run_parser
+
+def _load_config(run_parser, path):
+  """Sets the defaults of the run options from a JSON file."""
+  import json
+
+  with open(path) as f:
+    config = json.load(f)
+  if 'server' in config:
+    config['server'] = _parse_address(config['server'])
+  run_parser.set_defaults(**config)
+
+
+def main(argv=None):
+  parser, run_parser = _make_parser()
+  args = parser.parse_args(argv)
+  if args.command == 'run':
+    if args.config:
+      _load_config(run_parser, args.config)
+      args = parser.parse_args(argv)
+    if args.server is None:
+      parser.error('run requires a server')
+    if not (args.output or args.fifo or args.socket):
+      parser.error('run requires --output, --fifo or --socket')
+
+  start_time = time.time()
+  status = args.func(args)
+  if args.timing:
+    _write_timing(args.command, start_time)
+  return status
+
+
+if __name__ == '__main__':
+  sys.exit(main())
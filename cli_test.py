@@ -0,0 +1,72 @@
+import json
+import os
+import shutil
+import StringIO
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import cli
+from cli import *
+from fake_server import FakeSourceServer
+
+
+class CliTest(unittest.TestCase):
+  """Test case for the console entry point."""
+
+  def setUp(self):
+    self.server = FakeSourceServer(num_players=4)
+    self.server.start()
+    self.addCleanup(self.server.stop)
+    self.address = '%s:%d' % self.server.address
+
+  def _main(self, argv):
+    stdout = sys.stdout
+    sys.stdout = StringIO.StringIO()
+    try:
+      status = main(argv)
+      return status, sys.stdout.getvalue()
+    finally:
+      sys.stdout = stdout
+
+  def test_query(self):
+    status, output = self._main(['query', self.address, 'player'])
+    self.assertEqual(0, status)
+    players = json.loads(output)
+    self.assertEqual([player.name for player in self.server.players],
+        [player['name'] for player in players])
+
+    status, output = self._main(['query', self.address, 'info'])
+    self.assertEqual(self.server.map, json.loads(output)['map'])
+
+  def test_query_imports(self):
+    # A query imports neither Qt nor the modules used only by run.
+    code = ('import sys, cli; cli.main(["query", "%s", "info"]); '
+        'sys.stderr.write(" ".join(sorted(sys.modules)))' % self.address)
+    process = subprocess.Popen([sys.executable, '-c', code],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        cwd=os.path.dirname(os.path.abspath(__file__)))
+    output, modules = process.communicate()
+    self.assertEqual(0, process.returncode)
+    modules = modules.split()
+    for module in ('PyQt5', 'monitor', 'spec_output', 'BaseHTTPServer'):
+      self.assertNotIn(module, modules)
+
+  def test_config(self):
+    directory = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, directory)
+    path = os.path.join(directory, 'config.json')
+    with open(path, 'w') as f:
+      json.dump({'server': 'example.com', 'poll_secs': 5, 'output': 'spec.cfg'}, f)
+
+    parser, run_parser = cli._make_parser()
+    cli._load_config(run_parser, path)
+    args = parser.parse_args(['run', '--poll-secs', '10'])
+    self.assertEqual(('example.com', 27015), args.server)
+    self.assertEqual(10, args.poll_secs)
+    self.assertEqual('spec.cfg', args.output)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,9 @@
+"""The clock that measures intervals and timeouts.
+
+Python 2 has no monotonic clock, so monotonic falls back to the wall clock.
+"""
+
+import time
+
+
+monotonic = getattr(time, 'monotonic', time.time)
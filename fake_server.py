@@ -0,0 +1,265 @@
+"""A local fake Source server for tests and benchmarks.
+
+FakeSourceServer answers A2S_INFO, A2S_PLAYER and A2S_RULES queries over UDP.
+Player and rules queries require a challenge, and replies larger than the split
+size are sent as split packets, optionally compressed with bzip2. Its synthetic
+players gain kills over time at different rates, so that a Monitor polling it
+ranks them.
+
+Run standalone with: python fake_server.py [--port PORT] [--players N]
+"""
+
+import argparse
+import bz2
+import random
+import socket
+import struct
+import threading
+import time
+import zlib
+
+import SourceQuery
+from SourceQuery import SourceQueryPacket, SourceQueryReader
+
+
+# The most players that a reply can count in its single byte.
+MAX_PLAYERS = 255
+
+class FakePlayer(object):
+  """A synthetic player that gains kills at a given rate."""
+
+  def __init__(self, index, name, kills_per_sec, connect_time):
+    self.index = index
+    self.name = name
+    self.kills_per_sec = kills_per_sec
+    self.connect_time = connect_time
+    self.kills = 0
+
+
+class FakeSourceServer(object):
+  """A fake Source server on localhost.
+
+  Parameter num_players is the number of synthetic players, up to MAX_PLAYERS.
+  Parameter split_size is the largest payload of a packet, so that larger
+  replies are split.
+  Parameter compress specifies whether split replies are compressed.
+  Parameter seed seeds the kill rates of the players and their kills.
+  """
+
+  def __init__(self, host='127.0.0.1', port=0, num_players=24, split_size=1248,
+      compress=False, num_rules=100, seed=0):
+    if not 0 <= num_players <= MAX_PLAYERS:
+      raise ValueError('num_players must be from 0 to %d' % MAX_PLAYERS)
+    self._random = random.Random(seed)
+    self._split_size = split_size
+    self._compress = compress
+    self._challenge = self._random.randint(1, 0x7fffffff)
+    self._next_reqid = 1
+    self.map = 'cp_badlands'
+
+    now = time.time()
+    self.players = [
+        FakePlayer(i, 'player_name%d' % i, self._random.uniform(0.01, 0.5), now)
+        for i in xrange(num_players)
+    ]
+    self._last_kills_time = now
+    self.rules = dict(('rule%d' % i, str(i)) for i in xrange(num_rules))
+
+    self.num_requests = 0
+    # The number of next requests to ignore, as if they were lost.
+    self.drop_requests = 0
+    # The number of next requests to answer late, and by how many seconds. A
+    # late reply delays the replies to later requests, as on a stalled server.
+    self.delay_requests = 0
+    self.delay_secs = 0.0
+    # Whether A2S_INFO requires a challenge, as on current servers.
+    self.challenge_info = False
+    self._udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    self._udp.bind((host, port))
+    self._udp.settimeout(0.1)
+    self._thread = None
+    self._running = False
+
+  @property
+  def address(self):
+    return self._udp.getsockname()
+
+  def start(self):
+    """Starts answering queries on a daemon thread."""
+    self._running = True
+    self._thread = threading.Thread(target=self.serve_forever)
+    self._thread.daemon = True
+    self._thread.start()
+
+  def stop(self):
+    """Stops answering queries and closes the socket."""
+    self._running = False
+    if self._thread:
+      self._thread.join()
+      self._thread = None
+    self._udp.close()
+
+  def change_challenge(self):
+    """Changes the challenge number, so that clients must challenge again."""
+    self._challenge = self._random.randint(1, 0x7fffffff)
+
+  def _update_kills(self):
+    """Gives each player the kills since the last update at its rate."""
+    now = time.time()
+    elapsed = now - self._last_kills_time
+    self._last_kills_time = now
+    for player in self.players:
+      expected_kills = player.kills_per_sec * elapsed
+      new_kills = int(expected_kills)
+      if self._random.random() < expected_kills - new_kills:
+        new_kills += 1
+      player.kills += new_kills
+
+  def _info_reply(self):
+    packet = SourceQueryPacket()
+    packet.putLong(SourceQuery.WHOLE)
+    packet.putByte(SourceQuery.A2S_INFO_REPLY)
+    packet.putByte(17)
+    packet.putString('Fake Source Server')
+    packet.putString(self.map)
+    packet.putString('tf')
+    packet.putString('Team Fortress')
+    packet.putShort(440)
+    packet.putByte(min(len(self.players), MAX_PLAYERS))
+    packet.putByte(32)
+    packet.putByte(0)
+    packet.putByte(ord('d'))
+    packet.putByte(ord('l'))
+    packet.putByte(0)
+    packet.putByte(1)
+    packet.putString('1.0.0.0')
+    return packet.getvalue()
+
+  def _player_reply(self):
+    self._update_kills()
+    now = time.time()
+    packet = SourceQueryPacket()
+    packet.putLong(SourceQuery.WHOLE)
+    packet.putByte(SourceQuery.A2S_PLAYER_REPLY)
+    # Players added to the list after construction are clamped, too.
+    players = self.players[:MAX_PLAYERS]
+    packet.putByte(len(players))
+    for player in players:
+      packet.putByte(player.index)
+      packet.putString(player.name)
+      packet.putLong(player.kills)
+      packet.putFloat(now - player.connect_time)
+    return packet.getvalue()
+
+  def _rules_reply(self):
+    packet = SourceQueryPacket()
+    packet.putLong(SourceQuery.WHOLE)
+    packet.putByte(SourceQuery.A2S_RULES_REPLY)
+    packet.putShort(len(self.rules))
+    for key, value in sorted(self.rules.iteritems()):
+      packet.putString(key)
+      packet.putString(value)
+    return packet.getvalue()
+
+  def _challenge_reply(self):
+    return struct.pack(
+        '<lBl', SourceQuery.WHOLE, SourceQuery.S2C_CHALLENGE, self._challenge)
+
+  def _split(self, data):
+    """Returns the packets to send for the given reply."""
+    if len(data) <= self._split_size:
+      return [data]
+
+    reqid = self._next_reqid
+    self._next_reqid = (self._next_reqid + 1) & 0x7fffffff
+    if self._compress:
+      reqid |= SourceQuery.COMPRESSED
+      data = (struct.pack('<lL', len(data), zlib.crc32(data) & 0xffffffff) +
+          bz2.compress(data))
+    reqid = struct.unpack('<l', struct.pack('<L', reqid))[0]
+
+    fragments = [data[i:i + self._split_size]
+        for i in xrange(0, len(data), self._split_size)]
+    return [
+        struct.pack('<llBBh', SourceQuery.SPLIT, reqid, len(fragments), num,
+            self._split_size) + fragment
+        for num, fragment in enumerate(fragments)
+    ]
+
+  def _reply(self, data):
+    """Returns the reply to the given request, or None to ignore it."""
+    packet = SourceQueryReader(data)
+    if packet.getLong() != SourceQuery.WHOLE:
+      return None
+    request_type = packet.getByte()
+    if request_type == SourceQuery.A2S_INFO:
+      if self.challenge_info:
+        packet.getString()
+        try:
+          challenge = packet.getLong()
+        except struct.error:
+          challenge = None
+        if challenge != self._challenge:
+          return self._challenge_reply()
+      return self._info_reply()
+
+    if packet.getLong() != self._challenge:
+      return self._challenge_reply()
+    elif request_type == SourceQuery.A2S_PLAYER:
+      return self._player_reply()
+    elif request_type == SourceQuery.A2S_RULES:
+      return self._rules_reply()
+    return None
+
+  def handle_request(self, data, address):
+    """Sends the reply to a request received from the given address."""
+    self.num_requests += 1
+    if self.drop_requests:
+      self.drop_requests -= 1
+      return
+    try:
+      reply = self._reply(data)
+    except (struct.error, ValueError):
+      return
+    if reply is None:
+      return
+    if self.delay_requests:
+      self.delay_requests -= 1
+      time.sleep(self.delay_secs)
+    for packet in self._split(reply):
+      self._udp.sendto(packet, address)
+
+  def serve_forever(self):
+    """Answers queries until stopped."""
+    while self._running:
+      try:
+        data, address = self._udp.recvfrom(SourceQuery.PACKETSIZE)
+      except socket.timeout:
+        continue
+      except socket.error:
+        if not self._running:
+          break
+        continue
+      self.handle_request(data, address)
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Runs a fake Source server.')
+  parser.add_argument('--port', type=int, default=27015)
+  parser.add_argument('--players', type=int, default=24)
+  parser.add_argument('--compress', action='store_true')
+  args = parser.parse_args()
+
+  server = FakeSourceServer(
+      port=args.port, num_players=args.players, compress=args.compress)
+  print 'Serving on %s:%d' % server.address
+  server.start()
+  try:
+    while True:
+      time.sleep(1)
+  except KeyboardInterrupt:
+    pass
+  server.stop()
+
+if __name__ == '__main__':
+  main()
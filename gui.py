@@ -1,7 +1,20 @@
+import os
 import sys
-from PyQt5.QtWidgets import QApplication, QInputDialog, QMainWindow
-from collections import deque
+from PyQt5.QtCore import (QAbstractTableModel, QModelIndex, QObject,
+        QSortFilterProxyModel, Qt, pyqtSignal)
+from PyQt5.QtGui import QBrush, QColor
+from PyQt5.QtWidgets import (QApplication, QErrorMessage, QFileDialog,
+        QHBoxLayout, QLabel, QLineEdit, QMainWindow, QPushButton,
+        QSlider, QTableView, QVBoxLayout, QWidget)
+from collections import deque, namedtuple
 from datetime import datetime, timedelta
+from operator import attrgetter
+
+from monitor import Monitor
+from player_table import COLUMNS, RANK_COLUMNS, PlayerTable, rank_text
+from poll_worker import PollWorker
+from scheduler import Scheduler
+from spec_output import FileSink, SpecOutput
 
 
 def _make_hbox(*widgets):
@@ -13,24 +26,27 @@ def _make_hbox(*widgets):
 
 def _show_error_message(parent, error_message):
     """Displays a QErrorMessage with the given error message."""
-    error_message = QErrorMessage(parent)
-    error_message.ShowMessage(error_message)
+    QErrorMessage(parent).showMessage(error_message)
 
 
-class ConnectDialog(QtGui.QWidget):
+class ConnectDialog(QWidget):
     """The server connection dialog upon startup."""
 
     def __init__(self):
         super(ConnectDialog, self).__init__()
 
         self._output_filename = None
+        self._server_monitor = None
         self._show_ui()
 
     def _show_file_dialog(self):
-        self._output_filename = QFileDialog.getOpenFileName(self, 'Choose output file')
+        # The output file is written, so it need not exist yet.
+        filename, _ = QFileDialog.getSaveFileName(self, 'Choose output file')
+        if filename:
+            self._output_edit.setText(filename)
 
     def _show_ui(self):
-        vbox = QtGui.QVBoxLayout()
+        vbox = QVBoxLayout()
 
         # Add the server text field.
         server_label = QLabel('Server')
@@ -45,15 +61,20 @@ class ConnectDialog(QtGui.QWidget):
         vbox.addLayout(_make_hbox(poll_label, self._poll_slider))
 
         # Add the output file chooser.
-        output_label = QLabel('Ouptut')
+        output_label = QLabel('Output')
         self._output_edit = QLineEdit()
-        vbox.addLayout(_make_hbox(output_label, self._output_edit))
+        self._output_button = QPushButton("Choose...")
+        self._output_button.clicked.connect(self._show_file_dialog)
+        vbox.addLayout(_make_hbox(
+                output_label, self._output_edit, self._output_button))
 
         vbox.addStretch(1)
 
         # Add the Connect and Quit buttons.
-        self._connect_button = QtGui.QPushButton("Connect")
-        self._quit_button = QtGui.QPushButton("Quit")
+        self._connect_button = QPushButton("Connect")
+        self._quit_button = QPushButton("Quit")
+        self._connect_button.clicked.connect(self._validate)
+        self._quit_button.clicked.connect(self.close)
         hbox = QHBoxLayout()
         hbox.addStretch(1)
         hbox.addWidget(self._connect_button)
@@ -66,10 +87,10 @@ class ConnectDialog(QtGui.QWidget):
         self.setWindowTitle('Connect to Server')
         self.show()
 
-    def _validate():
+    def _validate(self):
         # Validate the server address.
-        server_parts = server_label.text().strip().split(':')
-        if len(parts) != 2:
+        server_parts = self._server_edit.text().strip().split(':')
+        if len(server_parts) != 2 or not server_parts[1].isdigit():
             _show_error_message(self, "Server must have form [address]:[port]")
             return
         server_address, server_port = server_parts
@@ -77,6 +98,7 @@ class ConnectDialog(QtGui.QWidget):
         poll_length = self._poll_slider.value()
 
         # Validate the output filename.
+        self._output_filename = self._output_edit.text().strip() or None
         if self._output_filename == None:
             _show_error_message(self, "Must choose an output file")
             return
@@ -84,178 +106,272 @@ class ConnectDialog(QtGui.QWidget):
             _show_error_message(self, "Cannot choose a directory")
             return
 
-        # TODO: Move on.
-
-
-class PlayerRow:
-    def _empty_label(self):
-        return QLabel("-")
-
-    def __init__(self, player_name):
-        self._player_name = player_name
-        self._use_checkbox = QCheckBox(self._player_name)
-
-        # Labels for the statistics.
-        self._total_label = self._empty_label()
-        self._avg_label = self._empty_label()
-        self._stddev_label = self._empty_label()
-        self._new_label = self._empty_label()
-
-        # Labels for the player ranks.
-        self._new_rank_label = self._empty_label()
-        self._stddev_rank_label = self._empty_label()
-        self._combined_rank_label = self._empty_label()
-
-    def update_stats(self, stats):
-        """Updates the statistics for this player."""
-        self._total_label.setText(stats.total())
-        self._avg_label.setText(stats.avg())
-        self._stddev_label.setText(stats.std_dev())
-        self._new_label.setText(stats.new())
-
-    def _get_rank_text(self, rank):
-        # Create text.
-        if rank == 1:
-            text = "1<sup>st</sup>"
-        elif rank == 2:
-            text = "2<sup>nd</sup>"
-        elif rank == 3:
-            text = "3<sup>rd</sup>"
+        self._server_monitor = ServerMonitor(
+                (server_address, int(server_port)), poll_length,
+                self._output_filename)
+        self._server_monitor.show()
+        self.close()
+
+
+class PlayerTableModel(QAbstractTableModel):
+    """The statistics and ranks of each player, for a QTableView.
+
+    Each poll is applied as one diff of a PlayerTable, which removes and inserts
+    only the rows of disconnected and new players, and emits dataChanged only
+    for the ranges of cells that changed. A QSortFilterProxyModel sorts the rows
+    by SORT_ROLE, without changing this model.
+    """
+
+    # The role of the value that a column is sorted by.
+    SORT_ROLE = Qt.UserRole
+
+    _HEADERS = ('Player', 'Total', 'Avg', 'Stddev', 'New', 'New rank',
+            'Stddev rank', 'Combined rank')
+    _BEST_RANK_BRUSH = QBrush(QColor('green'))
+
+    def __init__(self, parent=None):
+        super(PlayerTableModel, self).__init__(parent)
+        self._table = PlayerTable()
+        # The names of the players not to spectate.
+        self._unused_names = set()
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._table)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return PlayerTableModel._HEADERS[section]
+        return None
+
+    def flags(self, index):
+        flags = Qt.ItemIsEnabled | Qt.ItemIsSelectable
+        if index.column() == 0:
+            flags |= Qt.ItemIsUserCheckable
+        return flags
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        player = self._table.rows[index.row()]
+        column = COLUMNS[index.column()]
+        value = player[index.column()]
+        if role == Qt.DisplayRole:
+            if column in RANK_COLUMNS:
+                return rank_text(value)
+            elif value is None:
+                return '-'
+            elif isinstance(value, float):
+                return '%.2f' % value
+            return value
+        elif role == PlayerTableModel.SORT_ROLE:
+            return value
+        elif role == Qt.ForegroundRole:
+            if column in RANK_COLUMNS and value == 1:
+                return PlayerTableModel._BEST_RANK_BRUSH
+        elif role == Qt.CheckStateRole and index.column() == 0:
+            return Qt.Unchecked if player.name in self._unused_names else Qt.Checked
+        return None
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if role != Qt.CheckStateRole or index.column() != 0:
+            return False
+        name = self._table.rows[index.row()].name
+        if value == Qt.Checked:
+            self._unused_names.discard(name)
         else:
-            text = "%s<sup>th</sup>" % rank
-        # Color text.
-        if rank == 1:
-            text = "<font color=\"green\">%s</font>" % text
-
-        return text
-
-    def update_poll(self, new_rank, stddev_rank, combined_rank):
-        """Updates the ranks for this player."""
-        self._new_rank_label.setText(self._get_rank_text(new_rank))
-        self._stddev_rank_label.setText(self._get_rank_text(stddev_rank))
-        self._combined_rank_label.setText(self._get_rank_text(combined_rank))
-
-    def add_to_row(self, row, grid):
-        """Adds this player to the given grid at the given row."""
-        for column, widget in enumerate((
-                self._use_checkbox,
-                self._total_label,
-                self._avg_label,
-                self._stddev_label,
-                self._new_label,
-                self._new_rank_label,
-                self._stddev_rank_label,
-                self._combined_rank_label)):
-            grid.addWidget(widget, row, column)
+            self._unused_names.add(name)
+        self.dataChanged.emit(index, index, [Qt.CheckStateRole])
+        return True
+
+    def is_used(self, name):
+        """Returns whether the player with the given name may be spectated."""
+        return name not in self._unused_names
+
+    def update_players(self, players):
+        """Updates the table to the given sequence of PlayerStats instances."""
+        diff = self._table.diff(players)
+        for first_row, last_row in diff.removed_ranges:
+            self.beginRemoveRows(QModelIndex(), first_row, last_row)
+            self._table.remove_rows(first_row, last_row)
+            self.endRemoveRows()
+        if diff.inserted:
+            num_rows = len(self._table)
+            self.beginInsertRows(
+                    QModelIndex(), num_rows, num_rows + len(diff.inserted) - 1)
+            self._table.append_rows(diff.inserted)
+            self.endInsertRows()
+        for cell_range in self._table.replace_rows(diff.changed):
+            self.dataChanged.emit(
+                    self.index(cell_range.first_row, cell_range.first_column),
+                    self.index(cell_range.last_row, cell_range.last_column))
+        # Forget unchecked players who disconnected.
+        self._unused_names.intersection_update(
+                player.name for player in self._table.rows)
+
+
+class SnapshotNotifier(QObject):
+    """Signals the UI thread that the poll worker has a new snapshot."""
+
+    snapshot_ready = pyqtSignal()
 
 
 ObservedPlayer = namedtuple('ObservedPlayer', ['name', 'deque_time'])
 
 class ServerMonitor(QMainWindow):
-    # Enum value for updating the Monitor instance.
-    _UPDATE_MONITOR = 'update_monitor'
-    # Enum value for updating the file containing the best player to spectate.
-    _UPDATE_SPEC = 'update_spec'
+    # Seconds after its time to spectate that a queued player is discarded.
+    _STALE_OBS_PLAYER_SECS = 30
 
-    def __init__(self, server_address):
+    def __init__(self, server_address, poll_secs, output_filename):
         super(ServerMonitor, self).__init__()
 
         self._server_address = server_address
+        self._poll_secs = poll_secs
+        self._output_filename = output_filename
         self._show_ui()
 
         self._obs_player_queue = deque()
-        self._next_update_monitor_time = None
-        self._next_update_spec_time = None
-        self._next_update_timer = None
-
-    def _get_next_action(self):
-        """Returns the next action that the update thread should perform."""
-        if self._next_update_monitor_time and self._next_update_spec_time:
-            # Return the time that is closer in the future.
-            if self._next_update_monitor_time < self._next_update_spec_time:
-                return ServerMonitor._UPDATE_MONITOR
-            else:
-                return ServerMonitor._UPDATE_SPEC
-        elif self._next_update_monitor_time:
-            return ServerMonitor._UPDATE_MONITOR
-        elif self._next_update_spec_time:
-            return ServerMonitor._UPDATE_SPEC
-        else:
-            return None
-
-    def _get_seconds_until_next_action(self, action, now=None):
-        """Returns the time in seconds until running the given action.
-
-        This method returns None if there is no action."""
-        if not action:
-            return None
-
+        self._spec_output = SpecOutput([FileSink(self._output_filename)])
+        # The monitor and its socket are only used on the poll worker thread,
+        # which emits the signal after each ranking. The queued connection runs
+        # the slot on the UI thread, so the UI never waits for the server.
+        self._notifier = SnapshotNotifier(self)
+        self._notifier.snapshot_ready.connect(
+                self._show_snapshot, Qt.QueuedConnection)
+        host, port = server_address
+        monitor = Monitor(host, port, poll_secs)
+        monitor.set_stddev_weight(self._weight_slider.value())
+        self._poll_worker = PollWorker(monitor, self._notifier.snapshot_ready.emit)
+        self._weight_slider.valueChanged.connect(
+                self._poll_worker.set_stddev_weight)
+        # All other timed jobs run on the scheduler thread.
+        self._scheduler = Scheduler()
+        self._update_spec_job = None
+        self._flush_spec_job = None
+        self._evict_job = self._scheduler.schedule(
+                ServerMonitor._STALE_OBS_PLAYER_SECS, self._evict_stale_obs_players,
+                name='evict_stale_obs_players',
+                interval=ServerMonitor._STALE_OBS_PLAYER_SECS)
+        self._scheduler.start()
+        self._poll_worker.start()
+
+    def closeEvent(self, event):
+        self._poll_worker.stop()
+        self._scheduler.stop()
+        self._spec_output.close()
+        super(ServerMonitor, self).closeEvent(event)
+
+    def _seconds_until(self, deque_time, now=None):
+        """Returns the time in seconds until the given time."""
         if now is None:
             now = datetime.utcnow()
-        if action == ServerMonitor._UPDATE_MONITOR:
-            # Return the time until we should update the monitor.
-            return (self._next_update_monitor_time - now).total_seconds()
-        elif action == ServerMonitor._UPDATE_SPEC:
-            # Return the time until we should update the best spectator.
-            return (self._next_update_spec_time - now).total_seconds()
-        else:
-            raise ValueError('Invalid action: %s' % action)
+        return (deque_time - now).total_seconds()
+
+    def _schedule_update_spec(self):
+        """Schedules writing the player at the head of the queue to the file."""
+        if not self._obs_player_queue:
+            if self._update_spec_job:
+                self._scheduler.cancel(self._update_spec_job)
+            return
 
-    def _schedule_next_update_timer(self, seconds_until):
-        self._next_update_timer = Timer(seconds_until, self._update)
+        seconds_until = self._seconds_until(self._obs_player_queue[0].deque_time)
+        if self._update_spec_job:
+            self._scheduler.reschedule(self._update_spec_job, seconds_until)
+        else:
+            self._update_spec_job = self._scheduler.schedule(
+                    seconds_until, self._update_spec_file, name='update_spec')
 
     def _update_spec_file(self):
-        """Writes the best player to spectate to the file."""
+        """Writes the best player to spectate to the file.
+
+        Returns the time in seconds until the next player should be written, or
+        None if the queue is empty."""
         if not self._obs_player_queue:
-            return
+            return None
 
-        # Write the player name to the file.
+        # Write the player name to the file, or once the dwell time passes.
         obs_player = self._obs_player_queue.popleft()
-        with open(self._output_filename, 'w') as f:
-            f.write('spec_player "%s"' % player_name)
-        # Update the next time at which this method should be run.
+        secs_until_flush = self._spec_output.set_player(obs_player.name)
+        if secs_until_flush is not None:
+            if self._flush_spec_job:
+                self._scheduler.reschedule(self._flush_spec_job, secs_until_flush)
+            else:
+                self._flush_spec_job = self._scheduler.schedule(
+                        secs_until_flush, self._spec_output.flush, name='flush_spec')
+        # Return when this method should next be run.
         if self._obs_player_queue:
-            self._next_update_spec_time = self._obs_player_queue[0].deque_time
+            return self._seconds_until(self._obs_player_queue[0].deque_time)
         else:
-            self._next_update_spec_time = None
-
-    def _update(self):
-        """The method that the update thread executes."""
-        while True:
-            next_action = self._get_next_action()
-            if not next_action:
-                # No next action to execute, so exit.
-                break
-            seconds_until_next_action = self._get_time_until_next_action()
-            if seconds_until_next_action > 0:
-                # Run this action at the given time in the future.
-                self._schedule_next_update_timer(seconds_until_next_action)
-                break
-
-            # Run the next action now.
-            if next_action == ServerMontior._UPDATE_MONITOR:
-                # TODO
-                pass
-            elif next_action == ServerMonitor._UPDATE_SPEC:
-                self._update_spec_file()
+            return None
+
+    def _evict_stale_obs_players(self):
+        """Discards queued players whose time to spectate has long passed."""
+        now = datetime.utcnow()
+        stale_time = now - timedelta(seconds=ServerMonitor._STALE_OBS_PLAYER_SECS)
+        evicted = False
+        while self._obs_player_queue and self._obs_player_queue[0].deque_time < stale_time:
+            self._obs_player_queue.popleft()
+            evicted = True
+        if evicted:
+            self._schedule_update_spec()
+
+    def _show_snapshot(self):
+        """Shows the newest snapshot of the poll worker, on the UI thread."""
+        snapshot = self._poll_worker.snapshots.take()
+        if snapshot is None:
+            # A later signal replaced this snapshot, and was already handled.
+            return
+        self._show_players(snapshot.players)
+        self._queue_best_player(snapshot.players)
+
+    def _queue_best_player(self, players):
+        """Queues the best ranked player that may be spectated, to spectate now.
+
+        Parameter players is a sequence of PlayerStats instances."""
+        used_players = [player for player in players
+                if self._player_model.is_used(player.name)]
+        if not used_players:
+            return
+        best_player = min(used_players, key=attrgetter('combined_rank'))
+        self._obs_player_queue.append(
+                ObservedPlayer(best_player.name, datetime.utcnow()))
+        self._schedule_update_spec()
 
     def _show_ui(self):
         self._weight_slider = QSlider()
         self._weight_slider.setRange(0, 100)
         self._weight_slider.setTickInterval(25)
-
-    def _populate_grid(self):
-        self._grid = QGridLayout()
-        self.setLayout(grid)
+        self._populate_table()
+
+    def _populate_table(self):
+        self._player_model = PlayerTableModel(self)
+        self._player_proxy_model = QSortFilterProxyModel(self)
+        self._player_proxy_model.setSourceModel(self._player_model)
+        self._player_proxy_model.setSortRole(PlayerTableModel.SORT_ROLE)
+        # Sorting by a column reorders only the proxy, not the rows of the model.
+        self._player_proxy_model.setDynamicSortFilter(True)
+        self._player_view = QTableView(self)
+        self._player_view.setModel(self._player_proxy_model)
+        self._player_view.setSortingEnabled(True)
+        self._player_view.sortByColumn(
+                COLUMNS.index('combined_rank'), Qt.AscendingOrder)
+        self.setCentralWidget(self._player_view)
+
+    def _show_players(self, players):
+        """Shows the given sequence of PlayerStats instances in the table."""
+        self._player_model.update_players(players)
 
 
 def main():
     app = QApplication(sys.argv)
-    server_address, success = QInputDialog.getText(
-            None, 'Connect to server', 'Enter server address:')
-    if success:
-        print 'server_address=%s' % server_address
-
+    # The dialog opens a ServerMonitor once the user connects.
+    connect_dialog = ConnectDialog()
     sys.exit(app.exec_())
 
 if __name__ == '__main__':
@@ -0,0 +1,92 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from fake_server import FakeSourceServer
+from monitor import PlayerStats
+from poll_worker import PollSnapshot
+
+try:
+  from PyQt5.QtWidgets import QApplication
+except ImportError:
+  QApplication = None
+
+
+@unittest.skipIf(QApplication is None, 'PyQt5 is not installed')
+class GuiTest(unittest.TestCase):
+  """Test case for the widgets of the GUI, without a display."""
+
+  @classmethod
+  def setUpClass(cls):
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    cls.app = QApplication.instance() or QApplication([])
+
+  def setUp(self):
+    self.server = FakeSourceServer(num_players=4)
+    self.server.start()
+    self.addCleanup(self.server.stop)
+    directory = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, directory)
+    self.output_filename = os.path.join(directory, 'spec.cfg')
+
+  def test_import(self):
+    import gui
+    self.assertTrue(issubclass(gui.ServerMonitor, gui.QMainWindow))
+
+  def test_connect_dialog(self):
+    import gui
+    dialog = gui.ConnectDialog()
+    self.addCleanup(dialog.close)
+    # The server address has no port.
+    dialog._server_edit.setText('127.0.0.1')
+    dialog._output_edit.setText(self.output_filename)
+    dialog._connect_button.click()
+    self.assertIsNone(dialog._server_monitor)
+
+    dialog._server_edit.setText('%s:%d' % self.server.address)
+    dialog._connect_button.click()
+    server_monitor = dialog._server_monitor
+    self.addCleanup(server_monitor.close)
+    self.assertEqual(self.server.address, server_monitor._server_address)
+    self.assertEqual(self.output_filename, server_monitor._output_filename)
+
+  def test_polls_server(self):
+    import gui
+    num_requests = self.server.num_requests
+    server_monitor = gui.ServerMonitor(
+        self.server.address, 5, self.output_filename)
+    self.addCleanup(server_monitor.close)
+    # The first poll starts as soon as the monitor is shown.
+    deadline = time.time() + 2
+    while (self.server.num_requests == num_requests and
+        time.time() < deadline):
+      time.sleep(0.01)
+    self.assertGreater(self.server.num_requests, num_requests)
+
+  def test_show_snapshot(self):
+    import gui
+    server_monitor = gui.ServerMonitor(
+        self.server.address, 5, self.output_filename)
+    self.addCleanup(server_monitor.close)
+    # Only this snapshot is shown.
+    server_monitor._poll_worker.stop()
+
+    players = (
+        PlayerStats('player_name1', 10, 2.0, 1.0, 4, 2, 2, 2),
+        PlayerStats('player_name2', 20, 2.0, 1.0, 6, 1, 1, 1))
+    server_monitor._poll_worker.snapshots.put(
+        PollSnapshot(1, time.time(), players))
+    server_monitor._show_snapshot()
+    # The best player is written to the spec file on the scheduler thread.
+    deadline = time.time() + 2
+    while (not os.path.exists(self.output_filename) and
+        time.time() < deadline):
+      time.sleep(0.01)
+    with open(self.output_filename) as f:
+      self.assertEqual('spec_player "player_name2"', f.read().strip())
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,308 @@
+"""Counters, gauges and histograms, exported in the Prometheus text format.
+
+Each metric is created by a Registry, and may have labels. A metric with labels
+has a child for each combination of label values, which is returned by its
+labels method. A metric without labels is updated directly. For example:
+
+  QUERIES = REGISTRY.counter('queries_total', 'Queries sent.', ['type'])
+  QUERIES.labels('player').inc()
+
+The module-level REGISTRY holds the metrics of SourceQuery and Monitor.
+start_http_server serves its metrics for Prometheus to scrape, and exposition
+returns them as text.
+
+Updating a metric takes a lock, which is uncontended unless the metric is
+updated on several threads at once. The HTTP server is imported only when
+started, so that importing this module stays fast for short-lived commands.
+"""
+
+import threading
+
+from clock import monotonic
+
+
+# The default bucket bounds of a histogram, in seconds.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_value(value):
+  value = float(value)
+  if value == float('inf'):
+    return '+Inf'
+  elif value == float('-inf'):
+    return '-Inf'
+  return repr(value)
+
+def _escape_label_value(value):
+  return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(label_names, label_values):
+  if not label_names:
+    return ''
+  return '{%s}' % ','.join('%s="%s"' % (name, _escape_label_value(value))
+      for name, value in zip(label_names, label_values))
+
+
+class _Timer(object):
+  """A context manager that observes the seconds that it was entered for."""
+
+  def __init__(self, histogram):
+    self._histogram = histogram
+    self._start_time = None
+
+  def __enter__(self):
+    self._start_time = monotonic()
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self._histogram.observe(monotonic() - self._start_time)
+
+
+class _CounterChild(object):
+  def __init__(self, lock):
+    self._lock = lock
+    self.value = 0
+
+  def inc(self, amount=1):
+    if amount < 0:
+      raise ValueError('Counters can only increase')
+    with self._lock:
+      self.value += amount
+
+
+class _GaugeChild(object):
+  def __init__(self, lock):
+    self._lock = lock
+    self.value = 0
+
+  def set(self, value):
+    with self._lock:
+      self.value = value
+
+  def inc(self, amount=1):
+    with self._lock:
+      self.value += amount
+
+  def dec(self, amount=1):
+    with self._lock:
+      self.value -= amount
+
+
+class _HistogramChild(object):
+  def __init__(self, lock, buckets):
+    self._lock = lock
+    self.buckets = buckets
+    # The count of observations in each bucket, which are not cumulative.
+    self.bucket_counts = [0] * len(buckets)
+    self.count = 0
+    self.sum = 0.0
+
+  def observe(self, value):
+    # There are few buckets, so a linear search is fastest.
+    i = 0
+    for bound in self.buckets:
+      if value <= bound:
+        break
+      i += 1
+    with self._lock:
+      if i < len(self.bucket_counts):
+        self.bucket_counts[i] += 1
+      self.count += 1
+      self.sum += value
+
+  def time(self):
+    """Returns a context manager that observes the seconds spent in it."""
+    return _Timer(self)
+
+
+class _Metric(object):
+  """A metric with a child for each combination of label values."""
+
+  _type = None
+
+  def __init__(self, name, help, label_names=()):
+    self.name = name
+    self.help = help
+    self.label_names = tuple(label_names)
+    self._lock = threading.Lock()
+    self._children = {}
+
+  def _new_child(self):
+    raise NotImplementedError
+
+  def labels(self, *label_values):
+    """Returns the child with the given label values, in order of label name."""
+    if len(label_values) != len(self.label_names):
+      raise ValueError('Expected label values for %s' % ', '.join(self.label_names))
+    child = self._children.get(label_values)
+    if child is None:
+      with self._lock:
+        child = self._children.get(label_values)
+        if child is None:
+          child = self._children[label_values] = self._new_child()
+    return child
+
+  def _samples(self):
+    """Yields the name suffix, labels and value of each sample."""
+    raise NotImplementedError
+
+  def exposition(self):
+    """Returns the lines of this metric in the Prometheus text format."""
+    lines = [
+        '# HELP %s %s' % (self.name, self.help.replace('\\', '\\\\').replace('\n', '\\n')),
+        '# TYPE %s %s' % (self.name, self._type),
+    ]
+    for suffix, label_names, label_values, value in self._samples():
+      lines.append('%s%s%s %s' % (self.name, suffix,
+          _format_labels(label_names, label_values), _format_value(value)))
+    return lines
+
+
+class Counter(_Metric):
+  """A count that only increases, such as of timeouts."""
+
+  _type = 'counter'
+
+  def _new_child(self):
+    return _CounterChild(self._lock)
+
+  def inc(self, amount=1):
+    self.labels().inc(amount)
+
+  def _samples(self):
+    for label_values, child in sorted(self._children.items()):
+      yield '', self.label_names, label_values, child.value
+
+
+class Gauge(_Metric):
+  """A value that may increase or decrease, such as of tracked players."""
+
+  _type = 'gauge'
+
+  def _new_child(self):
+    return _GaugeChild(self._lock)
+
+  def set(self, value):
+    self.labels().set(value)
+
+  def inc(self, amount=1):
+    self.labels().inc(amount)
+
+  def dec(self, amount=1):
+    self.labels().dec(amount)
+
+  def _samples(self):
+    for label_values, child in sorted(self._children.items()):
+      yield '', self.label_names, label_values, child.value
+
+
+class Histogram(_Metric):
+  """Counts observations in buckets, such as of round trip times.
+
+  Parameter buckets is the increasing upper bounds of the buckets. A bucket
+  with no upper bound is always added.
+  """
+
+  _type = 'histogram'
+
+  def __init__(self, name, help, label_names=(), buckets=DEFAULT_BUCKETS):
+    super(Histogram, self).__init__(name, help, label_names)
+    self.buckets = tuple(sorted(buckets))
+
+  def _new_child(self):
+    return _HistogramChild(self._lock, self.buckets)
+
+  def observe(self, value):
+    self.labels().observe(value)
+
+  def time(self):
+    return self.labels().time()
+
+  def _samples(self):
+    bucket_label_names = self.label_names + ('le',)
+    for label_values, child in sorted(self._children.items()):
+      with self._lock:
+        bucket_counts = list(child.bucket_counts)
+        count = child.count
+        total = child.sum
+      cumulative_count = 0
+      for bound, bucket_count in zip(self.buckets, bucket_counts):
+        cumulative_count += bucket_count
+        yield ('_bucket', bucket_label_names, label_values + (_format_value(bound),),
+            cumulative_count)
+      yield '_bucket', bucket_label_names, label_values + ('+Inf',), count
+      yield '_sum', self.label_names, label_values, total
+      yield '_count', self.label_names, label_values, count
+
+
+class Registry(object):
+  """Creates metrics and exports them."""
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._metrics = {}
+
+  def _register(self, metric):
+    with self._lock:
+      if metric.name in self._metrics:
+        raise ValueError('Metric %s is already registered' % metric.name)
+      self._metrics[metric.name] = metric
+    return metric
+
+  def counter(self, name, help, label_names=()):
+    return self._register(Counter(name, help, label_names))
+
+  def gauge(self, name, help, label_names=()):
+    return self._register(Gauge(name, help, label_names))
+
+  def histogram(self, name, help, label_names=(), buckets=DEFAULT_BUCKETS):
+    return self._register(Histogram(name, help, label_names, buckets))
+
+  def get(self, name):
+    """Returns the metric with the given name, or None."""
+    return self._metrics.get(name)
+
+  def exposition(self):
+    """Returns all metrics in the Prometheus text format."""
+    with self._lock:
+      metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+    lines = []
+    for metric in metrics:
+      lines.extend(metric.exposition())
+    return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def start_http_server(port, host='127.0.0.1', registry=REGISTRY):
+  """Serves the metrics of the registry at /metrics on a daemon thread.
+
+  Returns the HTTPServer instance. Call its shutdown method to stop serving.
+  """
+  import BaseHTTPServer
+
+  class MetricsHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def do_GET(self):
+      if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+        self.send_error(404)
+        return
+      body = self.server.registry.exposition()
+      self.send_response(200)
+      self.send_header('Content-Type', _CONTENT_TYPE)
+      self.send_header('Content-Length', str(len(body)))
+      self.end_headers()
+      self.wfile.write(body)
+
+    def log_message(self, format, *args):
+      # Do not log each scrape.
+      pass
+
+  server = BaseHTTPServer.HTTPServer((host, port), MetricsHandler)
+  server.registry = registry
+  thread = threading.Thread(target=server.serve_forever, name='MetricsHTTPServer')
+  thread.daemon = True
+  thread.start()
+  return server
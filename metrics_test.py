@@ -0,0 +1,120 @@
+import socket
+import unittest
+import urllib2
+
+from fake_server import FakeSourceServer
+from metrics import *
+from monitor import Monitor
+import query_metrics
+import SourceQuery
+
+
+class MetricsTest(unittest.TestCase):
+  """Test case for the metrics and their exposition."""
+
+  def setUp(self):
+    self.registry = Registry()
+
+  def test_counter(self):
+    counter = self.registry.counter('timeouts_total', 'Timeouts.', ['type'])
+    counter.labels('player').inc()
+    counter.labels('player').inc(2)
+    counter.labels('info"').inc()
+    self.assertEqual(3, counter.labels('player').value)
+    self.assertRaises(ValueError, counter.labels('player').inc, -1)
+    self.assertEqual([
+        '# HELP timeouts_total Timeouts.',
+        '# TYPE timeouts_total counter',
+        'timeouts_total{type="info\\""} 1.0',
+        'timeouts_total{type="player"} 3.0',
+    ], counter.exposition())
+
+  def test_gauge(self):
+    gauge = self.registry.gauge('tracked_players', 'Tracked players.')
+    gauge.set(5)
+    gauge.dec()
+    self.assertEqual(['tracked_players 4.0'], gauge.exposition()[2:])
+
+  def test_histogram(self):
+    histogram = self.registry.histogram('rtt_seconds', 'RTT.', buckets=(0.1, 1))
+    for value in (0.05, 0.5, 0.5, 5):
+      histogram.observe(value)
+    self.assertEqual([
+        'rtt_seconds_bucket{le="0.1"} 1.0',
+        'rtt_seconds_bucket{le="1.0"} 3.0',
+        'rtt_seconds_bucket{le="+Inf"} 4.0',
+        'rtt_seconds_sum 6.05',
+        'rtt_seconds_count 4.0',
+    ], histogram.exposition()[2:])
+
+  def test_duplicate(self):
+    self.registry.counter('timeouts_total', 'Timeouts.')
+    self.assertRaises(ValueError, self.registry.gauge, 'timeouts_total', 'Timeouts.')
+
+  def test_http_server(self):
+    self.registry.counter('timeouts_total', 'Timeouts.').inc()
+    server = start_http_server(0, registry=self.registry)
+    self.addCleanup(server.server_close)
+    self.addCleanup(server.shutdown)
+
+    response = urllib2.urlopen('http://127.0.0.1:%d/metrics' % server.server_port)
+    self.assertEqual(self.registry.exposition(), response.read())
+    self.assertTrue(response.info()['Content-Type'].startswith('text/plain'))
+
+
+class InstrumentationTest(unittest.TestCase):
+  """Test case for the metrics of SourceQuery and Monitor."""
+
+  def setUp(self):
+    self.server = FakeSourceServer(num_players=40, split_size=500)
+    self.server.start()
+    self.addCleanup(self.server.stop)
+
+  def test_source_query(self):
+    rtt = query_metrics.QUERY_RTT.labels('player')
+    num_rtts = rtt.count
+    split_fragments = query_metrics.SPLIT_FRAGMENTS.labels()
+    num_split_replies = split_fragments.count
+    parse_seconds = query_metrics.PARSE_SECONDS.labels('player')
+    num_parses = parse_seconds.count
+
+    host, port = self.server.address
+    SourceQuery.SourceQuery(host, port, persistent=True,
+        observer=query_metrics.QUERY_METRICS).player()
+    # One round trip to get a challenge, and one for the players.
+    self.assertEqual(num_rtts + 2, rtt.count)
+    self.assertEqual(num_split_replies + 1, split_fragments.count)
+    self.assertEqual(num_parses + 1, parse_seconds.count)
+
+    # Without an observer, no metrics are updated.
+    SourceQuery.SourceQuery(host, port, persistent=True).player()
+    self.assertEqual(num_rtts + 2, rtt.count)
+
+  def test_timeout(self):
+    # Nothing answers on this socket.
+    udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    udp.bind(('127.0.0.1', 0))
+    self.addCleanup(udp.close)
+    host, port = udp.getsockname()
+
+    timeouts = query_metrics.QUERY_TIMEOUTS.labels('player')
+    num_timeouts = timeouts.value
+    update_errors = REGISTRY.get('monitor_update_errors_total').labels('timeout')
+    num_update_errors = update_errors.value
+    monitor = Monitor(host, port, -1)
+    monitor._source_query.timeout = 0.05
+    self.assertIsNone(monitor.update())
+    self.assertEqual(num_timeouts + 1, timeouts.value)
+    self.assertEqual(num_update_errors + 1, update_errors.value)
+
+  def test_monitor(self):
+    host, port = self.server.address
+    monitor = Monitor(host, port, -1)
+    monitor.set_stddev_weight(50)
+    monitor.update()
+    tracked_players = REGISTRY.get('monitor_tracked_players').labels('%s:%s' % (host, port))
+    self.assertEqual(40, tracked_players.value)
+
+
+if __name__ == '__main__':
+  unittest.main()
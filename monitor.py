@@ -1,47 +1,215 @@
+from bisect import bisect_right
 from collections import namedtuple
+import heapq
 import itertools
 import math
+import socket
+import struct
+import time
 from operator import itemgetter, attrgetter
 
-from SourceQuery import SourceQuery
+from SourceQuery import SourceQuery, SourceQueryError
+from clock import monotonic
+from metrics import REGISTRY
+from names import NameTable
+from query_metrics import QUERY_METRICS
 
 
 class FrequencyDistribution(object):
-  """A frequency distribution over a collection of values."""
+  """A frequency distribution over a collection of values.
 
-  def __init__(self):
-    self._freqs = []
+  The count, sum and sum of squares of all values are maintained as they are
+  added, so that computing the mean and standard deviation is O(1). Because the
+  values are integers, these running totals are exact.
+
+  Parameter keep_histogram specifies whether to also keep the frequency of each
+  value, which is then available from the histogram property.
+  """
+
+  __slots__ = ('_num_values', '_values_sum', '_values_sum_of_squares', '_freqs')
+
+  def __init__(self, keep_histogram=False):
+    self._num_values = 0
+    self._values_sum = 0
+    self._values_sum_of_squares = 0
+    self._freqs = [] if keep_histogram else None
+
+  @property
+  def num_values(self):
+    return self._num_values
+  @property
+  def histogram(self):
+    """The frequency of each value, or None if not kept.
+
+    The frequency of a value is at the index equal to that value."""
+    return self._freqs
 
   def add_value(self, value):
     """Increments the frequency of the given value."""
 
     value = int(value)
+    self._num_values += 1
+    self._values_sum += value
+    self._values_sum_of_squares += value * value
+
+    if self._freqs is None:
+      return
     if value >= len(self._freqs):
       # Must extend the array so value is a valid index.
       elements_added = value + 1 - len(self._freqs)
       self._freqs.extend(elements_added * [0])
     self._freqs[value] += 1
 
+  def merge(self, other):
+    """Adds all values in the given distribution to this distribution.
+
+    The histogram of this distribution is kept only if both distributions keep
+    their histograms.
+    """
+    self._num_values += other._num_values
+    self._values_sum += other._values_sum
+    self._values_sum_of_squares += other._values_sum_of_squares
+
+    if self._freqs is None:
+      return
+    elif other._freqs is None:
+      # Cannot know the frequencies of the merged values.
+      self._freqs = None
+      return
+    if len(other._freqs) > len(self._freqs):
+      self._freqs.extend((len(other._freqs) - len(self._freqs)) * [0])
+    for value, freq in enumerate(other._freqs):
+      self._freqs[value] += freq
+
+  def compute_mean(self):
+    """Computes the mean of all values."""
+
+    if not self._num_values:
+      return None
+    return self._values_sum / float(self._num_values)
+
   def compute_std_dev(self):
     """Computes the standard deviation of all values."""
 
-    if not self._freqs:
+    if not self._num_values:
+      return None
+
+    # Compute n^2 times the variance exactly using integers, then divide.
+    num_values = self._num_values
+    scaled_variance = (
+        num_values * self._values_sum_of_squares - self._values_sum * self._values_sum)
+    return math.sqrt(scaled_variance / float(num_values * num_values))
+
+
+class SlidingWindowDistribution(object):
+  """A distribution over only the most recent values.
+
+  The values are kept in a ring buffer of the given window size, and the count,
+  sum and sum of squares are updated as each value enters and leaves the window.
+  So adding a value and computing the standard deviation are both O(1).
+  """
+
+  __slots__ = ('_values', '_next_index', '_num_values', '_values_sum',
+      '_values_sum_of_squares')
+
+  def __init__(self, window_size):
+    self._values = window_size * [0]
+    self._next_index = 0
+    self._num_values = 0
+    self._values_sum = 0
+    self._values_sum_of_squares = 0
+
+  @property
+  def num_values(self):
+    return self._num_values
+
+  def add_value(self, value):
+    """Adds the given value, removing the oldest value if the window is full."""
+
+    value = int(value)
+    if self._num_values == len(self._values):
+      # Remove the oldest value, which is about to be overwritten.
+      oldest_value = self._values[self._next_index]
+      self._values_sum -= oldest_value
+      self._values_sum_of_squares -= oldest_value * oldest_value
+    else:
+      self._num_values += 1
+    self._values[self._next_index] = value
+    self._next_index = (self._next_index + 1) % len(self._values)
+    self._values_sum += value
+    self._values_sum_of_squares += value * value
+
+  def compute_mean(self):
+    """Computes the mean of the values in the window."""
+
+    if not self._num_values:
+      return None
+    return self._values_sum / float(self._num_values)
+
+  def compute_std_dev(self):
+    """Computes the standard deviation of the values in the window."""
+
+    if not self._num_values:
+      return None
+
+    num_values = self._num_values
+    scaled_variance = (
+        num_values * self._values_sum_of_squares - self._values_sum * self._values_sum)
+    return math.sqrt(scaled_variance / float(num_values * num_values))
+
+
+class DecayedDistribution(object):
+  """A distribution where the weight of each value decays exponentially.
+
+  Each value added halves in weight after the given half-life, which is a
+  number of values. The weighted mean and variance are updated incrementally,
+  so the distribution uses O(1) memory and each update is O(1).
+  """
+
+  __slots__ = ('_decay', '_num_values', '_total_weight', '_mean',
+      '_weighted_sum_of_squares')
+
+  def __init__(self, half_life):
+    self._decay = math.pow(0.5, 1.0 / half_life)
+    self._num_values = 0
+    self._total_weight = 0.0
+    self._mean = 0.0
+    self._weighted_sum_of_squares = 0.0
+
+  @property
+  def num_values(self):
+    return self._num_values
+
+  def add_value(self, value):
+    """Adds the given value with a weight of 1, decaying all earlier values."""
+
+    self._num_values += 1
+    self._total_weight = self._decay * self._total_weight + 1.0
+    delta = value - self._mean
+    self._mean += delta / self._total_weight
+    self._weighted_sum_of_squares = (
+        self._decay * self._weighted_sum_of_squares + delta * (value - self._mean))
+
+  def compute_mean(self):
+    """Computes the weighted mean of all values."""
+
+    if not self._num_values:
       return None
+    return self._mean
+
+  def compute_std_dev(self):
+    """Computes the weighted standard deviation of all values."""
 
-    # First compute the mean.
-    num_values = float(sum(self._freqs))
-    values_sum = sum(i * freq for i, freq in enumerate(self._freqs))
-    mean = values_sum / num_values
-    # Use the mean to compute the standard deviation.
-    values_sum_of_squares = sum(
-        math.pow(i - mean, 2) * freq for i, freq in enumerate(self._freqs))
-    std_dev = math.sqrt(values_sum_of_squares / num_values)
-    return std_dev
+    if not self._num_values:
+      return None
+    return math.sqrt(max(0.0, self._weighted_sum_of_squares / self._total_weight))
 
 
 class Player(object):
   """Information about a player."""
 
+  __slots__ = ('_kills', '_connect_duration')
+
   def __init__(self, kills, connect_duration):
     self._kills = kills
     self._connect_duration = connect_duration
@@ -54,13 +222,35 @@ class Player(object):
     return self._connect_duration
 
 
+# The least standard deviation that new kills are divided by, in kills, which is
+# that of new kills alternating between two adjacent counts. Without a floor, a
+# burst of kills after a flat history, or after a single interval, would score
+# no standard deviations, and rank last instead of first.
+MIN_STDDEV = 0.5
+
+
 class TrackedPlayer(Player):
-  """Information about a tracked player."""
+  """Information about a tracked player.
 
-  def __init__(self, kills, connect_duration):
+  This class and its distribution of new kills use __slots__, so that each
+  tracked player is two small objects without a __dict__. On 64-bit CPython 2.7
+  a tracked player and its distribution use 152 bytes, excluding the integers
+  that they refer to; run monitor_bench.py to measure this.
+
+  A tracked player is updated in place on each poll, but the poll still creates
+  a Player and a PlayerKills tuple for each player in the reply, so __slots__
+  only makes the long-lived objects smaller.
+  """
+
+  __slots__ = ('_new_kills_dist',)
+
+  def __init__(self, kills, connect_duration, new_kills_dist=None):
     Player.__init__(self, kills, connect_duration)
 
-    self._new_kills_dist = FrequencyDistribution()
+    # The distribution of new kills is a FrequencyDistribution unless specified.
+    if new_kills_dist is None:
+      new_kills_dist = FrequencyDistribution()
+    self._new_kills_dist = new_kills_dist
     # Don't add kills to distribution.
 
   def _get_new_kills(self, updated_kills, updated_connect_duration):
@@ -78,8 +268,9 @@ class TrackedPlayer(Player):
   def _get_num_stddevs(self, new_kills):
     stddev = self._new_kills_dist.compute_std_dev()
     if stddev is None:
+      # There is no history to compare with.
       return 0
-    return new_kills / stddev
+    return new_kills / max(stddev, MIN_STDDEV)
 
   def update(self, updated_kills, updated_connect_duration):
     """Updates this player."""
@@ -91,20 +282,161 @@ class TrackedPlayer(Player):
 
     return new_kills, num_stddevs
 
+  @property
+  def new_kills_dist(self):
+    """The distribution of the new kills of this player in each interval."""
+    return self._new_kills_dist
+
   def add_new_kills(self, new_kills):
     """Adds the new kills to the distribution of new kills."""
     self._new_kills_dist.add_value(new_kills)
 
 
-PlayerKills = namedtuple('PlayerKills', ['name', 'new_kills', 'num_stddevs'])
+RANK_SECONDS = REGISTRY.histogram('monitor_rank_seconds',
+    'Time to rank the players of a server.',
+    buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01))
+UPDATE_ERRORS = REGISTRY.counter('monitor_update_errors_total',
+    'Failed queries of a server, by the type of error.', ['error'])
+TRACKED_PLAYERS = REGISTRY.gauge('monitor_tracked_players',
+    'Players tracked for each server.', ['server'])
+SAVED_PLAYER_QUERIES = REGISTRY.counter('monitor_saved_player_queries_total',
+    'Player queries skipped after querying the server info, by reason.', ['reason'])
+
+# The errors of a query that an update survives, including those of parsing a
+# malformed reply.
+_QUERY_ERRORS = (
+    socket.error, struct.error, SourceQueryError, ValueError, IndexError)
+
+# The phases of an update, which a phase hook is called on entering and exiting.
+PHASE_QUERY = 'query'
+PHASE_GET_NEW_KILLS = 'get_new_kills'
+PHASE_UPDATE_PLAYERS = 'update_players'
+PHASE_RANK = 'rank'
+
+
+class AdaptiveInterval(object):
+  """The seconds between polls of a server, adapted to its activity.
+
+  After a poll with new kills, the interval is set so that about
+  target_new_kills kills happen between polls at the kill rate since the last
+  poll. After a poll with no new kills, or while the server is empty or changing
+  maps, the interval is multiplied by backoff. The interval is always within
+  min_secs and max_secs, and starts at min_secs.
+  """
+
+  def __init__(self, min_secs, max_secs, target_new_kills=10, backoff=2.0):
+    self.min_secs = min_secs
+    self.max_secs = max_secs
+    self.target_new_kills = target_new_kills
+    self.backoff = backoff
+    self.secs = min_secs
+
+  def _clamp(self, secs):
+    return min(self.max_secs, max(self.min_secs, secs))
+
+  def back_off(self):
+    """Lengthens the interval after a poll with no activity, and returns it."""
+    self.secs = self._clamp(self.secs * self.backoff)
+    return self.secs
+
+  def add_new_kills(self, new_kills, elapsed_secs):
+    """Adapts the interval to the new kills since the last poll, and returns it.
+
+    Parameter new_kills is the total of new kills by all players.
+    Parameter elapsed_secs is the seconds since the last poll.
+    """
+    if new_kills <= 0 or elapsed_secs <= 0:
+      return self.back_off()
+    kill_rate = new_kills / float(elapsed_secs)
+    self.secs = self._clamp(self.target_new_kills / kill_rate)
+    return self.secs
+
+
+class InfoGate(object):
+  """Decides from the A2S_INFO reply of a server whether to query its players.
+
+  Players are not queried while the server is empty, or while its number of
+  players is unchanged and the last query of players found no new kills. Because
+  kills do not change the number of players, players are queried anyway after
+  max_idle_skips such skips in a row.
+  """
+
+  QUERY = 'query'
+  SKIP_EMPTY = 'empty'
+  SKIP_IDLE = 'idle'
+  MAP_CHANGED = 'map_changed'
+
+  def __init__(self, max_idle_skips=3):
+    self.max_idle_skips = max_idle_skips
+    self.map_name = None
+    self.num_players = None
+    self.num_saved_queries = 0
+    self._num_idle_skips = 0
+
+  def check(self, map_name, num_players, idle):
+    """Returns QUERY, SKIP_EMPTY, SKIP_IDLE or MAP_CHANGED.
+
+    Parameter idle is whether the last query of players found no new kills.
+    Players should be queried after MAP_CHANGED, once tracked players are reset.
+    """
+    prev_map_name = self.map_name
+    prev_num_players = self.num_players
+    self.map_name = map_name
+    self.num_players = num_players
+
+    if prev_map_name is not None and map_name != prev_map_name:
+      self._num_idle_skips = 0
+      return InfoGate.MAP_CHANGED
+    elif num_players == 0:
+      self.num_saved_queries += 1
+      return InfoGate.SKIP_EMPTY
+    elif (idle and num_players == prev_num_players and
+        self._num_idle_skips < self.max_idle_skips):
+      self._num_idle_skips += 1
+      self.num_saved_queries += 1
+      return InfoGate.SKIP_IDLE
+    self._num_idle_skips = 0
+    return InfoGate.QUERY
+
+
+PlayerKills = namedtuple('PlayerKills', ['player_id', 'new_kills', 'num_stddevs'])
 PlayerRank = namedtuple('PlayerRank', ['rank', 'player_objs'])
+# The ranks and the player kills are by player name, because the id of a player
+# who disconnects is reused by a later update.
+RankedSnapshot = namedtuple('RankedSnapshot', ['timestamp', 'ranks', 'player_kills'])
+RankedPlayer = namedtuple('RankedPlayer', ['name', 'rank', 'score'])
+# The ranks of the players in a ranking by new kills, by standard deviations and
+# combined, each a map from player id to rank.
+PlayerRanks = namedtuple('PlayerRanks',
+    ['kill_ranks', 'stddev_ranks', 'combined_ranks'])
+# The statistics and ranks of a player in the last ranking, which are the
+# columns of the player table.
+PlayerStats = namedtuple('PlayerStats',
+    ['name', 'total', 'avg', 'stddev', 'new', 'new_rank', 'stddev_rank',
+     'combined_rank'])
 
 
 class Monitor(object):
   def __init__(self, host, port, interval_secs):
-    self._source_query = SourceQuery(host, port)
+    self._source_query = SourceQuery(
+        host, port, persistent=True, observer=QUERY_METRICS)
+    self._server_label = '%s:%s' % (host, port)
     self._interval_secs = interval_secs
+    # Players are tracked and ranked by the id of their name in this table.
+    self._name_table = NameTable()
     self._players = {}
+    self._player_kills = None
+    # The PlayerRanks of the last update that ranked players.
+    self._player_ranks = None
+    self._recorder = None
+    self._adaptive_interval = None
+    self._info_gate = None
+    # Whether the last query of players found no new kills, and its time.
+    self._idle = False
+    self._last_poll_time = None
+    self._new_kills_dist_factory = FrequencyDistribution
+    self._phase_hook = None
+    self._profiler = None
 
   """Weight for standard deviation is in [0, 100]."""
   _MAX_STDDEV_WEIGHT = 100
@@ -112,10 +444,33 @@ class Monitor(object):
   def set_stddev_weight(self, stddev_weight):
     self._stddev_weight = stddev_weight
 
+  def set_query_options(self, hedge=False, retries=0, circuit_breaker=None):
+    """Sets how queries of the server recover from lost packets.
+
+    Parameter hedge specifies whether to resend a request with no reply by the
+    95th percentile of recent round trip times.
+    Parameter retries is the number of times to retry a request that times out.
+    Parameter circuit_breaker is a CircuitBreaker that stops querying the server
+    after consecutive failures, or None.
+    """
+    self._source_query.hedge = hedge
+    self._source_query.retries = retries
+    self._source_query.circuit_breaker = circuit_breaker
+
+  def set_new_kills_dist_factory(self, new_kills_dist_factory):
+    """Sets the function that returns the distribution of new kills of a player.
+
+    For example, functools.partial(SlidingWindowDistribution, 30) considers only
+    the last 30 intervals, and functools.partial(DecayedDistribution, 15) halves
+    the weight of each interval after 15 intervals. This applies to players that
+    are tracked afterward.
+    """
+    self._new_kills_dist_factory = new_kills_dist_factory
+
   def _get_new_kills(self, updated_players, first_update):
     """Returns a PlayerKills instance for each updated player.
 
-    Parameter updated_players is the map of player names to Player instances in
+    Parameter updated_players is the map of player ids to Player instances in
     this update.
     Parameter first_update specifies whether this is the first update.
 
@@ -125,8 +480,8 @@ class Monitor(object):
     """
     all_player_kills = []
     have_new_kills = False
-    for updated_player_name, updated_player in updated_players.iteritems():
-      curr_player = self._players.get(updated_player_name, None)
+    for updated_player_id, updated_player in updated_players.iteritems():
+      curr_player = self._players.get(updated_player_id, None)
       if curr_player != None:
         # Update an existing player.
         new_kills, num_stddevs = curr_player.update(
@@ -134,74 +489,96 @@ class Monitor(object):
         if new_kills:
           have_new_kills = True
         all_player_kills.append(
-            PlayerKills(updated_player_name, new_kills, num_stddevs))
+            PlayerKills(updated_player_id, new_kills, num_stddevs))
       else:
         new_kills = 0
         if not first_update and updated_player.kills:
           # Do not count kills in the first update as new kills.
           new_kills = updated_player.kills
           have_new_kills = True
-        all_player_kills.append(PlayerKills(updated_player_name, new_kills, 0))
+        all_player_kills.append(PlayerKills(updated_player_id, new_kills, 0))
 
     return all_player_kills, have_new_kills
 
   def _update_player_kills(self, updated_players, first_update, all_player_kills):
     """Updates the new kill distribution for each player.
 
-    Parameter updated_players is the map of player names to Player instances in
+    Parameter updated_players is the map of player ids to Player instances in
     this update.
     Parameter first_update specifies whether this is the first update.
     Parameter all_player_kills is an array of PlayerKill instances for each player
     in the update.
     """
     for player_kills in all_player_kills:
-      curr_player = self._players.get(player_kills.name, None)
+      curr_player = self._players.get(player_kills.player_id, None)
       if curr_player != None:
         # Add the new kills to the distribution of an existing player.
         curr_player.add_new_kills(player_kills.new_kills)
       else:
-        new_player = updated_players[player_kills.name]
-        tracked_player = TrackedPlayer(new_player.kills, new_player.connect_duration)
-        self._players[player_kills.name] = tracked_player
+        new_player = updated_players[player_kills.player_id]
+        tracked_player = TrackedPlayer(new_player.kills, new_player.connect_duration,
+            self._new_kills_dist_factory())
+        self._players[player_kills.player_id] = tracked_player
         if not first_update:
           tracked_player.add_new_kills(player_kills.new_kills)
 
   def _remove_disconnected_players(self, updated_players):
-    """Removes all disconnected players."""
-    removed_player_names = [player_name for player_name in self._players
-        if player_name not in updated_players]
-    for removed_player_name in removed_player_names:
-      del self._players[removed_player_name]
+    """Removes all disconnected players, and releases their ids."""
+    removed_player_ids = [player_id for player_id in self._players
+        if player_id not in updated_players]
+    for removed_player_id in removed_player_ids:
+      del self._players[removed_player_id]
+      self._name_table.release(removed_player_id)
 
   def _update_players(self, updated_players):
     """Updates each player, given an update from the server.
 
-    Parameter updated_players is the map of player names to Player instances in
+    Parameter updated_players is the map of player ids to Player instances in
     this update.
 
-    Returns an array of PlayerKill instances for each player in the update.
+    Returns an array of PlayerKill instances for each player in the update, or
+    None if this is the first update or no player has new kills.
     """
+    phase_hook = self._phase_hook
     # Get the number of new kills for each updated player.
     first_update = not bool(self._players)
+    if phase_hook is not None:
+      phase_hook.enter(PHASE_GET_NEW_KILLS, monotonic())
     all_player_kills, have_new_kills = self._get_new_kills(updated_players, first_update)
-
-    if not have_new_kills:
-      # The game is paused or there is a stalemate.
+    if phase_hook is not None:
+      phase_hook.exit(PHASE_GET_NEW_KILLS, monotonic())
+
+    self._idle = not have_new_kills and not first_update
+    if self._idle:
+      # The game is paused or there is a stalemate. New players are not
+      # tracked yet, so release their ids.
+      for player_id in updated_players:
+        if player_id not in self._players:
+          self._name_table.release(player_id)
       return None
+    if phase_hook is not None:
+      phase_hook.enter(PHASE_UPDATE_PLAYERS, monotonic())
     self._update_player_kills(updated_players, first_update, all_player_kills)
     self._remove_disconnected_players(updated_players)
+    if phase_hook is not None:
+      phase_hook.exit(PHASE_UPDATE_PLAYERS, monotonic())
 
+    if first_update:
+      # Kills in the first update are not new, so there is nothing to rank.
+      return None
     # Return the new kills for each updated player for ranking.
+    self._player_kills = all_player_kills
+    self._player_ranks = None
     return all_player_kills
 
-  def _rank_players_by_attr(self, player_objs, name_getter, attr_getter):
+  def _rank_players_by_attr(self, player_objs, id_getter, attr_getter):
     """Ranks players by a specified attribute.
 
     Parameter player_objs is a sequence of objects representing the players.
-    Parameter name_getter is a function that returns the player name.
+    Parameter id_getter is a function that returns the player id.
     Parameter attr_getter is a function that returns the player attribute.
 
-    Returns a map from each player name to its rank, starting at 1.
+    Returns a map from each player id to its rank, starting at 1.
     """
     player_objs = sorted(player_objs, key=attr_getter, reverse=True)
 
@@ -223,70 +600,358 @@ class Monitor(object):
     if prev_rank != None:
       player_ranks.append(prev_rank)
 
-    # Map each player name to its rank.
+    # Map each player id to its rank.
     ranks_by_player = {}
     for player_rank in player_ranks:
       for player_obj in player_rank.player_objs:
-        ranks_by_player[name_getter(player_obj)] = player_rank.rank
+        ranks_by_player[id_getter(player_obj)] = player_rank.rank
     return ranks_by_player
 
   def _joint_rank(self, kill_ranks, stddev_ranks):
     """Returns the joint ranking of players.
 
-    Parameter kill_ranks is a map from each player name to its ranking by kill.
-    Parameter stddev_ranks is a map from each player name to its ranking by stddev.
+    Parameter kill_ranks is a map from each player id to its ranking by kill.
+    Parameter stddev_ranks is a map from each player id to its ranking by stddev.
 
-    Returns a sequence of pairs, where each pair contains a player name and its
-    joint rank.
+    Returns a map from each player id to its joint rank.
     """
     num_players = len(kill_ranks)
     kill_weight = Monitor._MAX_STDDEV_WEIGHT - self._stddev_weight
     joint_ranks = []
-    for player_name, kill_rank in kill_ranks.iteritems():
-      stddev_rank = stddev_ranks[player_name]
+    for player_id, kill_rank in kill_ranks.iteritems():
+      stddev_rank = stddev_ranks[player_id]
       weighted_kill_rank = kill_weight * (num_players + 1 - kill_rank)
       weighted_stddev_rank = self._stddev_weight * (num_players + 1 - stddev_rank)
       weighted_total = weighted_kill_rank + weighted_stddev_rank
 
-      joint_ranks.append((player_name, weighted_total))
+      joint_ranks.append((player_id, weighted_total))
 
     # Now rank each player by its joint ranking.
-    name_getter = itemgetter(0)
+    id_getter = itemgetter(0)
     joint_rank_getter = itemgetter(1)
-    return self._rank_players_by_attr(joint_ranks, name_getter, joint_rank_getter)
+    return self._rank_players_by_attr(joint_ranks, id_getter, joint_rank_getter)
 
-  def _rank_players(self, player_kills):
-    """Returns the ranking of players.
+  def rank_players(self, player_kills):
+    """Returns the ranking of players, weighted as set by set_stddev_weight.
 
-    Parameter player_kills is a sequence of PlayerKill instances.
+    Parameter player_kills is a sequence of PlayerKill instances. Their player
+    ids may be any distinct hashable values, and need not be ids of this
+    Monitor.
 
-    Returns a map from each player name to its rank.
+    Returns a map from each player id to its rank.
     """
-    name_getter = attrgetter('name')
+    id_getter = attrgetter('player_id')
     kill_getter = attrgetter('new_kills')
     stddev_getter = attrgetter('num_stddevs')
 
     if self._stddev_weight == 0:
-      return self._rank_players_by_attr(player_kills, name_getter, kill_getter)
+      return self._rank_players_by_attr(player_kills, id_getter, kill_getter)
     elif self._stddev_weight == Monitor._MAX_STDDEV_WEIGHT:
-      return self._rank_players_by_attr(player_kills, name_getter, stddev_getter)
+      return self._rank_players_by_attr(player_kills, id_getter, stddev_getter)
     else:
       # Rank each player by kill and also by stddev. Then compute each joint rank.
-      kill_ranks = self._rank_players_by_attr(player_kills, name_getter, kill_getter)
-      stddev_ranks = self._rank_players_by_attr(player_kills, name_getter, stddev_getter)
+      kill_ranks = self._rank_players_by_attr(player_kills, id_getter, kill_getter)
+      stddev_ranks = self._rank_players_by_attr(player_kills, id_getter, stddev_getter)
       return self._joint_rank(kill_ranks, stddev_ranks)
 
-  def update(self):
-    try:
+  def _rank_players_each_way(self, player_kills):
+    """Returns the PlayerRanks of players.
+
+    The combined ranks are the same as those returned by rank_players.
+    Parameter player_kills is a sequence of PlayerKill instances.
+    """
+    id_getter = attrgetter('player_id')
+    kill_ranks = self._rank_players_by_attr(
+        player_kills, id_getter, attrgetter('new_kills'))
+    stddev_ranks = self._rank_players_by_attr(
+        player_kills, id_getter, attrgetter('num_stddevs'))
+    if self._stddev_weight == 0:
+      combined_ranks = kill_ranks
+    elif self._stddev_weight == Monitor._MAX_STDDEV_WEIGHT:
+      combined_ranks = stddev_ranks
+    else:
+      combined_ranks = self._joint_rank(kill_ranks, stddev_ranks)
+    return PlayerRanks(kill_ranks, stddev_ranks, combined_ranks)
+
+  def player_name(self, player_id):
+    """Returns the name of the player with the given id.
+
+    The id of a player who disconnects is released and reused by a later
+    update, so an id is only valid until the next update.
+    """
+    return self._name_table.name(player_id)
+
+  def player_kills(self):
+    """Returns the PlayerKills instances of the last ranking, by player id.
+
+    Returns an empty tuple if players were never ranked. The ids are only valid
+    until the next update, as for player_name.
+    """
+    return tuple(self._player_kills or ())
+
+  def _resolve_names(self, player_ranks):
+    """Returns the map of player ids to ranks as a map of player names to ranks."""
+    name = self._name_table.name
+    return {name(player_id): rank for player_id, rank in player_ranks.iteritems()}
+
+  def _rank_values(self, values):
+    """Returns the rank of each value in a sequence.
+
+    Ties have the same rank, as in _rank_players_by_attr.
+    """
+    sorted_values = sorted(values)
+    num_values = len(sorted_values)
+    # The rank is one more than the number of greater values.
+    return [num_values + 1 - bisect_right(sorted_values, value)
+        for value in values]
+
+  def player_stats(self):
+    """Returns the statistics and ranks of the players of the last ranking.
+
+    The ranks are those computed by the update that ranked the players. Returns
+    a tuple of PlayerStats instances, which is empty if players were never
+    ranked.
+    """
+    player_ranks = self._player_ranks
+    if player_ranks is None:
+      return ()
+    name = self._name_table.name
+    all_player_stats = []
+    for player_kill in self._player_kills:
+      player_id = player_kill.player_id
+      tracked_player = self._players[player_id]
+      new_kills_dist = tracked_player.new_kills_dist
+      all_player_stats.append(PlayerStats(name(player_id), tracked_player.kills,
+          new_kills_dist.compute_mean(), new_kills_dist.compute_std_dev(),
+          player_kill.new_kills, player_ranks.kill_ranks[player_id],
+          player_ranks.stddev_ranks[player_id],
+          player_ranks.combined_ranks[player_id]))
+    return tuple(all_player_stats)
+
+  def top_k(self, k):
+    """Returns the best players of the last update that ranked players.
+
+    Players tied with the k-th best player are also returned, so that each
+    returned player has the same rank as in rank_players. Only the scores are
+    sorted to compute ranks, and the best players are selected with a heap.
+
+    Returns a list of RankedPlayer instances in order of rank and then name. The
+    score is the number of new kills if the weight for standard deviation is 0,
+    the number of standard deviations if it is 100, and the weighted sum of both
+    ranks otherwise.
+    """
+    player_kills = self._player_kills
+    if not player_kills or k <= 0:
+      return []
+
+    if self._stddev_weight == 0:
+      scores = [player_kill.new_kills for player_kill in player_kills]
+    elif self._stddev_weight == Monitor._MAX_STDDEV_WEIGHT:
+      scores = [player_kill.num_stddevs for player_kill in player_kills]
+    else:
+      # Compute each joint score as _joint_rank does.
+      num_players = len(player_kills)
+      kill_ranks = self._rank_values(
+          [player_kill.new_kills for player_kill in player_kills])
+      stddev_ranks = self._rank_values(
+          [player_kill.num_stddevs for player_kill in player_kills])
+      kill_weight = Monitor._MAX_STDDEV_WEIGHT - self._stddev_weight
+      scores = [
+          kill_weight * (num_players + 1 - kill_rank) +
+              self._stddev_weight * (num_players + 1 - stddev_rank)
+            for kill_rank, stddev_rank
+            in itertools.izip(kill_ranks, stddev_ranks)
+      ]
+
+    scored_players = zip(
+        scores, (player_kill.player_id for player_kill in player_kills))
+    if k < len(scored_players):
+      # Keep the k best players and any players tied with the k-th best player.
+      min_score = heapq.nlargest(k, scores)[-1]
+      scored_players = [scored_player for scored_player in scored_players
+          if scored_player[0] >= min_score]
+    # Resolve the names of only the best players.
+    name = self._name_table.name
+    scored_players = [(score, name(player_id))
+        for score, player_id in scored_players]
+    scored_players.sort(
+        key=lambda scored_player: (-scored_player[0], scored_player[1]))
+
+    top_players = []
+    for i, (score, name) in enumerate(scored_players, start=1):
+      if top_players and score == top_players[-1].score:
+        rank = top_players[-1].rank
+      else:
+        rank = i
+      top_players.append(RankedPlayer(name, rank, score))
+    return top_players
+
+  def replay(self, snapshots):
+    """Ranks players for each recorded snapshot, without querying the server.
+
+    Parameter snapshots is a sequence of Snapshot instances, such as a
+    PollRecording.
+
+    Yields a RankedSnapshot instance for each snapshot that ranks players.
+    """
+    intern = self._name_table.intern
+    name = self._name_table.name
+    for snapshot in snapshots:
       updated_players = {
-          player['name']: Player(player['kills'], player['time'])
-            for player in source_query.player()
+          intern(player.name): Player(player.kills, player.connect_duration)
+            for player in snapshot.players
       }
-    except:
+      player_kills = self._update_players(updated_players)
+      if player_kills is None:
+        continue
+      ranks = self._resolve_names(self.rank_players(player_kills))
+      yield RankedSnapshot(snapshot.timestamp, ranks, tuple(
+          PlayerKills(name(player_kill.player_id), player_kill.new_kills,
+              player_kill.num_stddevs)
+            for player_kill in player_kills))
+
+  def set_recorder(self, recorder):
+    """Sets the PollRecorder that records each poll, or None to not record."""
+    self._recorder = recorder
+
+  def set_adaptive_interval(self, adaptive_interval):
+    """Sets the AdaptiveInterval that adapts the poll interval to the server.
+
+    The interval backs off after a poll with no new kills, and also when an
+    InfoGate, if set, skips the player query. If None, the poll interval is
+    always interval_secs.
+    """
+    self._adaptive_interval = adaptive_interval
+
+  def set_info_gate(self, info_gate):
+    """Sets the InfoGate that each update queries the server info for.
+
+    The players are then only queried if the gate allows it, and tracked
+    players are reset when the map changes. If None, each update queries the
+    players only.
+    """
+    self._info_gate = info_gate
+
+  def next_interval_secs(self):
+    """Returns the seconds until the next update, such as for a Scheduler."""
+    if self._adaptive_interval is None:
+      return self._interval_secs
+    return self._adaptive_interval.secs
+
+  def _back_off(self):
+    if self._adaptive_interval is not None:
+      self._adaptive_interval.back_off()
+
+  def _reset_players(self):
+    """Stops tracking all players, whose kills are reset with the map."""
+    self._name_table = NameTable()
+    self._players = {}
+    self._player_kills = None
+    self._player_ranks = None
+    self._idle = False
+    self._last_poll_time = None
+
+  def _should_query_players(self):
+    """Returns whether to query players, given the server info.
+
+    If not, the adaptive interval backs off. If the info query fails or its
+    reply is invalid, then the players are queried anyway, so that a server
+    that answers only player queries is still polled.
+    """
+    try:
+      info = self._source_query.info()
+    except _QUERY_ERRORS as e:
+      UPDATE_ERRORS.labels(type(e).__name__).inc()
+      return True
+    if info is None:
+      UPDATE_ERRORS.labels('invalid_info').inc()
+      return True
+
+    decision = self._info_gate.check(info['map'], info['numplayers'], self._idle)
+    if decision == InfoGate.QUERY:
+      return True
+    # The server is empty, idle or between maps.
+    self._back_off()
+    if decision == InfoGate.MAP_CHANGED:
+      self._reset_players()
+      return True
+    SAVED_PLAYER_QUERIES.labels(decision).inc()
+    return False
+
+  def _adapt_interval(self, player_kills, poll_time):
+    """Adapts the interval to the new kills since the last query of players."""
+    if self._last_poll_time is not None:
+      new_kills = sum(player_kill.new_kills for player_kill in player_kills or ())
+      self._adaptive_interval.add_new_kills(new_kills, poll_time - self._last_poll_time)
+    self._last_poll_time = poll_time
+
+  def set_phase_hook(self, phase_hook):
+    """Sets the hook that is called on entering and exiting each update phase.
+
+    The hook has methods enter and exit, which are passed the phase, such as
+    PHASE_QUERY, and the monotonic time. A phase with no players to rank is not
+    entered. If None, which is the default, no hook is called.
+    """
+    self._phase_hook = phase_hook
+
+  def set_profiler(self, profiler):
+    """Sets the SamplingProfiler that profiles some updates, or None."""
+    self._profiler = profiler
+
+  def _query_players(self):
+    """Returns the player dicts from querying the server, or None."""
+    if self._info_gate is not None and not self._should_query_players():
       return None
+    try:
+      players = self._source_query.player()
+    except _QUERY_ERRORS as e:
+      UPDATE_ERRORS.labels(type(e).__name__).inc()
+      players = None
+    if players is None:
+      self._back_off()
+    return players
+
+  def _update(self):
+    phase_hook = self._phase_hook
+    if phase_hook is not None:
+      phase_hook.enter(PHASE_QUERY, monotonic())
+    players = self._query_players()
+    poll_time = monotonic()
+    if phase_hook is not None:
+      phase_hook.exit(PHASE_QUERY, poll_time)
+    if players is None:
+      return None
+    if self._recorder is not None:
+      self._recorder.record(time.time(), players)
+
+    intern = self._name_table.intern
+    updated_players = {
+        intern(player['name']): Player(player['kills'], player['time'])
+          for player in players
+    }
 
     player_kills = self._update_players(updated_players)
+    TRACKED_PLAYERS.labels(self._server_label).set(len(self._players))
+    if self._adaptive_interval is not None:
+      self._adapt_interval(player_kills, poll_time)
     if player_kills is None:
       return None
-    return self._rank_players(player_kills)
 
+    if phase_hook is not None:
+      phase_hook.enter(PHASE_RANK, monotonic())
+    with RANK_SECONDS.time():
+      # Also keep the ranks by new kills and by stddevs for player_stats.
+      self._player_ranks = self._rank_players_each_way(player_kills)
+    if phase_hook is not None:
+      phase_hook.exit(PHASE_RANK, monotonic())
+    return self._resolve_names(self._player_ranks.combined_ranks)
+
+  def update(self):
+    """Queries the server and updates its players.
+
+    Returns a map from each player name to its rank, or None if there is
+    nothing to rank.
+    """
+    if self._profiler is not None:
+      return self._profiler.call(self._update)
+    return self._update()
@@ -0,0 +1,107 @@
+"""Benchmarks of Monitor.
+
+Reports the memory used by each tracked player, the time to update and rank the
+players of a server for a poll, and the time to select the best players for
+spectating with top_k compared to ranking all players.
+
+Run with: python monitor_bench.py
+"""
+
+import random
+import sys
+import timeit
+
+from monitor import Monitor, Player
+
+
+def tracked_player_size(tracked_player):
+  """Returns the bytes used by a tracked player, excluding referenced integers."""
+  size = sys.getsizeof(tracked_player)
+  new_kills_dist = tracked_player.new_kills_dist
+  size += sys.getsizeof(new_kills_dist)
+  if new_kills_dist.histogram is not None:
+    size += sys.getsizeof(new_kills_dist.histogram)
+  return size
+
+def make_polls(num_players, num_polls, seed=0):
+  """Returns a sequence of updates from the server for consecutive polls.
+
+  Each update is a map of player names to Player instances.
+  """
+  rng = random.Random(seed)
+  kills = [0] * num_players
+  polls = []
+  for i in xrange(num_polls):
+    for j in xrange(num_players):
+      kills[j] += rng.randint(0, 3)
+    polls.append({'player_name%d' % j: Player(kills[j], 20.0 * (i + 1))
+        for j in xrange(num_players)})
+  return polls
+
+def update_and_rank(polls, stddev_weight=50):
+  """Updates and ranks the players of a new Monitor for each poll."""
+  monitor = Monitor(None, -1, -1)
+  monitor.set_stddev_weight(stddev_weight)
+  intern = monitor._name_table.intern
+  for updated_players in polls:
+    # Intern each name, as Monitor.update does.
+    updated_players = {intern(player_name): player
+        for player_name, player in updated_players.iteritems()}
+    player_kills = monitor._update_players(updated_players)
+    if player_kills is not None:
+      monitor._resolve_names(monitor.rank_players(player_kills))
+  return monitor
+
+def rank_all(monitor, player_kills_by_poll):
+  for player_kills in player_kills_by_poll:
+    monitor._player_kills = player_kills
+    monitor.rank_players(player_kills)
+
+def select_top_k(monitor, player_kills_by_poll, k):
+  for player_kills in player_kills_by_poll:
+    monitor._player_kills = player_kills
+    monitor.top_k(k)
+
+def bench_top_k(num_players, num_polls, k=3, stddev_weight=50):
+  """Returns the secs per poll to rank all players and to select the top k."""
+  monitor = Monitor(None, -1, -1)
+  monitor.set_stddev_weight(stddev_weight)
+  player_kills_by_poll = []
+  intern = monitor._name_table.intern
+  for updated_players in make_polls(num_players, num_polls):
+    updated_players = {intern(player_name): player
+        for player_name, player in updated_players.iteritems()}
+    player_kills = monitor._update_players(updated_players)
+    if player_kills is not None:
+      player_kills_by_poll.append(player_kills)
+
+  num_rankings = len(player_kills_by_poll)
+  rank_secs = min(timeit.repeat(
+      lambda: rank_all(monitor, player_kills_by_poll), number=1, repeat=5))
+  top_k_secs = min(timeit.repeat(
+      lambda: select_top_k(monitor, player_kills_by_poll, k),
+      number=1, repeat=5))
+  return rank_secs / num_rankings, top_k_secs / num_rankings
+
+
+def main():
+  monitor = update_and_rank(make_polls(32, 10))
+  sizes = [tracked_player_size(tracked_player)
+      for tracked_player in monitor._players.itervalues()]
+  print 'bytes per tracked player: %d' % max(sizes)
+
+  num_polls = 100
+  for num_players in (32, 64, 100):
+    polls = make_polls(num_players, num_polls)
+    secs = min(timeit.repeat(lambda: update_and_rank(polls), number=1, repeat=5))
+    print '%3d players  update and rank %8.1f usecs/poll' % (
+        num_players, 1e6 * secs / num_polls)
+
+  for num_players in (32, 64, 100):
+    rank_secs, top_k_secs = bench_top_k(num_players, num_polls)
+    print '%3d players  rank all %8.1f usecs  top 3 %8.1f usecs' % (
+        num_players, 1e6 * rank_secs, 1e6 * top_k_secs)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,256 @@
+"""Monitors many servers across worker processes.
+
+MonitorPool shards servers across worker processes, each of which polls many
+Monitors on its own Scheduler. A worker polls each Monitor when it is due, and
+after each update that ranks players, it sends the best players of that server
+over its pipe. A thread of the parent process receives them, and keeps the
+latest ranking of each server. The leaderboard ranks the best players of all
+servers against each other, by their new kills and their standard deviations
+like Monitor does for the players of one server.
+
+Servers are added to the worker with the fewest servers, and may be added or
+removed while the pool runs. A worker writes the traceback of a failed poll to
+stderr and keeps polling, and a worker process that exits is replaced. A worker
+polls its servers one at a time, so a server that does not reply delays the
+others of its worker by up to the query timeout.
+"""
+
+from collections import namedtuple
+import functools
+import multiprocessing
+import select
+import sys
+import threading
+import time
+
+from monitor import Monitor, PlayerKills
+from scheduler import Scheduler
+
+
+# A player among the best players of a server.
+ServerPlayer = namedtuple('ServerPlayer', ['name', 'rank', 'new_kills', 'num_stddevs'])
+# The best players of a server after an update, with the wall clock time.
+ServerRanking = namedtuple('ServerRanking', ['address', 'timestamp', 'players'])
+# A player in the leaderboard across all servers.
+LeaderboardEntry = namedtuple('LeaderboardEntry',
+    ['rank', 'address', 'name', 'new_kills', 'num_stddevs'])
+
+_ADD = 'add'
+_REMOVE = 'remove'
+
+
+def _server_ranking(address, monitor, k):
+  """Returns the ServerRanking of the best k players of the monitor."""
+  player_kills_by_name = {monitor.player_name(player_kill.player_id): player_kill
+      for player_kill in monitor.player_kills()}
+  players = []
+  for top_player in monitor.top_k(k):
+    player_kill = player_kills_by_name[top_player.name]
+    players.append(ServerPlayer(top_player.name, top_player.rank,
+        player_kill.new_kills, player_kill.num_stddevs))
+  return ServerRanking(address, time.time(), players)
+
+def _poll(conn, address, monitor, k):
+  """Updates the monitor, and sends the best players if it ranked players."""
+  if monitor.update() is not None:
+    conn.send(_server_ranking(address, monitor, k))
+
+def _run_worker(conn, poll_secs, stddev_weight, k):
+  """Polls the servers added over the pipe, until None is received."""
+  scheduler = Scheduler()
+  jobs = {}
+  while True:
+    timeout = scheduler.run_pending()
+    if not conn.poll(timeout):
+      continue
+    message = conn.recv()
+    if message is None:
+      break
+    command, address = message
+    if command == _ADD and address not in jobs:
+      monitor = Monitor(address[0], address[1], poll_secs)
+      monitor.set_stddev_weight(stddev_weight)
+      jobs[address] = scheduler.schedule(
+          0, functools.partial(_poll, conn, address, monitor, k),
+          name='%s:%d' % address, interval=monitor.next_interval_secs)
+    elif command == _REMOVE and address in jobs:
+      scheduler.cancel(jobs.pop(address))
+  conn.close()
+
+
+class _Shard(object):
+  """A worker process and the parent end of its pipe."""
+
+  def __init__(self, poll_secs, stddev_weight, k):
+    self.conn, child_conn = multiprocessing.Pipe()
+    self.process = multiprocessing.Process(target=_run_worker,
+        args=(child_conn, poll_secs, stddev_weight, k), name='MonitorPoolWorker')
+    self.process.daemon = True
+    self.addresses = set()
+    # Serializes sends from the threads that add and remove servers.
+    self.send_lock = threading.Lock()
+
+  def send(self, message):
+    with self.send_lock:
+      try:
+        self.conn.send(message)
+      except IOError:
+        # The worker exited, and its replacement is sent all of its servers.
+        pass
+
+
+class MonitorPool(object):
+  """Polls many servers across worker processes, and ranks their best players.
+
+  Parameter processes is the number of worker processes, or None for one per
+  CPU.
+  Parameter poll_secs is the seconds between polls of each server.
+  Parameter k is the number of best players of each server to rank across
+  servers, along with any players tied with them.
+  """
+
+  def __init__(self, processes=None, poll_secs=20, stddev_weight=50, k=3):
+    if processes is None:
+      processes = multiprocessing.cpu_count()
+    self._shard_args = (poll_secs, stddev_weight, k)
+    self._shards = [_Shard(*self._shard_args) for i in xrange(processes)]
+    self._lock = threading.Lock()
+    self._shards_by_address = {}
+    self._rankings = {}
+    # Ranks the best players across servers, but never queries a server.
+    self._ranker = Monitor(None, -1, -1)
+    self._ranker.set_stddev_weight(stddev_weight)
+    self._receiver = None
+    self._running = False
+    # The number of worker processes that exited and were replaced.
+    self.num_restarts = 0
+
+  def start(self):
+    """Starts the worker processes, and the thread that receives rankings."""
+    for shard in self._shards:
+      shard.process.start()
+    self._running = True
+    self._receiver = threading.Thread(target=self._receive, name='MonitorPoolReceiver')
+    self._receiver.daemon = True
+    self._receiver.start()
+
+  def stop(self):
+    """Stops the worker processes and the receiving thread."""
+    self._running = False
+    # Join the receiving thread first, so that it does not replace a worker.
+    if self._receiver:
+      self._receiver.join()
+      self._receiver = None
+    for shard in self._shards:
+      if shard.process.is_alive():
+        shard.send(None)
+    for shard in self._shards:
+      shard.process.join()
+    for shard in self._shards:
+      shard.conn.close()
+
+  def _restart_shard(self, shard):
+    """Replaces a worker process that exited, and polls its servers again.
+
+    Returns the new _Shard instance.
+    """
+    shard.process.join()
+    sys.stderr.write('MonitorPool worker %d exited with code %s, restarting it\n' %
+        (shard.process.pid, shard.process.exitcode))
+    new_shard = _Shard(*self._shard_args)
+    new_shard.process.start()
+    with self._lock:
+      new_shard.addresses = shard.addresses
+      for address in new_shard.addresses:
+        self._shards_by_address[address] = new_shard
+      self._shards[self._shards.index(shard)] = new_shard
+      self.num_restarts += 1
+      addresses = list(new_shard.addresses)
+    shard.conn.close()
+    for address in addresses:
+      new_shard.send((_ADD, address))
+    return new_shard
+
+  def _receive(self):
+    shards = {shard.conn.fileno(): shard for shard in self._shards}
+    while self._running:
+      readable, _, _ = select.select(list(shards), [], [], 0.1)
+      for fileno in readable:
+        shard = shards[fileno]
+        try:
+          server_ranking = shard.conn.recv()
+        except EOFError:
+          # The worker exited, so replace it unless the pool is stopping.
+          del shards[fileno]
+          if self._running:
+            shard = self._restart_shard(shard)
+            shards[shard.conn.fileno()] = shard
+          continue
+        with self._lock:
+          # Discard a ranking sent before its server was removed.
+          if server_ranking.address in self._shards_by_address:
+            self._rankings[server_ranking.address] = server_ranking
+
+  def add_server(self, host, port):
+    """Starts polling the server, if not already polled."""
+    address = (host, port)
+    with self._lock:
+      if address in self._shards_by_address:
+        return
+      shard = min(self._shards, key=lambda shard: len(shard.addresses))
+      shard.addresses.add(address)
+      self._shards_by_address[address] = shard
+    shard.send((_ADD, address))
+
+  def remove_server(self, host, port):
+    """Stops polling the server, and discards its ranking."""
+    address = (host, port)
+    with self._lock:
+      shard = self._shards_by_address.pop(address, None)
+      if shard is None:
+        return
+      shard.addresses.discard(address)
+      self._rankings.pop(address, None)
+    shard.send((_REMOVE, address))
+
+  def servers(self):
+    """Returns the address of each polled server."""
+    with self._lock:
+      return sorted(self._shards_by_address)
+
+  def rankings(self):
+    """Returns a map from the address of each server to its latest ServerRanking."""
+    with self._lock:
+      return dict(self._rankings)
+
+  def leaderboard(self, n=10, max_age_secs=None):
+    """Returns the best players across all servers.
+
+    Parameter n is the number of players to return, along with any players tied
+    with the last of them.
+    Parameter max_age_secs is the age beyond which the ranking of a server is
+    ignored, or None to use the latest ranking of each server.
+
+    Returns a list of LeaderboardEntry instances in order of rank.
+    """
+    now = time.time()
+    candidates = []
+    for server_ranking in self.rankings().itervalues():
+      if max_age_secs is not None and now - server_ranking.timestamp > max_age_secs:
+        continue
+      for player in server_ranking.players:
+        candidates.append((server_ranking.address, player))
+    if not candidates:
+      return []
+
+    # The index of each candidate is its id for ranking.
+    player_kills = [PlayerKills(i, player.new_kills, player.num_stddevs)
+        for i, (address, player) in enumerate(candidates)]
+    ranks = self._ranker.rank_players(player_kills)
+    entries = sorted(
+        LeaderboardEntry(ranks[i], address, player.name, player.new_kills,
+            player.num_stddevs)
+          for i, (address, player) in enumerate(candidates))
+    if len(entries) > n:
+      entries = [entry for entry in entries if entry.rank <= entries[n - 1].rank]
+    return entries
@@ -0,0 +1,103 @@
+import StringIO
+import sys
+import time
+import unittest
+
+from fake_server import FakeSourceServer
+from monitor_pool import *
+
+
+class MonitorPoolTest(unittest.TestCase):
+  """Test case for MonitorPool against FakeSourceServer instances."""
+
+  def setUp(self):
+    self.servers = []
+    for num_players in (3, 4, 5):
+      server = FakeSourceServer(num_players=num_players)
+      # Give each player kills on every poll.
+      for player in server.players:
+        player.kills_per_sec = 100
+      server.start()
+      self.addCleanup(server.stop)
+      self.servers.append(server)
+    self.addresses = [server.address for server in self.servers]
+
+    self.pool = MonitorPool(processes=2, poll_secs=0.05, k=2)
+    self.pool.start()
+    self.addCleanup(self.pool.stop)
+
+  def _wait_for_rankings(self, addresses):
+    deadline = time.time() + 10
+    while time.time() < deadline:
+      if set(addresses) <= set(self.pool.rankings()):
+        return
+      time.sleep(0.05)
+    self.fail('No rankings for %s' % (addresses,))
+
+  def test_rankings(self):
+    for host, port in self.addresses:
+      self.pool.add_server(host, port)
+    self.assertEqual(sorted(self.addresses), self.pool.servers())
+    self._wait_for_rankings(self.addresses)
+
+    for address, server_ranking in self.pool.rankings().iteritems():
+      self.assertEqual(address, server_ranking.address)
+      self.assertGreaterEqual(len(server_ranking.players), 2)
+      self.assertEqual(1, server_ranking.players[0].rank)
+
+    leaderboard = self.pool.leaderboard(n=3)
+    self.assertGreaterEqual(len(leaderboard), 3)
+    self.assertEqual(1, leaderboard[0].rank)
+    self.assertEqual(sorted(leaderboard), leaderboard)
+
+  def test_remove_server(self):
+    for host, port in self.addresses[:2]:
+      self.pool.add_server(host, port)
+    self._wait_for_rankings(self.addresses[:2])
+
+    self.pool.remove_server(*self.addresses[0])
+    self.assertNotIn(self.addresses[0], self.pool.rankings())
+    self.assertEqual([self.addresses[1]], self.pool.servers())
+    # Its worker stops polling the removed server.
+    time.sleep(0.2)
+    num_requests = self.servers[0].num_requests
+    time.sleep(0.2)
+    self.assertEqual(num_requests, self.servers[0].num_requests)
+
+    # A server may be added while the pool runs.
+    self.pool.add_server(*self.addresses[2])
+    self._wait_for_rankings(self.addresses[1:])
+    self.assertTrue(all(entry.address != self.addresses[0]
+        for entry in self.pool.leaderboard(max_age_secs=60)))
+
+  def test_restart_worker(self):
+    for host, port in self.addresses:
+      self.pool.add_server(host, port)
+    self._wait_for_rankings(self.addresses)
+
+    stderr = sys.stderr
+    sys.stderr = StringIO.StringIO()
+    try:
+      self.pool._shards[0].process.terminate()
+      deadline = time.time() + 10
+      while not self.pool.num_restarts and time.time() < deadline:
+        time.sleep(0.05)
+      self.assertEqual(1, self.pool.num_restarts)
+      self.assertIn('restarting', sys.stderr.getvalue())
+    finally:
+      sys.stderr = stderr
+
+    # The servers of the replaced worker are polled again.
+    restart_time = time.time()
+    deadline = restart_time + 10
+    while time.time() < deadline:
+      if all(server_ranking.timestamp > restart_time
+          for server_ranking in self.pool.rankings().itervalues()):
+        break
+      time.sleep(0.05)
+    else:
+      self.fail('No rankings after the worker was replaced')
+
+
+if __name__ == '__main__':
+  unittest.main()
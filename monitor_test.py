@@ -1,27 +1,49 @@
+import functools
+import os
+import random
+import shutil
+import tempfile
+import time
 import unittest
 
+from fake_server import FakePlayer, FakeSourceServer
 from monitor import *
+from recording import PollRecorder, PollRecording, RecordedPlayer, Snapshot
 
 
 class FrequencyDistributionTest(unittest.TestCase):
   """Test case for Frequencies."""
 
   def setUp(self):
-    self.freq_dist = FrequencyDistribution()
+    self.freq_dist = FrequencyDistribution(keep_histogram=True)
 
   def test_add_value(self):
-    self.assertSequenceEqual([], self.freq_dist._freqs)
+    self.assertSequenceEqual([], self.freq_dist.histogram)
 
     self.freq_dist.add_value(0)
-    self.assertSequenceEqual([1], self.freq_dist._freqs)
+    self.assertSequenceEqual([1], self.freq_dist.histogram)
     self.freq_dist.add_value(0)
-    self.assertSequenceEqual([2], self.freq_dist._freqs)
+    self.assertSequenceEqual([2], self.freq_dist.histogram)
 
     self.freq_dist.add_value(3)
-    self.assertSequenceEqual([2, 0, 0, 1], self.freq_dist._freqs)
+    self.assertSequenceEqual([2, 0, 0, 1], self.freq_dist.histogram)
 
     self.freq_dist.add_value(4)
-    self.assertSequenceEqual([2, 0, 0, 1, 1], self.freq_dist._freqs)
+    self.assertSequenceEqual([2, 0, 0, 1, 1], self.freq_dist.histogram)
+    self.assertEqual(4, self.freq_dist.num_values)
+
+  def test_no_histogram(self):
+    freq_dist = FrequencyDistribution()
+    freq_dist.add_value(3)
+    self.assertIsNone(freq_dist.histogram)
+    self.assertEqual(1, freq_dist.num_values)
+
+  def test_compute_mean(self):
+    self.assertIsNone(self.freq_dist.compute_mean())
+
+    for value in (2, 4, 4, 4, 5, 5, 7, 9):
+      self.freq_dist.add_value(value)
+    self.assertEqual(5.0, self.freq_dist.compute_mean())
 
   def test_compute_std_dev(self):
     self.assertIsNone(self.freq_dist.compute_std_dev())
@@ -31,6 +53,136 @@ class FrequencyDistributionTest(unittest.TestCase):
       self.freq_dist.add_value(value)
     self.assertEqual(2.0, self.freq_dist.compute_std_dev())
 
+  def test_merge(self):
+    for value in (2, 4, 4, 4):
+      self.freq_dist.add_value(value)
+    other_freq_dist = FrequencyDistribution(keep_histogram=True)
+    for value in (5, 5, 7, 9):
+      other_freq_dist.add_value(value)
+
+    self.freq_dist.merge(other_freq_dist)
+    self.assertEqual(8, self.freq_dist.num_values)
+    self.assertEqual(5.0, self.freq_dist.compute_mean())
+    self.assertEqual(2.0, self.freq_dist.compute_std_dev())
+    self.assertSequenceEqual(
+        [0, 0, 1, 0, 3, 2, 0, 1, 0, 1], self.freq_dist.histogram)
+    # The merged distribution is unchanged.
+    self.assertEqual(4, other_freq_dist.num_values)
+
+  def test_merge_without_histogram(self):
+    self.freq_dist.add_value(1)
+    other_freq_dist = FrequencyDistribution()
+    other_freq_dist.add_value(5)
+
+    self.freq_dist.merge(other_freq_dist)
+    self.assertEqual(2.0, self.freq_dist.compute_std_dev())
+    self.assertIsNone(self.freq_dist.histogram)
+
+
+class SlidingWindowDistributionTest(unittest.TestCase):
+  """Test case for SlidingWindowDistribution."""
+
+  def setUp(self):
+    self.dist = SlidingWindowDistribution(4)
+
+  def test_compute_std_dev(self):
+    self.assertIsNone(self.dist.compute_std_dev())
+    for value in (1, 5):
+      self.dist.add_value(value)
+    self.assertEqual(2, self.dist.num_values)
+    self.assertEqual(3.0, self.dist.compute_mean())
+    self.assertEqual(2.0, self.dist.compute_std_dev())
+
+  def test_window(self):
+    # The first four values are evicted by the last four.
+    for value in (100, 100, 100, 100, 2, 4, 4, 6):
+      self.dist.add_value(value)
+    self.assertEqual(4, self.dist.num_values)
+    self.assertEqual(4.0, self.dist.compute_mean())
+    self.assertAlmostEqual(math.sqrt(2), self.dist.compute_std_dev())
+
+
+class DecayedDistributionTest(unittest.TestCase):
+  """Test case for DecayedDistribution."""
+
+  def test_no_values(self):
+    dist = DecayedDistribution(10)
+    self.assertIsNone(dist.compute_mean())
+    self.assertIsNone(dist.compute_std_dev())
+
+  def test_long_half_life(self):
+    # With a very long half-life, all values have nearly equal weight.
+    dist = DecayedDistribution(1e12)
+    for value in (2, 4, 4, 4, 5, 5, 7, 9):
+      dist.add_value(value)
+    self.assertAlmostEqual(5.0, dist.compute_mean())
+    self.assertAlmostEqual(2.0, dist.compute_std_dev())
+
+  def test_decay(self):
+    dist = DecayedDistribution(1)
+    dist.add_value(0)
+    dist.add_value(3)
+    # The first value has half the weight of the second.
+    self.assertAlmostEqual(2.0, dist.compute_mean())
+    self.assertAlmostEqual(math.sqrt(2), dist.compute_std_dev())
+
+    # Old values are forgotten.
+    for i in xrange(50):
+      dist.add_value(1)
+    self.assertAlmostEqual(1.0, dist.compute_mean())
+    self.assertAlmostEqual(0.0, dist.compute_std_dev())
+
+
+class AdaptiveIntervalTest(unittest.TestCase):
+  """Test case for AdaptiveInterval."""
+
+  def setUp(self):
+    self.interval = AdaptiveInterval(5, 60, target_new_kills=10)
+
+  def test_back_off(self):
+    self.assertEqual(5, self.interval.secs)
+    self.assertEqual(10, self.interval.back_off())
+    self.assertEqual(20, self.interval.add_new_kills(0, 10))
+    self.assertEqual(40, self.interval.back_off())
+    self.assertEqual(60, self.interval.back_off())
+
+  def test_add_new_kills(self):
+    # 10 kills in 20 seconds.
+    self.assertEqual(20, self.interval.add_new_kills(10, 20))
+    # 100 kills in 20 seconds.
+    self.assertEqual(5, self.interval.add_new_kills(100, 20))
+    # 1 kill in 60 seconds.
+    self.assertEqual(60, self.interval.add_new_kills(1, 60))
+
+
+class InfoGateTest(unittest.TestCase):
+  """Test case for InfoGate."""
+
+  def setUp(self):
+    self.info_gate = InfoGate(max_idle_skips=2)
+
+  def test_empty(self):
+    self.assertEqual(InfoGate.SKIP_EMPTY, self.info_gate.check('cp_badlands', 0, False))
+    self.assertEqual(InfoGate.QUERY, self.info_gate.check('cp_badlands', 4, False))
+    self.assertEqual(1, self.info_gate.num_saved_queries)
+
+  def test_idle(self):
+    self.assertEqual(InfoGate.QUERY, self.info_gate.check('cp_badlands', 4, True))
+    self.assertEqual(InfoGate.SKIP_IDLE, self.info_gate.check('cp_badlands', 4, True))
+    self.assertEqual(InfoGate.SKIP_IDLE, self.info_gate.check('cp_badlands', 4, True))
+    # Players are queried after too many skips in a row.
+    self.assertEqual(InfoGate.QUERY, self.info_gate.check('cp_badlands', 4, True))
+    self.assertEqual(InfoGate.SKIP_IDLE, self.info_gate.check('cp_badlands', 4, True))
+    # Players are queried if the number of players changes, or if not idle.
+    self.assertEqual(InfoGate.QUERY, self.info_gate.check('cp_badlands', 5, True))
+    self.assertEqual(InfoGate.QUERY, self.info_gate.check('cp_badlands', 5, False))
+    self.assertEqual(3, self.info_gate.num_saved_queries)
+
+  def test_map_changed(self):
+    self.assertEqual(InfoGate.QUERY, self.info_gate.check('cp_badlands', 4, False))
+    self.assertEqual(InfoGate.MAP_CHANGED, self.info_gate.check('cp_granary', 4, False))
+    self.assertEqual(InfoGate.QUERY, self.info_gate.check('cp_granary', 4, False))
+
 
 class TrackedPlayerTest(unittest.TestCase):
   def setUp(self):
@@ -82,6 +234,25 @@ class TrackedPlayerTest(unittest.TestCase):
     # Assert that the distribution is unchanged.
     self.assertEqual(stddev, self.player._new_kills_dist.compute_std_dev())
 
+  def test_update_zero_stddev(self):
+    self.player.add_new_kills(2)
+    self.player.add_new_kills(2)
+    # The burst after a flat history is measured against the least stddev.
+    new_kills, num_stddevs = self.player.update(
+        self.first_kills + 8, self.first_connect_duration + 5)
+    self.assertEqual(8, new_kills)
+    self.assertEqual(8 / MIN_STDDEV, num_stddevs)
+
+  def test_update_one_value(self):
+    # A player with no history scores no standard deviations.
+    new_kills, num_stddevs = self.player.update(
+        self.first_kills + 3, self.first_connect_duration + 5)
+    self.assertEqual(0, num_stddevs)
+    self.player.add_new_kills(3)
+    new_kills, num_stddevs = self.player.update(
+        self.first_kills + 8, self.first_connect_duration + 10)
+    self.assertEqual(5 / MIN_STDDEV, num_stddevs)
+
 
 class MonitorTest(unittest.TestCase):
   """Test case for Monitor."""
@@ -89,10 +260,10 @@ class MonitorTest(unittest.TestCase):
   def setUp(self):
     self.monitor = Monitor(None, -1, -1)
 
-  def _assert_player_kills(self, player_kills, name, new_kills, num_stddevs):
+  def _assert_player_kills(self, player_kills, player_id, new_kills, num_stddevs):
     """Asserts the values in a PlayerKills instance."""
     self.assertIsNotNone(player_kills)
-    self.assertEqual(name, player_kills.name)
+    self.assertEqual(player_id, player_kills.player_id)
     self.assertEqual(new_kills, player_kills.new_kills)
     self.assertEqual(num_stddevs, player_kills.num_stddevs)
 
@@ -102,18 +273,18 @@ class MonitorTest(unittest.TestCase):
     Both an existing player and a new player have new kills, but this is the first update.
     """
     # Create two new players.
-    player_name1 = 'player_name1'
-    player_name2 = 'player_name2'
+    player_id1 = 1
+    player_id2 = 2
     player1 = Player(1, 60)
     player2 = Player(3, 60)
-    updated_players = {player_name1: player1, player_name2: player2}
+    updated_players = {player_id1: player1, player_id2: player2}
 
     all_player_kills, have_new_kills = self.monitor._get_new_kills(
         updated_players, True)
     # No new kills because first update.
     self.assertEqual(2, len(all_player_kills))
-    self._assert_player_kills(all_player_kills[0], player_name1, 0, 0)
-    self._assert_player_kills(all_player_kills[1], player_name2, 0, 0)
+    self._assert_player_kills(all_player_kills[0], player_id1, 0, 0)
+    self._assert_player_kills(all_player_kills[1], player_id2, 0, 0)
     self.assertFalse(have_new_kills)
 
   def test_no_new_kills(self):
@@ -122,27 +293,27 @@ class MonitorTest(unittest.TestCase):
     Both an existing player and a new player have no new kills.
     """
     # Add an existing player to the monitor.
-    player_name1 = 'player_name1'
+    player_id1 = 1
     player1_first_kills = 10
     player1_first_connect_duration = 200
     tracked_player1 = TrackedPlayer(player1_first_kills, player1_first_connect_duration)
     for new_kills in (2, 2, 3, 3):
       tracked_player1.add_new_kills(new_kills)
-    self.monitor._players[player_name1] = tracked_player1
+    self.monitor._players[player_id1] = tracked_player1
 
     # The existing player has no new kills.
     player1 = Player(player1_first_kills, player1_first_connect_duration + 5)
     # The new player has no kills.
-    player_name2 = 'player_name2'
+    player_id2 = 2
     player2 = Player(0, 30)
-    updated_players = {player_name1: player1, player_name2: player2}
+    updated_players = {player_id1: player1, player_id2: player2}
 
     all_player_kills, have_new_kills = self.monitor._get_new_kills(
         updated_players, False)
     # No new kills because first update.
     self.assertEqual(2, len(all_player_kills))
-    self._assert_player_kills(all_player_kills[0], player_name1, 0, 0)
-    self._assert_player_kills(all_player_kills[1], player_name2, 0, 0)
+    self._assert_player_kills(all_player_kills[0], player_id1, 0, 0)
+    self._assert_player_kills(all_player_kills[1], player_id2, 0, 0)
     self.assertFalse(have_new_kills)
 
   def test_existing_player_new_kills(self):
@@ -151,30 +322,30 @@ class MonitorTest(unittest.TestCase):
     Only the existing player has new kills.
     """
     # Add an existing player to the monitor.
-    player_name1 = 'player_name1'
+    player_id1 = 1
     player1_first_kills = 10
     player1_first_connect_duration = 200
     tracked_player1 = TrackedPlayer(player1_first_kills, player1_first_connect_duration)
     for new_kills in (2, 2, 3, 3):
       tracked_player1.add_new_kills(new_kills)
-    self.monitor._players[player_name1] = tracked_player1
+    self.monitor._players[player_id1] = tracked_player1
 
     # The existing player has no new kills.
     player1_new_kills = 1
     player1 = Player(
         player1_first_kills + player1_new_kills, player1_first_connect_duration + 5)
     # The new player has no kills.
-    player_name2 = 'player_name2'
+    player_id2 = 2
     player2 = Player(0, 30)
-    updated_players = {player_name1: player1, player_name2: player2}
+    updated_players = {player_id1: player1, player_id2: player2}
 
     all_player_kills, have_new_kills = self.monitor._get_new_kills(
         updated_players, False)
     # No new kills because first update.
     self.assertEqual(2, len(all_player_kills))
     self._assert_player_kills(
-        all_player_kills[0], player_name1, player1_new_kills, 2)
-    self._assert_player_kills(all_player_kills[1], player_name2, 0, 0)
+        all_player_kills[0], player_id1, player1_new_kills, 2)
+    self._assert_player_kills(all_player_kills[1], player_id2, 0, 0)
     self.assertTrue(have_new_kills)
 
   def test_new_player_new_kills(self):
@@ -183,64 +354,74 @@ class MonitorTest(unittest.TestCase):
     Only the new player has new kills.
     """
     # Add an existing player to the monitor.
-    player_name1 = 'player_name1'
+    player_id1 = 1
     player1_first_kills = 10
     player1_first_connect_duration = 200
     tracked_player1 = TrackedPlayer(player1_first_kills, player1_first_connect_duration)
     for new_kills in (2, 2, 3, 3):
       tracked_player1.add_new_kills(new_kills)
-    self.monitor._players[player_name1] = tracked_player1
+    self.monitor._players[player_id1] = tracked_player1
 
     # The existing player has no new kills.
     player1 = Player(player1_first_kills, player1_first_connect_duration + 5)
     # The new player has kills.
-    player_name2 = 'player_name2'
+    player_id2 = 2
     player2 = Player(2, 30)
-    updated_players = {player_name1: player1, player_name2: player2}
+    updated_players = {player_id1: player1, player_id2: player2}
 
     all_player_kills, have_new_kills = self.monitor._get_new_kills(
         updated_players, False)
     # No new kills because first update.
     self.assertEqual(2, len(all_player_kills))
-    self._assert_player_kills(all_player_kills[0], player_name1, 0, 0)
-    self._assert_player_kills(all_player_kills[1], player_name2, player2.kills, 0)
+    self._assert_player_kills(all_player_kills[0], player_id1, 0, 0)
+    self._assert_player_kills(all_player_kills[1], player_id2, player2.kills, 0)
     self.assertTrue(have_new_kills)
 
-  def _assert_tracked_player(self, tracked_player, kills, connect_duration, new_kills_dist):
-    """Asserts the values in a TrackedPlayer instance."""
+  def _assert_tracked_player(self, tracked_player, kills, connect_duration, new_kills):
+    """Asserts the values in a TrackedPlayer instance.
+
+    Parameter new_kills is the sequence of values expected in the distribution of
+    new kills.
+    """
     self.assertIsNotNone(tracked_player)
     self.assertEqual(kills, tracked_player.kills)
     self.assertEqual(connect_duration, tracked_player.connect_duration)
-    self.assertSequenceEqual(new_kills_dist, tracked_player._new_kills_dist._freqs)
+    expected_dist = FrequencyDistribution()
+    for value in new_kills:
+      expected_dist.add_value(value)
+    new_kills_dist = tracked_player._new_kills_dist
+    self.assertEqual(expected_dist.num_values, new_kills_dist.num_values)
+    self.assertEqual(expected_dist.compute_mean(), new_kills_dist.compute_mean())
+    self.assertEqual(expected_dist.compute_std_dev(), new_kills_dist.compute_std_dev())
 
   def test_update_player_kills_first_update(self):
     """Tests that _update_player_kills updates the new kill distribution of players.
 
     Both players have new kills, but this is the first update.
     """
-    player_name1 = 'player_name1'
-    player_name2 = 'player_name2'
+    player_id1 = 1
+    player_id2 = 2
     kills1 = 1
     kills2 = 2
     connect_duration1 = 30
     connect_duration2 = 40
     updated_players = {
-        player_name1: Player(kills1, connect_duration1),
-        player_name2: Player(kills2, connect_duration2),
+        player_id1: Player(kills1, connect_duration1),
+        player_id2: Player(kills2, connect_duration2),
     }
     all_player_kills = [
-        PlayerKills(player_name1, kills1, 0),
-        PlayerKills(player_name2, kills2, 0),
+        PlayerKills(player_id1, kills1, 0),
+        PlayerKills(player_id2, kills2, 0),
     ]
     # This is the first update, so will not add to kill distribution.
     self.monitor._update_player_kills(updated_players, True, all_player_kills)
 
     self.assertEqual(2, len(self.monitor._players))
     # Assert that first player exists, but kill distribution is empty.
-    tracked_player = self.monitor._players[player_name1]
+    tracked_player = self.monitor._players[player_id1]
     self._assert_tracked_player(tracked_player, kills1, connect_duration1, [])
     # Assert that second player exists, but kill distribution is empty.
-    tracked_player = self.monitor._players[player_name2]
+    tracked_player = self.monitor._players[player_id2]
     self._assert_tracked_player(tracked_player, kills2, connect_duration2, [])
 
   def test_update_player_kills_not_first_update(self):
@@ -249,46 +430,71 @@ class MonitorTest(unittest.TestCase):
     An existing player and a new player have new kills, and this is not the first update.
     """
     # Add an existing player.
-    player_name1 = 'player_name1'
+    player_id1 = 1
     kills1 = 5
     connect_duration1 = 30
     tracked_player = TrackedPlayer(kills1, connect_duration1)
-    self.monitor._players[player_name1] = tracked_player
+    self.monitor._players[player_id1] = tracked_player
 
     # Update contains existing player.
     new_kills1 = 2
     # Update also contains a new player.
-    player_name2 = 'player_name2'
+    player_id2 = 2
     kills2 = 1
     connect_duration2 = 10
     updated_players = {
-        player_name1: Player(kills1, connect_duration1),
-        player_name2: Player(kills2, connect_duration2),
+        player_id1: Player(kills1, connect_duration1),
+        player_id2: Player(kills2, connect_duration2),
     }
     all_player_kills = [
-        PlayerKills(player_name1, new_kills1, 0),
-        PlayerKills(player_name2, kills2, 0),
+        PlayerKills(player_id1, new_kills1, 0),
+        PlayerKills(player_id2, kills2, 0),
     ]
     # This is not the first update, so will add to kill distribution.
     self.monitor._update_player_kills(updated_players, False, all_player_kills)
 
     self.assertEqual(2, len(self.monitor._players))
     # Assert that existing player still exists, and kill distribution updated.
-    tracked_player = self.monitor._players[player_name1]
-    self._assert_tracked_player(tracked_player, kills1, connect_duration1, [0, 0, 1])
+    tracked_player = self.monitor._players[player_id1]
+    self._assert_tracked_player(tracked_player, kills1, connect_duration1, [2])
     # Assert that new player exists, and kill distribution updated.
-    tracked_player = self.monitor._players[player_name2]
-    self._assert_tracked_player(tracked_player, kills2, connect_duration2, [0, 1])
+    tracked_player = self.monitor._players[player_id2]
+    self._assert_tracked_player(tracked_player, kills2, connect_duration2, [1])
 
   def test_remove_disconnected_players(self):
-    player_name1 = 'player_name1'
-    player_name2 = 'player_name2'
-    player_name3 = 'player_name3'
-    self.monitor._players[player_name1] = TrackedPlayer(10, 11)
-    self.monitor._players[player_name2] = TrackedPlayer(20, 21)
-
-    updated_players = {player_name2: None, player_name3: None}
+    intern = self.monitor._name_table.intern
+    player_id1 = intern('player_name1')
+    player_id2 = intern('player_name2')
+    player_id3 = intern('player_name3')
+    self.monitor._players[player_id1] = TrackedPlayer(10, 11)
+    self.monitor._players[player_id2] = TrackedPlayer(20, 21)
+
+    updated_players = {player_id2: None, player_id3: None}
     self.monitor._remove_disconnected_players(updated_players)
+    self.assertItemsEqual([player_id2], self.monitor._players.keys())
+    # The id of the removed player is released.
+    self.assertNotIn('player_name1', self.monitor._name_table)
+
+  def test_update_players(self):
+    """Tests that _update_players tracks players from the first update."""
+    intern = self.monitor._name_table.intern
+    player_id1 = intern('player_name1')
+    player_id2 = intern('player_name2')
+    updated_players = {player_id1: Player(5, 30), player_id2: Player(2, 30)}
+    # The first update has nothing to rank, but tracks the players.
+    self.assertIsNone(self.monitor._update_players(updated_players))
+    self.assertItemsEqual([player_id1, player_id2], self.monitor._players.keys())
+
+    # No player has new kills.
+    updated_players = {player_id1: Player(5, 50), player_id2: Player(2, 50)}
+    self.assertIsNone(self.monitor._update_players(updated_players))
+
+    # The first player has new kills, and the second player disconnected.
+    updated_players = {player_id1: Player(8, 70)}
+    all_player_kills = self.monitor._update_players(updated_players)
+    self.assertEqual(1, len(all_player_kills))
+    self._assert_player_kills(all_player_kills[0], player_id1, 3, 0)
+    self.assertItemsEqual([player_id1], self.monitor._players.keys())
 
   def test_rank_players_by_attr_empty(self):
     players = []
@@ -299,43 +505,43 @@ class MonitorTest(unittest.TestCase):
     self.assertDictEqual({}, ranks_by_player)
 
   def test_rank_players_by_attr_single(self):
-    player_name = 'player_name'
-    players = [(player_name, 100)]
+    player_id = 1
+    players = [(player_id, 100)]
 
     name_getter = itemgetter(0)
     attr_getter = itemgetter(1)
     ranks_by_player = self.monitor._rank_players_by_attr(players, name_getter, attr_getter)
-    expected_ranks_by_player = {player_name: 1}
+    expected_ranks_by_player = {player_id: 1}
     self.assertDictEqual(expected_ranks_by_player, ranks_by_player)
 
   def test_rank_players_by_attr_multi(self):
-    player_name1 = 'player_name1'
-    player_name2 = 'player_name2'
-    player_name3 = 'player_name3'
-    player_name4 = 'player_name4'
+    player_id1 = 1
+    player_id2 = 2
+    player_id3 = 3
+    player_id4 = 4
     players = [
-        (player_name1, 150), (player_name2, 200), (player_name3, 150), (player_name4, 100)
+        (player_id1, 150), (player_id2, 200), (player_id3, 150), (player_id4, 100)
     ]
 
     name_getter = itemgetter(0)
     attr_getter = itemgetter(1)
     ranks_by_player = self.monitor._rank_players_by_attr(players, name_getter, attr_getter)
     expected_ranks_by_player = {
-        player_name1: 2,
-        player_name2: 1,
-        player_name3: 2,
-        player_name4: 4
+        player_id1: 2,
+        player_id2: 1,
+        player_id3: 2,
+        player_id4: 4
     }
     self.assertDictEqual(expected_ranks_by_player, ranks_by_player)
 
   def test_joint_rank(self):
     # Create three players.
-    player_name1 = 'player_name1'
-    player_name2 = 'player_name2'
-    player_name3 = 'player_name3'
+    player_id1 = 1
+    player_id2 = 2
+    player_id3 = 3
     # Kill ranks and stddev ranks are inverses.
-    kill_ranks = {player_name1: 1, player_name2: 2, player_name3: 3}
-    stddev_ranks = {player_name1: 3, player_name2: 2, player_name3: 1}
+    kill_ranks = {player_id1: 1, player_id2: 2, player_id3: 3}
+    stddev_ranks = {player_id1: 3, player_id2: 2, player_id3: 1}
 
     # Weight kill ranks more.
     self.monitor.set_stddev_weight(25)
@@ -350,9 +556,40 @@ class MonitorTest(unittest.TestCase):
     # Weight both ranks equally.
     self.monitor.set_stddev_weight(50)
     joint_ranks = self.monitor._joint_rank(kill_ranks, stddev_ranks)
-    expected_ranks = {player_name1: 1, player_name2: 1, player_name3: 1}
+    expected_ranks = {player_id1: 1, player_id2: 1, player_id3: 1}
     self.assertDictEqual(expected_ranks, joint_ranks)
 
+  def test_new_kills_dist_factory(self):
+    self.monitor.set_new_kills_dist_factory(functools.partial(SlidingWindowDistribution, 2))
+    updated_players = {1: Player(1, 30)}
+    all_player_kills = [PlayerKills(1, 1, 0)]
+    self.monitor._update_player_kills(updated_players, False, all_player_kills)
+
+    new_kills_dist = self.monitor._players[1]._new_kills_dist
+    self.assertIsInstance(new_kills_dist, SlidingWindowDistribution)
+    self.assertEqual(1, new_kills_dist.num_values)
+
+  def test_replay(self):
+    snapshots = [
+        Snapshot(0.0, [RecordedPlayer('player_name1', 0, 10), RecordedPlayer('player_name2', 0, 10)]),
+        Snapshot(20.0, [RecordedPlayer('player_name1', 2, 30), RecordedPlayer('player_name2', 1, 30)]),
+        Snapshot(40.0, [RecordedPlayer('player_name1', 2, 50), RecordedPlayer('player_name2', 1, 50)]),
+        Snapshot(60.0, [RecordedPlayer('player_name1', 2, 70), RecordedPlayer('player_name2', 4, 70)]),
+    ]
+    self.monitor.set_stddev_weight(0)
+    ranked_snapshots = list(self.monitor.replay(snapshots))
+
+    # The first snapshot has no new kills, and the third has no new kills.
+    self.assertEqual([20.0, 60.0], [ranked.timestamp for ranked in ranked_snapshots])
+    self.assertDictEqual(
+        {'player_name1': 1, 'player_name2': 2}, ranked_snapshots[0].ranks)
+    self.assertDictEqual(
+        {'player_name1': 2, 'player_name2': 1}, ranked_snapshots[1].ranks)
+    # The player kills are by name, which stays valid as ids are reused.
+    self.assertItemsEqual(
+        [PlayerKills('player_name1', 0, 0), PlayerKills('player_name2', 3, 6.0)],
+        ranked_snapshots[1].player_kills)
+
   def test_rank_players(self):
     # Create three players.
     player_name1 = 'player_name1'
@@ -367,7 +604,7 @@ class MonitorTest(unittest.TestCase):
 
     # Rank by kills.
     self.monitor.set_stddev_weight(0)
-    player_ranks = self.monitor._rank_players(player_kills)
+    player_ranks = self.monitor.rank_players(player_kills)
     expected_player_ranks = {
         player_name1: 1,
         player_name2: 2,
@@ -377,7 +614,7 @@ class MonitorTest(unittest.TestCase):
 
     # Rank by stddev.
     self.monitor.set_stddev_weight(100)
-    player_ranks = self.monitor._rank_players(player_kills)
+    player_ranks = self.monitor.rank_players(player_kills)
     expected_player_ranks = {
         player_name1: 3,
         player_name2: 2,
@@ -387,7 +624,7 @@ class MonitorTest(unittest.TestCase):
 
     # Joint rank.
     self.monitor.set_stddev_weight(50)
-    player_ranks = self.monitor._rank_players(player_kills)
+    player_ranks = self.monitor.rank_players(player_kills)
     expected_player_ranks = {
         player_name1: 1,
         player_name2: 1,
@@ -395,6 +632,248 @@ class MonitorTest(unittest.TestCase):
     }
     self.assertDictEqual(expected_player_ranks, player_ranks)
 
+  def test_resolve_names(self):
+    player_id1 = self.monitor._name_table.intern('player_name1')
+    player_id2 = self.monitor._name_table.intern('player_name2')
+    self.assertNotEqual(player_id1, player_id2)
+    self.assertEqual('player_name2', self.monitor.player_name(player_id2))
+    self.assertDictEqual({'player_name1': 2, 'player_name2': 1},
+        self.monitor._resolve_names({player_id1: 2, player_id2: 1}))
+
+  def test_top_k(self):
+    self.assertEqual([], self.monitor.top_k(3))
+    intern = self.monitor._name_table.intern
+    self.monitor._player_kills = [
+        PlayerKills(intern('player_name1'), 3, 1.0),
+        PlayerKills(intern('player_name2'), 5, 0.5),
+        PlayerKills(intern('player_name3'), 3, 2.0),
+        PlayerKills(intern('player_name4'), 1, 0.0),
+    ]
+
+    # The players tied for second place are both returned.
+    self.monitor.set_stddev_weight(0)
+    self.assertEqual([
+        RankedPlayer('player_name2', 1, 5),
+        RankedPlayer('player_name1', 2, 3),
+        RankedPlayer('player_name3', 2, 3),
+    ], self.monitor.top_k(2))
+    self.assertEqual(
+        [RankedPlayer('player_name2', 1, 5)], self.monitor.top_k(1))
+
+    self.monitor.set_stddev_weight(100)
+    self.assertEqual(
+        [RankedPlayer('player_name3', 1, 2.0)], self.monitor.top_k(1))
+    self.assertEqual(4, len(self.monitor.top_k(10)))
+
+  def test_top_k_agrees_with_rank_players(self):
+    rng = random.Random(0)
+    intern = self.monitor._name_table.intern
+    for stddev_weight in (0, 30, 50, 100):
+      self.monitor.set_stddev_weight(stddev_weight)
+      for i in xrange(20):
+        player_kills = [
+            PlayerKills(intern('player_name%d' % j), rng.randint(0, 4),
+                rng.randint(-2, 2) / 2.0)
+              for j in xrange(16)
+        ]
+        self.monitor._player_kills = player_kills
+        player_ranks = self.monitor._resolve_names(self.monitor.rank_players(player_kills))
+        for k in (1, 3):
+          expected_top_players = sorted((rank, name)
+              for name, rank in player_ranks.iteritems() if rank <= k)
+          self.assertEqual(expected_top_players,
+              [(top_player.rank, top_player.name)
+                for top_player in self.monitor.top_k(k)])
+
+
+class MonitorUpdateTest(unittest.TestCase):
+  """Test case for Monitor.update against a FakeSourceServer."""
+
+  def setUp(self):
+    self.server = FakeSourceServer(num_players=4)
+    self.server.start()
+    self.addCleanup(self.server.stop)
+    host, port = self.server.address
+    self.monitor = Monitor(host, port, -1)
+    self.monitor.set_stddev_weight(50)
+
+  def test_first_update_tracks_players(self):
+    # The kills of the first update are not new, so nothing is ranked.
+    self.assertIsNone(self.monitor.update())
+    self.assertEqual(
+        sorted(player.name for player in self.server.players),
+        sorted(self.monitor._name_table.name(player_id)
+          for player_id in self.monitor._players))
+
+    for player in self.server.players:
+      player.kills_per_sec = 100000
+    player_ranks = self.monitor.update()
+    self.assertEqual(4, len(player_ranks))
+
+  def test_equal_new_kills(self):
+    for player in self.server.players:
+      player.kills_per_sec = 0
+    self.monitor.update()
+    # Each player has the same new kills on each poll, so the standard
+    # deviation of their new kills is zero.
+    for i in xrange(3):
+      for player in self.server.players:
+        player.kills += 2
+      self.assertEqual(4, len(self.monitor.update()))
+    for player_stats in self.monitor.player_stats():
+      self.assertEqual(2, player_stats.new)
+      self.assertEqual(0, player_stats.stddev)
+
+  def test_record(self):
+    directory = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, directory)
+    path = os.path.join(directory, 'recording')
+    recorder = PollRecorder(path)
+    self.monitor.set_recorder(recorder)
+
+    self.monitor.update()
+    self.monitor.update()
+    recorder.close()
+
+    snapshots = list(PollRecording(path))
+    self.assertEqual(2, len(snapshots))
+    self.assertEqual(
+        [player.name for player in self.server.players],
+        [player.name for player in snapshots[1].players])
+
+  def test_adaptive_interval(self):
+    adaptive_interval = AdaptiveInterval(1, 64)
+    self.monitor.set_adaptive_interval(adaptive_interval)
+    # Without an InfoGate, only the players are queried.
+    num_requests = self.server.num_requests
+    self.monitor.update()
+    self.assertEqual(num_requests + 2, self.server.num_requests)
+    self.monitor.update()
+    self.assertEqual(num_requests + 3, self.server.num_requests)
+    # The players have no new kills, so the interval backs off.
+    self.assertEqual(2, self.monitor.next_interval_secs())
+
+  def test_adaptive_interval_info_gate(self):
+    adaptive_interval = AdaptiveInterval(1, 64)
+    self.monitor.set_adaptive_interval(adaptive_interval)
+    self.monitor.set_info_gate(InfoGate())
+    self.assertEqual(1, self.monitor.next_interval_secs())
+
+    self.monitor.update()
+    self.assertEqual(1, self.monitor.next_interval_secs())
+
+    # Changing maps backs off.
+    self.server.map = 'cp_granary'
+    self.assertIsNone(self.monitor.update())
+    self.assertEqual(2, self.monitor.next_interval_secs())
+
+    # An empty server backs off.
+    self.server.players = []
+    self.monitor.update()
+    self.assertEqual(4, self.monitor.next_interval_secs())
+
+  def test_info_gate_empty(self):
+    info_gate = InfoGate()
+    self.monitor.set_info_gate(info_gate)
+    self.server.players = []
+    num_requests = self.server.num_requests
+    self.assertIsNone(self.monitor.update())
+    # Only the info was queried.
+    self.assertEqual(num_requests + 1, self.server.num_requests)
+    self.assertEqual(1, info_gate.num_saved_queries)
+
+  def test_info_gate_map_change(self):
+    self.monitor.set_info_gate(InfoGate())
+    self.monitor.update()
+    self.assertEqual(4, len(self.monitor._players))
+
+    # The kills of all players are reset with the map.
+    self.server.map = 'cp_granary'
+    self.server.players = self.server.players[:2]
+    for player in self.server.players:
+      player.kills = 0
+    num_requests = self.server.num_requests
+    self.assertIsNone(self.monitor.update())
+    # The players are queried again as if for the first update.
+    self.assertEqual(num_requests + 2, self.server.num_requests)
+    self.assertEqual(2, len(self.monitor._players))
+    self.assertIsNone(self.monitor._player_kills)
+
+  def test_info_gate_challenged_info(self):
+    self.server.challenge_info = True
+    adaptive_interval = AdaptiveInterval(1, 64)
+    self.monitor.set_info_gate(InfoGate())
+    self.monitor.set_adaptive_interval(adaptive_interval)
+    for player in self.server.players:
+      player.kills_per_sec = 100000
+    self.monitor.update()
+    self.assertEqual(4, len(self.monitor._players))
+    self.assertEqual(4, len(self.monitor.update()))
+    self.assertEqual(1, self.monitor.next_interval_secs())
+
+  def test_info_gate_invalid_info(self):
+    self.monitor.set_info_gate(InfoGate())
+    # The reply is not an A2S_INFO reply, so the players are queried anyway.
+    self.server._info_reply = lambda: '\xff\xff\xff\xffX'
+    self.monitor.update()
+    self.assertEqual(4, len(self.monitor._players))
+
+  def test_malformed_reply(self):
+    self.monitor.set_info_gate(InfoGate())
+    # The hostname of this A2S_INFO reply has no terminating NUL.
+    self.server._info_reply = lambda: '\xff\xff\xff\xffI\x11Fake'
+    self.assertIsNone(self.monitor.update())
+
+  def test_release_names(self):
+    for player in self.server.players:
+      player.kills_per_sec = 100000
+    for i in xrange(8):
+      # A new player replaces another on each poll.
+      self.server.players[i % 4] = FakePlayer(
+          i % 4, 'new_player_name%d' % i, 100000, time.time())
+      self.monitor.update()
+    self.assertEqual(4, len(self.monitor._name_table))
+    self.assertEqual(
+        sorted(player.name for player in self.server.players),
+        sorted(top_player.name for top_player in self.monitor.top_k(4)))
+
+    # A player that joins while the server is idle is not tracked.
+    for player in self.server.players:
+      player.kills_per_sec = 0
+    self.server.players.append(FakePlayer(4, 'idle_player_name', 0, time.time()))
+    self.assertIsNone(self.monitor.update())
+    self.assertEqual(4, len(self.monitor._name_table))
+
+  def test_player_stats(self):
+    self.assertEqual((), self.monitor.player_stats())
+    for player in self.server.players:
+      player.kills_per_sec = 100000
+    self.monitor.update()
+    self.assertEqual((), self.monitor.player_stats())
+    player_ranks = self.monitor.update()
+    self.assertIsNotNone(player_ranks)
+
+    all_player_stats = self.monitor.player_stats()
+    self.assertEqual(
+        sorted(player.name for player in self.server.players),
+        sorted(player_stats.name for player_stats in all_player_stats))
+    # The ranks are those returned by the update.
+    self.assertEqual(player_ranks, {
+        player_stats.name: player_stats.combined_rank
+          for player_stats in all_player_stats})
+    player_kills = self.monitor.player_kills()
+    kill_ranks = self.monitor._rank_players_by_attr(
+        player_kills, attrgetter('player_id'), attrgetter('new_kills'))
+    for player_stats in all_player_stats:
+      self.assertGreater(player_stats.new, 0)
+      self.assertEqual(player_stats.new, player_stats.avg)
+      self.assertEqual(0, player_stats.stddev)
+      player_id = self.monitor._name_table.lookup(player_stats.name)
+      self.assertEqual(kill_ranks[player_id], player_stats.new_rank)
+
+  def test_fixed_interval(self):
+    self.assertEqual(-1, self.monitor.next_interval_secs())
+
 
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,224 @@
+"""Queries many Source servers concurrently from a single thread.
+
+SourceQuery blocks on each request for up to its timeout, so polling many
+servers with it serializes all of their round trips. MultiSourceQuery instead
+drives every request as a small state machine over a non-blocking UDP socket,
+and multiplexes all sockets with select. A single call to run therefore costs
+roughly one timeout in the worst case, regardless of the number of servers.
+
+Example usage:
+
+  client = MultiSourceQuery(timeout=1.0, max_concurrency=128)
+  for result in client.player([('1.2.3.4', 27015), ('5.6.7.8', 27015)]):
+    if result.error is None:
+      print result.query.host, result.value
+"""
+
+from collections import deque, namedtuple
+import errno
+import select
+import socket
+import struct
+import time
+
+from query_metrics import QUERY_METRICS
+import SourceQuery
+from SourceQuery import SourceQueryError, SourceQueryReader
+
+
+# The kinds of queries.
+INFO = 'info'
+PLAYER = 'player'
+RULES = 'rules'
+
+Query = namedtuple('Query', ['host', 'port', 'kind'])
+QueryResult = namedtuple('QueryResult', ['query', 'value', 'error'])
+
+
+class _PendingQuery(object):
+  """The state of a query that has been started but not completed."""
+
+  def __init__(self, index, query, address, deadline):
+    self.index = index
+    self.query = query
+    self.deadline = deadline
+    self.sent_time = None
+    self.splits = SourceQuery.SplitPacketBuffer(QUERY_METRICS)
+
+    self.udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    self.udp.setblocking(False)
+    self.udp.connect(address)
+
+  def close(self):
+    self.udp.close()
+
+  def send(self, challenge=None):
+    """Sends the request of this query, with the given challenge if needed."""
+    kind = self.query.kind
+    if kind == INFO:
+      data = SourceQuery.build_info_request(challenge)
+    elif kind == PLAYER:
+      data = SourceQuery.build_player_request(
+          SourceQuery.CHALLENGE if challenge is None else challenge)
+    else:
+      data = SourceQuery.build_rules_request(
+          SourceQuery.CHALLENGE if challenge is None else challenge)
+    self.sent_time = time.time()
+    self.udp.send(data)
+
+  def receive(self, data):
+    """Handles a datagram received for this query.
+
+    Returns a pair of elements. The first element specifies whether the query
+    completed. If so, the second element is its result.
+    """
+    packet = SourceQueryReader(data)
+    try:
+      typ = packet.getLong()
+      if typ == SourceQuery.SPLIT:
+        packet = self.splits.add(packet)
+    except struct.error:
+      # Ignore truncated packets.
+      return False, None
+    if packet is None or typ not in (SourceQuery.WHOLE, SourceQuery.SPLIT):
+      # Fragments are missing, or this is a stray packet.
+      return False, None
+
+    reply_type = packet.getByte()
+    if reply_type == SourceQuery.S2C_CHALLENGE:
+      # Repeat the request with the challenge.
+      self.send(packet.getLong())
+      return False, None
+
+    kind = self.query.kind
+    if kind == INFO and reply_type == SourceQuery.A2S_INFO_REPLY:
+      result = SourceQuery.parse_info_reply(packet)
+      result['ping'] = time.time() - self.sent_time
+      return True, result
+    elif kind == PLAYER and reply_type == SourceQuery.A2S_PLAYER_REPLY:
+      return True, SourceQuery.parse_player_reply(packet)
+    elif kind == RULES and reply_type == SourceQuery.A2S_RULES_REPLY:
+      return True, SourceQuery.parse_rules_reply(packet)
+    raise SourceQueryError('Received invalid reply type %d' % (reply_type,))
+
+
+class MultiSourceQuery(object):
+  """Runs queries against many servers concurrently.
+
+  Parameter timeout is the number of seconds that each query may take, measured
+  from when it is started.
+  Parameter max_concurrency is the maximum number of queries in flight. Because
+  each query in flight has its own socket, this must stay below the limit of
+  select, which is usually 1024 descriptors.
+  """
+
+  def __init__(self, timeout=1.0, max_concurrency=256):
+    self._timeout = timeout
+    self._max_concurrency = max_concurrency
+    # Resolved addresses by (host, port), so that each host is resolved once.
+    self._addresses = {}
+
+  def _resolve(self, host, port):
+    address = self._addresses.get((host, port), None)
+    if address is None:
+      address = (socket.gethostbyname(host), port)
+      self._addresses[(host, port)] = address
+    return address
+
+  def _start(self, index, query, address, now):
+    """Returns a _PendingQuery for the query after sending its request."""
+    pending_query = _PendingQuery(index, query, address, now + self._timeout)
+    try:
+      pending_query.send()
+    except:
+      pending_query.close()
+      raise
+    return pending_query
+
+  def run(self, queries):
+    """Runs the given queries until each completes, fails or times out.
+
+    Parameter queries is a sequence of Query instances.
+
+    Returns a QueryResult instance for each query, in the same order. If a query
+    failed, then its value is None and its error is the raised exception.
+    """
+    results = [None] * len(queries)
+    # Resolve every host before any request is sent, because resolving blocks,
+    # which would stall the queries in flight and eat into their deadlines.
+    waiting = deque()
+    for index, query in enumerate(queries):
+      try:
+        address = self._resolve(query.host, query.port)
+      except socket.error as e:
+        results[index] = QueryResult(query, None, e)
+        continue
+      waiting.append((index, query, address))
+    in_flight = {}
+
+    while waiting or in_flight:
+      # Start waiting queries while below the concurrency limit.
+      now = time.time()
+      while waiting and len(in_flight) < self._max_concurrency:
+        index, query, address = waiting.popleft()
+        try:
+          pending_query = self._start(index, query, address, now)
+        except (socket.error, SourceQueryError) as e:
+          results[index] = QueryResult(query, None, e)
+          continue
+        in_flight[pending_query.udp.fileno()] = pending_query
+      if not in_flight:
+        continue
+
+      # Wait for replies until the earliest deadline.
+      earliest_deadline = min(q.deadline for q in in_flight.itervalues())
+      select_timeout = max(0.0, earliest_deadline - now)
+      try:
+        readable, _, _ = select.select(in_flight.keys(), [], [], select_timeout)
+      except select.error as e:
+        if e.args[0] == errno.EINTR:
+          continue
+        raise
+
+      for fileno in readable:
+        pending_query = in_flight[fileno]
+        try:
+          data = pending_query.udp.recv(SourceQuery.PACKETSIZE)
+          completed, value = pending_query.receive(data)
+        except socket.error as e:
+          if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+            continue
+          completed, value, error = True, None, e
+        except (SourceQueryError, struct.error, ValueError, IndexError) as e:
+          completed, value, error = True, None, e
+        else:
+          error = None
+        if completed:
+          del in_flight[fileno]
+          pending_query.close()
+          results[pending_query.index] = QueryResult(
+              pending_query.query, value, error)
+
+      # Expire queries that have passed their deadline.
+      now = time.time()
+      expired_filenos = [fileno for fileno, pending_query in in_flight.iteritems()
+          if pending_query.deadline <= now]
+      for fileno in expired_filenos:
+        pending_query = in_flight.pop(fileno)
+        pending_query.close()
+        results[pending_query.index] = QueryResult(
+            pending_query.query, None, socket.timeout('timed out'))
+
+    return results
+
+  def info(self, addresses):
+    """Returns a QueryResult with server info for each (host, port) pair."""
+    return self.run([Query(host, port, INFO) for host, port in addresses])
+
+  def player(self, addresses):
+    """Returns a QueryResult with the players for each (host, port) pair."""
+    return self.run([Query(host, port, PLAYER) for host, port in addresses])
+
+  def rules(self, addresses):
+    """Returns a QueryResult with the rules for each (host, port) pair."""
+    return self.run([Query(host, port, RULES) for host, port in addresses])
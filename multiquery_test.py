@@ -0,0 +1,69 @@
+import socket
+import unittest
+
+from fake_server import FakeSourceServer
+from multiquery import *
+
+
+class MultiSourceQueryTest(unittest.TestCase):
+  """Test case for MultiSourceQuery against FakeSourceServer instances."""
+
+  def setUp(self):
+    self.servers = []
+    for num_players in (3, 4, 5):
+      server = FakeSourceServer(num_players=num_players, num_rules=200, split_size=500)
+      server.start()
+      self.addCleanup(server.stop)
+      self.servers.append(server)
+    self.addresses = [server.address for server in self.servers]
+
+  def test_player(self):
+    # Bound the concurrency so that some queries must wait.
+    client = MultiSourceQuery(timeout=1.0, max_concurrency=2)
+    results = client.player(self.addresses)
+    self.assertEqual(3, len(results))
+    for server, result in zip(self.servers, results):
+      self.assertIsNone(result.error)
+      self.assertEqual(len(server.players), len(result.value))
+
+  def test_info_and_rules(self):
+    client = MultiSourceQuery(timeout=1.0)
+    queries = [Query(self.addresses[0][0], self.addresses[0][1], INFO),
+        Query(self.addresses[1][0], self.addresses[1][1], RULES)]
+    info_result, rules_result = client.run(queries)
+    self.assertEqual(3, info_result.value['numplayers'])
+    self.assertEqual(self.servers[1].rules, rules_result.value)
+
+  def test_resolve_first(self):
+    num_requests = []
+    def gethostbyname(host):
+      num_requests.append(sum(server.num_requests for server in self.servers))
+      return gethostbyname_orig(host)
+    gethostbyname_orig = socket.gethostbyname
+    socket.gethostbyname = gethostbyname
+    self.addCleanup(setattr, socket, 'gethostbyname', gethostbyname_orig)
+
+    client = MultiSourceQuery(timeout=1.0, max_concurrency=1)
+    queries = [Query(host, port, INFO) for host, port in self.addresses]
+    queries.insert(1, Query('invalid.invalid', 27015, INFO))
+    results = client.run(queries)
+    # Every host was resolved before the first request was sent.
+    self.assertEqual([0] * 4, num_requests)
+    self.assertIsInstance(results[1].error, socket.error)
+    self.assertEqual([3, 4, 5],
+        [result.value['numplayers'] for result in results if result.value])
+
+  def test_timeout(self):
+    # Nothing answers on this socket.
+    udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    udp.bind(('127.0.0.1', 0))
+    self.addCleanup(udp.close)
+
+    client = MultiSourceQuery(timeout=0.1)
+    results = client.player([udp.getsockname(), self.addresses[0]])
+    self.assertIsInstance(results[0].error, socket.timeout)
+    self.assertIsNone(results[1].error)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,44 @@
+class NameTable(object):
+  """Interns player names, mapping each to a stable small integer id.
+
+  Ids start at 0, and the id of a released name is reused by a later name, so
+  that ids stay small and may index arrays.
+  """
+
+  def __init__(self):
+    self._ids = {}
+    self._names = []
+    self._free_ids = []
+
+  def __len__(self):
+    return len(self._ids)
+
+  def __contains__(self, name):
+    return name in self._ids
+
+  def intern(self, name):
+    """Returns the id of the given name, assigning a new id if needed."""
+    name_id = self._ids.get(name, None)
+    if name_id is None:
+      if self._free_ids:
+        name_id = self._free_ids.pop()
+        self._names[name_id] = name
+      else:
+        name_id = len(self._names)
+        self._names.append(name)
+      self._ids[name] = name_id
+    return name_id
+
+  def release(self, name_id):
+    """Releases the id of a name that is no longer used, so it may be reused."""
+    del self._ids[self._names[name_id]]
+    self._names[name_id] = None
+    self._free_ids.append(name_id)
+
+  def lookup(self, name):
+    """Returns the id of the given name, or None if it was never interned."""
+    return self._ids.get(name, None)
+
+  def name(self, name_id):
+    """Returns the name with the given id."""
+    return self._names[name_id]
@@ -0,0 +1,70 @@
+"""Microbenchmark of decoding A2S_PLAYER replies.
+
+Compares parsing a reply with the StringIO-based SourceQueryPacket against the
+struct-based SourceQueryReader, for replies with 32 and 100 players.
+
+Run with: python packet_bench.py
+"""
+
+import timeit
+
+from SourceQuery import (
+    A2S_PLAYER_REPLY, WHOLE, SourceQueryPacket, SourceQueryReader,
+    parse_player_reply)
+
+
+def make_player_reply(num_players):
+  """Returns the data of an A2S_PLAYER reply with the given number of players."""
+  packet = SourceQueryPacket()
+  packet.putLong(WHOLE)
+  packet.putByte(A2S_PLAYER_REPLY)
+  packet.putByte(num_players % 256)
+  for i in xrange(num_players):
+    packet.putByte(i % 256)
+    packet.putString('player_name%d' % i)
+    packet.putLong(i)
+    packet.putFloat(60.0 * i)
+  return packet.getvalue()
+
+def parse_with_packet(data, num_players):
+  """Parses the reply field by field using SourceQueryPacket."""
+  packet = SourceQueryPacket(data)
+  packet.getLong()
+  packet.getByte()
+  packet.getByte()
+  result = []
+  for x in xrange(num_players):
+    player = {}
+    player['index'] = packet.getByte()
+    player['name'] = packet.getString()
+    player['kills'] = packet.getLong()
+    player['time'] = packet.getFloat()
+    result.append(player)
+  return result
+
+def parse_with_reader(data, num_players):
+  """Parses the reply using SourceQueryReader."""
+  packet = SourceQueryReader(data)
+  packet.getLong()
+  packet.getByte()
+  return parse_player_reply(packet)
+
+
+def main():
+  number = 2000
+  for num_players in (32, 100):
+    data = make_player_reply(num_players)
+    assert (parse_with_packet(data, num_players) ==
+        parse_with_reader(data, num_players))
+
+    for name, parse in (
+        ('SourceQueryPacket', parse_with_packet),
+        ('SourceQueryReader', parse_with_reader)):
+      secs = min(timeit.repeat(
+          lambda: parse(data, num_players), number=number, repeat=5))
+      print '%3d players  %-18s %8.2f usecs/reply' % (
+          num_players, name, 1e6 * secs / number)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,131 @@
+"""The rows of the player table, and the diffs that update them.
+
+PlayerTable keeps a row for each player in a stable order, so that a view only
+repaints the cells that change. Each poll is applied as a diff in three steps,
+which a Qt model wraps in its begin and end calls:
+
+  1. Remove the rows of disconnected players, as ranges of adjacent rows in
+     descending order, so that removing a range does not shift the next one.
+  2. Append a row for each new player.
+  3. Replace the rows of the remaining players, returning the ranges of cells
+     that changed. Adjacent rows whose changes span the same columns form one
+     range.
+
+This module does not import Qt, so that its diffs can be tested headless.
+"""
+
+from collections import namedtuple
+
+from monitor import PlayerStats
+
+
+# The columns are the fields of the PlayerStats returned by Monitor.
+COLUMNS = PlayerStats._fields
+RANK_COLUMNS = frozenset(('new_rank', 'stddev_rank', 'combined_rank'))
+
+# A range of cells that changed, with inclusive bounds.
+CellRange = namedtuple('CellRange', ['first_row', 'last_row', 'first_column', 'last_column'])
+TableDiff = namedtuple('TableDiff', ['removed_ranges', 'inserted', 'changed'])
+
+_ORDINAL_SUFFIXES = {1: 'st', 2: 'nd', 3: 'rd'}
+_rank_texts = {}
+
+
+def rank_text(rank):
+  """Returns the ordinal text of a rank, such as 2nd, or - if None."""
+  text = _rank_texts.get(rank)
+  if text is None:
+    if rank is None:
+      text = '-'
+    elif 10 <= rank % 100 <= 20:
+      text = '%dth' % rank
+    else:
+      text = '%d%s' % (rank, _ORDINAL_SUFFIXES.get(rank % 10, 'th'))
+    _rank_texts[rank] = text
+  return text
+
+def _ranges(sorted_rows):
+  """Yields the first and last row of each run of adjacent rows."""
+  first = last = None
+  for row in sorted_rows:
+    if last is not None and row == last + 1:
+      last = row
+    else:
+      if first is not None:
+        yield first, last
+      first = last = row
+  if first is not None:
+    yield first, last
+
+
+class PlayerTable(object):
+  """The rows of the player table, in a stable order."""
+
+  def __init__(self):
+    self.rows = []
+    self._row_by_name = {}
+
+  def __len__(self):
+    return len(self.rows)
+
+  def row_of(self, name):
+    """Returns the row of the player with the given name, or None."""
+    return self._row_by_name.get(name)
+
+  def diff(self, players):
+    """Returns the TableDiff that updates the table to the given players.
+
+    Parameter players is a sequence of PlayerStats instances.
+    """
+    names = set(player.name for player in players)
+    removed_rows = [row for row, player in enumerate(self.rows)
+        if player.name not in names]
+    removed_ranges = list(_ranges(removed_rows))
+    removed_ranges.reverse()
+
+    inserted = []
+    changed = []
+    for player in players:
+      if player.name in self._row_by_name:
+        changed.append(player)
+      else:
+        inserted.append(player)
+    return TableDiff(removed_ranges, inserted, changed)
+
+  def remove_rows(self, first_row, last_row):
+    del self.rows[first_row:last_row + 1]
+    self._row_by_name = {player.name: row for row, player in enumerate(self.rows)}
+
+  def append_rows(self, players):
+    for player in players:
+      self._row_by_name[player.name] = len(self.rows)
+      self.rows.append(player)
+
+  def replace_rows(self, players):
+    """Replaces the rows of existing players.
+
+    Returns the CellRange instances that changed, in order of row.
+    """
+    spans = []
+    for player in players:
+      row = self._row_by_name[player.name]
+      old_player = self.rows[row]
+      if old_player == player:
+        continue
+      changed_columns = [column for column, (old_value, value)
+          in enumerate(zip(old_player, player)) if old_value != value]
+      self.rows[row] = player
+      spans.append((row, changed_columns[0], changed_columns[-1]))
+    spans.sort()
+
+    cell_ranges = []
+    for row, first_column, last_column in spans:
+      if cell_ranges:
+        prev_range = cell_ranges[-1]
+        if (prev_range.last_row == row - 1 and
+            prev_range.first_column == first_column and
+            prev_range.last_column == last_column):
+          cell_ranges[-1] = prev_range._replace(last_row=row)
+          continue
+      cell_ranges.append(CellRange(row, row, first_column, last_column))
+    return cell_ranges
@@ -0,0 +1,62 @@
+import unittest
+
+from player_table import *
+
+
+def _stats(name, new, combined_rank):
+  return PlayerStats(name, 10, 2.0, 1.0, new, 1, 1, combined_rank)
+
+
+class PlayerTableTest(unittest.TestCase):
+  """Test case for PlayerTable."""
+
+  def setUp(self):
+    self.table = PlayerTable()
+
+  def _apply(self, players):
+    diff = self.table.diff(players)
+    for first_row, last_row in diff.removed_ranges:
+      self.table.remove_rows(first_row, last_row)
+    self.table.append_rows(diff.inserted)
+    return diff, self.table.replace_rows(diff.changed)
+
+  def test_insert(self):
+    diff, changed = self._apply([_stats('player_name1', 1, 1), _stats('player_name2', 0, 2)])
+    self.assertEqual([], diff.removed_ranges)
+    self.assertEqual(2, len(diff.inserted))
+    self.assertEqual([], changed)
+    self.assertEqual(1, self.table.row_of('player_name2'))
+
+  def test_remove(self):
+    self._apply([_stats('player_name%d' % i, 0, 1) for i in xrange(6)])
+    diff, changed = self._apply(
+        [_stats('player_name0', 0, 1), _stats('player_name3', 0, 1)])
+    # Ranges are in descending order, so that removing one keeps the others valid.
+    self.assertEqual([(4, 5), (1, 2)], diff.removed_ranges)
+    self.assertEqual(['player_name0', 'player_name3'],
+        [player.name for player in self.table.rows])
+    self.assertEqual(1, self.table.row_of('player_name3'))
+
+  def test_changed_ranges(self):
+    self._apply([_stats('player_name%d' % i, 0, 1) for i in xrange(4)])
+    diff, changed = self._apply([
+        _stats('player_name0', 1, 2),
+        _stats('player_name1', 1, 2),
+        _stats('player_name2', 0, 1),
+        _stats('player_name3', 1, 1),
+    ])
+    new_column = COLUMNS.index('new')
+    combined_rank_column = COLUMNS.index('combined_rank')
+    # The first two rows changed in the same columns.
+    self.assertEqual([
+        CellRange(0, 1, new_column, combined_rank_column),
+        CellRange(3, 3, new_column, new_column),
+    ], changed)
+
+  def test_rank_text(self):
+    self.assertEqual(['-', '1st', '2nd', '3rd', '4th', '11th', '12th', '21st', '113th'],
+        [rank_text(rank) for rank in (None, 1, 2, 3, 4, 11, 12, 21, 113)])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,94 @@
+"""End-to-end benchmark of polling with Monitor.
+
+Runs a FakeSourceServer in a separate process on localhost, then repeatedly
+calls Monitor.update on each of N monitors for a number of seconds. Reports the
+throughput in polls per second, the p50/p95/p99 latency of each poll, and the
+CPU time per poll of this process.
+
+Run with: python poll_bench.py [--monitors N] [--secs SECS] [--players N]
+"""
+
+import argparse
+import multiprocessing
+import os
+import time
+
+from fake_server import FakeSourceServer
+from monitor import Monitor
+
+
+def _run_server(conn, num_players, compress):
+  server = FakeSourceServer(num_players=num_players, compress=compress)
+  server.start()
+  conn.send(server.address)
+  # Serve until the benchmark has finished.
+  conn.recv()
+  server.stop()
+
+def percentile(sorted_values, fraction):
+  """Returns the value at the given fraction of the sorted values."""
+  if not sorted_values:
+    return None
+  index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+  return sorted_values[index]
+
+def _cpu_secs():
+  times = os.times()
+  return times[0] + times[1]
+
+def run_benchmark(host, port, num_monitors, secs, stddev_weight=50):
+  """Polls the server with each monitor in turn for the given duration.
+
+  Returns a pair of elements. The first element is the sorted latency of each
+  poll in seconds. The second element is the CPU time of all polls in seconds.
+  """
+  monitors = []
+  for i in xrange(num_monitors):
+    monitor = Monitor(host, port, 0)
+    monitor.set_stddev_weight(stddev_weight)
+    monitors.append(monitor)
+
+  latencies = []
+  start_cpu_secs = _cpu_secs()
+  end_time = time.time() + secs
+  while time.time() < end_time:
+    for monitor in monitors:
+      before = time.time()
+      monitor.update()
+      latencies.append(time.time() - before)
+  cpu_secs = _cpu_secs() - start_cpu_secs
+
+  latencies.sort()
+  return latencies, cpu_secs
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Benchmarks polling with Monitor.')
+  parser.add_argument('--monitors', type=int, default=4)
+  parser.add_argument('--secs', type=float, default=5.0)
+  parser.add_argument('--players', type=int, default=32)
+  parser.add_argument('--compress', action='store_true')
+  args = parser.parse_args()
+
+  parent_conn, child_conn = multiprocessing.Pipe()
+  server_process = multiprocessing.Process(
+      target=_run_server, args=(child_conn, args.players, args.compress))
+  server_process.start()
+  host, port = parent_conn.recv()
+
+  try:
+    latencies, cpu_secs = run_benchmark(host, port, args.monitors, args.secs)
+  finally:
+    parent_conn.send(None)
+    server_process.join()
+
+  num_polls = len(latencies)
+  print 'monitors=%d players=%d polls=%d' % (args.monitors, args.players, num_polls)
+  print 'throughput   %10.1f polls/sec' % (num_polls / args.secs)
+  for name, fraction in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)):
+    print '%s latency  %10.1f usecs' % (name, 1e6 * percentile(latencies, fraction))
+  print 'cpu per poll %10.1f usecs' % (1e6 * cpu_secs / max(1, num_polls))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,93 @@
+"""Polls a Monitor off the UI thread, and publishes immutable snapshots.
+
+PollWorker owns a Monitor and runs its updates on the thread of its own
+Scheduler, so that a query that waits for a slow server never blocks the UI.
+After each update that ranks players, the worker puts a PollSnapshot in a
+LatestSnapshot and calls its notify function, such as the emit method of a Qt
+signal with a queued connection.
+
+A LatestSnapshot holds only the newest snapshot. If the UI falls behind, a new
+snapshot replaces the one it has not taken yet, and the notifications of the
+replaced snapshots find nothing to take. So the UI always shows the newest
+ranking, and never works through a backlog of stale ones.
+
+Each snapshot is a tuple of namedtuples, so the UI may read it without locks
+while the worker updates the Monitor. Other changes to the Monitor, such as to
+its weight, are also run on the worker thread.
+"""
+
+from collections import namedtuple
+import itertools
+import threading
+import time
+
+from scheduler import Scheduler
+
+
+# The statistics and ranks of each player after an update. The sequence number
+# increases with each snapshot, and the timestamp is the wall clock time.
+PollSnapshot = namedtuple('PollSnapshot', ['sequence', 'timestamp', 'players'])
+
+
+class LatestSnapshot(object):
+  """Holds the newest snapshot until it is taken, for any thread."""
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._snapshot = None
+    self.num_dropped = 0
+
+  def put(self, snapshot):
+    """Holds the snapshot, dropping any snapshot that was not taken."""
+    with self._lock:
+      if self._snapshot is not None:
+        self.num_dropped += 1
+      self._snapshot = snapshot
+
+  def take(self):
+    """Returns the newest snapshot and stops holding it, or returns None."""
+    with self._lock:
+      snapshot = self._snapshot
+      self._snapshot = None
+      return snapshot
+
+
+class PollWorker(object):
+  """Updates a Monitor on a thread of its own, and publishes PollSnapshots.
+
+  Parameter monitor is the Monitor, which only the worker thread may call once
+  the worker has started.
+  Parameter notify is a function that is called on the worker thread after
+  each snapshot is put in the snapshots attribute.
+  """
+
+  def __init__(self, monitor, notify):
+    self._monitor = monitor
+    self._notify = notify
+    self._scheduler = Scheduler()
+    self._sequence_numbers = itertools.count(1)
+    self.snapshots = LatestSnapshot()
+
+  def poll(self):
+    """Updates the monitor and publishes a snapshot, if it ranked players."""
+    if self._monitor.update() is not None:
+      self.snapshots.put(PollSnapshot(next(self._sequence_numbers),
+          time.time(), self._monitor.player_stats()))
+      self._notify()
+
+  def set_stddev_weight(self, stddev_weight):
+    """Sets the weight for standard deviation of the monitor, from any thread."""
+    self._scheduler.schedule(
+        0, lambda: self._monitor.set_stddev_weight(stddev_weight),
+        name='set_stddev_weight')
+
+  def start(self):
+    """Starts polling on the worker thread."""
+    # The poll runs again after the interval of the monitor, even if it raised.
+    self._scheduler.schedule(0, self.poll, name='update_monitor',
+        interval=self._monitor.next_interval_secs)
+    self._scheduler.start()
+
+  def stop(self):
+    """Stops polling, after any update that is running."""
+    self._scheduler.stop()
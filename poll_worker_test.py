@@ -0,0 +1,86 @@
+import threading
+import unittest
+
+from fake_server import FakeSourceServer
+from monitor import Monitor
+from poll_worker import *
+
+
+class LatestSnapshotTest(unittest.TestCase):
+  """Test case for LatestSnapshot."""
+
+  def setUp(self):
+    self.snapshots = LatestSnapshot()
+
+  def test_take_empty(self):
+    self.assertIsNone(self.snapshots.take())
+    self.assertEqual(0, self.snapshots.num_dropped)
+
+  def test_drop_stale(self):
+    snapshot1 = PollSnapshot(1, 0.0, ())
+    snapshot2 = PollSnapshot(2, 1.0, ())
+    self.snapshots.put(snapshot1)
+    self.snapshots.put(snapshot2)
+    self.assertEqual(1, self.snapshots.num_dropped)
+    # Only the newest snapshot is taken, and only once.
+    self.assertEqual(snapshot2, self.snapshots.take())
+    self.assertIsNone(self.snapshots.take())
+
+    self.snapshots.put(snapshot1)
+    self.assertEqual(snapshot1, self.snapshots.take())
+    self.assertEqual(1, self.snapshots.num_dropped)
+
+
+class PollWorkerTest(unittest.TestCase):
+  """Test case for PollWorker against a FakeSourceServer."""
+
+  def setUp(self):
+    self.server = FakeSourceServer(num_players=4)
+    # Give each player kills on every poll.
+    for player in self.server.players:
+      player.kills_per_sec = 100000
+    self.server.start()
+    self.addCleanup(self.server.stop)
+    host, port = self.server.address
+    self.monitor = Monitor(host, port, 0.05)
+    self.monitor.set_stddev_weight(50)
+
+  def test_poll(self):
+    notified = []
+    worker = PollWorker(self.monitor, lambda: notified.append(True))
+    # The first update only finds the players.
+    worker.poll()
+    self.assertIsNone(worker.snapshots.take())
+    self.assertEqual([], notified)
+
+    worker.poll()
+    self.assertEqual([True], notified)
+    snapshot = worker.snapshots.take()
+    self.assertEqual(1, snapshot.sequence)
+    self.assertIsInstance(snapshot.players, tuple)
+    self.assertEqual(
+        sorted(player.name for player in self.server.players),
+        sorted(player.name for player in snapshot.players))
+
+  def test_start(self):
+    notified = threading.Event()
+    worker = PollWorker(self.monitor, notified.set)
+    worker.start()
+    self.addCleanup(worker.stop)
+    self.assertTrue(notified.wait(10))
+    snapshot = worker.snapshots.take()
+    self.assertEqual(len(self.server.players), len(snapshot.players))
+
+  def test_set_stddev_weight(self):
+    notified = threading.Event()
+    worker = PollWorker(self.monitor, notified.set)
+    worker.set_stddev_weight(100)
+    worker.start()
+    self.addCleanup(worker.stop)
+    self.assertTrue(notified.wait(10))
+    # The weight was set on the worker thread before polling.
+    self.assertEqual(100, self.monitor._stddev_weight)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,71 @@
+"""Hooks for profiling Monitor updates.
+
+PhaseTimer is a phase hook for Monitor.set_phase_hook that totals the time
+spent in each phase of an update. SamplingProfiler is set with
+Monitor.set_profiler, and runs cProfile on one in every N updates, dumping the
+stats of each profiled update to a file that pstats or snakeviz can read.
+
+Both are opt-in. Without them, Monitor only compares each hook with None, so
+they may be enabled in production when needed.
+"""
+
+import cProfile
+import itertools
+import os
+
+
+class PhaseTimer(object):
+  """A phase hook that totals the seconds and count of each phase."""
+
+  def __init__(self):
+    self._enter_times = {}
+    # The total seconds and count of each phase.
+    self.total_secs = {}
+    self.num_calls = {}
+
+  def enter(self, phase, timestamp):
+    self._enter_times[phase] = timestamp
+
+  def exit(self, phase, timestamp):
+    elapsed = timestamp - self._enter_times.pop(phase)
+    self.total_secs[phase] = self.total_secs.get(phase, 0.0) + elapsed
+    self.num_calls[phase] = self.num_calls.get(phase, 0) + 1
+
+  def mean_secs(self, phase):
+    """Returns the mean seconds spent in the given phase, or None."""
+    num_calls = self.num_calls.get(phase)
+    if not num_calls:
+      return None
+    return self.total_secs[phase] / num_calls
+
+
+class SamplingProfiler(object):
+  """Profiles one in every sample_every calls with cProfile.
+
+  The stats of each profiled call are dumped to a file named
+  <prefix>-<sample number>.prof in the given directory.
+  """
+
+  def __init__(self, directory, sample_every=100, prefix='update'):
+    self._directory = directory
+    self._sample_every = sample_every
+    self._prefix = prefix
+    self._num_calls = 0
+    self._sample_numbers = itertools.count()
+    self.stats_paths = []
+
+  def call(self, func, *args, **kwargs):
+    """Calls the function, profiling it if this call is sampled."""
+    self._num_calls += 1
+    if self._num_calls < self._sample_every:
+      return func(*args, **kwargs)
+
+    self._num_calls = 0
+    profile = cProfile.Profile()
+    try:
+      return profile.runcall(func, *args, **kwargs)
+    finally:
+      path = os.path.join(self._directory,
+          '%s-%d.prof' % (self._prefix, next(self._sample_numbers)))
+      profile.dump_stats(path)
+      self.stats_paths.append(path)
@@ -0,0 +1,56 @@
+import pstats
+import shutil
+import tempfile
+import unittest
+
+from fake_server import FakeSourceServer
+from monitor import *
+from profiling import *
+
+
+class ProfilingTest(unittest.TestCase):
+  """Test case for the profiling hooks of Monitor."""
+
+  def setUp(self):
+    self.server = FakeSourceServer(num_players=4)
+    self.server.start()
+    self.addCleanup(self.server.stop)
+    host, port = self.server.address
+    self.monitor = Monitor(host, port, -1)
+    self.monitor.set_stddev_weight(50)
+
+  def test_phase_timer(self):
+    phase_timer = PhaseTimer()
+    self.monitor.set_phase_hook(phase_timer)
+    self.monitor.update()
+    # Give every player a new kill, so that the second update ranks players.
+    for player in self.server.players:
+      player.kills_per_sec = 0
+      player.kills += 1
+    self.monitor.update()
+
+    self.assertEqual({
+        PHASE_QUERY: 2,
+        PHASE_GET_NEW_KILLS: 2,
+        PHASE_UPDATE_PLAYERS: 2,
+        PHASE_RANK: 1,
+    }, phase_timer.num_calls)
+    self.assertGreater(phase_timer.mean_secs(PHASE_QUERY), 0)
+    self.assertIsNone(phase_timer.mean_secs('unknown'))
+
+  def test_sampling_profiler(self):
+    directory = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, directory)
+    profiler = SamplingProfiler(directory, sample_every=2)
+    self.monitor.set_profiler(profiler)
+    for i in xrange(5):
+      self.monitor.update()
+
+    self.assertEqual(2, len(profiler.stats_paths))
+    stats = pstats.Stats(profiler.stats_paths[0])
+    self.assertTrue(any(func_name == '_update'
+        for filename, line, func_name in stats.stats))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,63 @@
+"""The metrics of SourceQuery, which observe its queries.
+
+SourceQuery does not depend on the metrics module, so that it stays a
+standalone library. Instead, it reports each round trip, timeout and packet to
+an observer. QUERY_METRICS is the observer that updates the metrics below in
+the module-level REGISTRY, and Monitor and MultiSourceQuery pass it to their
+queries.
+"""
+
+from SourceQuery import QueryObserver
+from metrics import REGISTRY
+
+
+# Metrics of all queries, labelled by the request type where it applies.
+QUERY_RTT = REGISTRY.histogram('sourcequery_rtt_seconds',
+    'Round trip time of a request and its whole reply.', ['type'])
+QUERY_TIMEOUTS = REGISTRY.counter('sourcequery_timeouts_total',
+    'Requests with no whole reply before the timeout.', ['type'])
+INVALID_PACKETS = REGISTRY.counter('sourcequery_invalid_packets_total',
+    'Received packets that were malformed and ignored or rejected.')
+SPLIT_FRAGMENTS = REGISTRY.histogram('sourcequery_split_fragments',
+    'Fragments of each reassembled split reply.',
+    buckets=(2, 3, 4, 6, 8, 12, 16, 24, 32))
+QUERY_HEDGES = REGISTRY.counter('sourcequery_hedges_total',
+    'Requests resent after no reply by the hedge deadline.', ['type'])
+QUERY_RETRIES = REGISTRY.counter('sourcequery_retries_total',
+    'Requests retried after a timeout.', ['type'])
+QUERY_SHORT_CIRCUITS = REGISTRY.counter('sourcequery_short_circuits_total',
+    'Requests not sent because the circuit of their server was open.')
+PARSE_SECONDS = REGISTRY.histogram('sourcequery_parse_seconds',
+    'Time to parse a reply.', ['type'],
+    buckets=(0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025))
+
+
+class QueryMetrics(QueryObserver):
+  """Updates the metrics of this module for each query observed."""
+
+  def round_trip(self, typ, rtt_secs):
+    QUERY_RTT.labels(typ).observe(rtt_secs)
+
+  def timeout(self, typ):
+    QUERY_TIMEOUTS.labels(typ).inc()
+
+  def hedge(self, typ):
+    QUERY_HEDGES.labels(typ).inc()
+
+  def retry(self, typ):
+    QUERY_RETRIES.labels(typ).inc()
+
+  def short_circuit(self):
+    QUERY_SHORT_CIRCUITS.inc()
+
+  def invalid_packet(self):
+    INVALID_PACKETS.inc()
+
+  def split_reply(self, num_fragments):
+    SPLIT_FRAGMENTS.observe(num_fragments)
+
+  def parse(self, typ, parse_secs):
+    PARSE_SECONDS.labels(typ).observe(parse_secs)
+
+
+QUERY_METRICS = QueryMetrics()
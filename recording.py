@@ -0,0 +1,213 @@
+"""Append-only binary recordings of polled players.
+
+A recording is a file per server that starts with a header, followed by
+length-prefixed records. Each record starts with its type and the length of its
+payload. There are two types of records:
+
+  * A name record assigns an id to a player name. It precedes the first
+    snapshot that contains the player.
+  * A snapshot record contains the timestamp of a poll, and the name id, kills
+    and connect time of each player in the poll.
+
+Because each name is written only once, a snapshot costs 12 bytes per player.
+Records are only ever appended, and a reader ignores a truncated final record,
+so a recording survives the recording process being killed mid-write.
+PollRecording memory-maps the file and decodes each record as it iterates.
+"""
+
+from collections import namedtuple
+import mmap
+import os
+import re
+import struct
+
+from names import NameTable
+
+
+_MAGIC = 'HSMR'
+_VERSION = 1
+_HEADER = struct.Struct('<4sB')
+
+# The type and payload length of each record.
+_RECORD_HEADER = struct.Struct('<BI')
+_NAME_RECORD = 1
+_SNAPSHOT_RECORD = 2
+
+# The name id of a name record, followed by the name.
+_NAME_ID = struct.Struct('<I')
+# The timestamp and number of players of a snapshot record.
+_SNAPSHOT_HEADER = struct.Struct('<dH')
+# The name id, kills and connect time of each player in a snapshot record.
+_SNAPSHOT_PLAYER = struct.Struct('<Ilf')
+
+
+class RecordingError(Exception):
+  pass
+
+
+Snapshot = namedtuple('Snapshot', ['timestamp', 'players'])
+RecordedPlayer = namedtuple('RecordedPlayer', ['name', 'kills', 'connect_duration'])
+
+
+# The characters of a host that may not appear in a file name, such as the
+# colons of an IPv6 address.
+_UNSAFE_HOST_CHARS = re.compile(r'[^A-Za-z0-9.-]')
+
+
+def recording_path(directory, host, port):
+  """Returns the path of the recording for the given server.
+
+  Characters of the host other than letters, digits, dots and hyphens are
+  replaced by underscores, so that the path is valid on any platform.
+  """
+  host = _UNSAFE_HOST_CHARS.sub('_', host)
+  return os.path.join(directory, '%s_%d.rec' % (host, port))
+
+def _iter_records(data, start):
+  """Yields the type and the offset and end of the payload of each record."""
+  offset = start
+  end = len(data)
+  while offset + _RECORD_HEADER.size <= end:
+    record_type, length = _RECORD_HEADER.unpack_from(data, offset)
+    payload_offset = offset + _RECORD_HEADER.size
+    payload_end = payload_offset + length
+    if payload_end > end:
+      # Ignore the truncated final record.
+      return
+    yield record_type, payload_offset, payload_end
+    offset = payload_end
+
+def _check_header(data):
+  if len(data) < _HEADER.size:
+    raise RecordingError('Recording is missing its header')
+  magic, version = _HEADER.unpack_from(data, 0)
+  if magic != _MAGIC or version != _VERSION:
+    raise RecordingError('Not a recording of version %d' % _VERSION)
+
+
+class PollRecorder(object):
+  """Appends snapshots of polled players to a recording.
+
+  If the file already exists, then its name records are read so that new
+  snapshots continue to use the same name ids.
+  """
+
+  def __init__(self, path):
+    self._path = path
+    self._name_table = NameTable()
+
+    if os.path.exists(path) and os.path.getsize(path):
+      reader = _RecordingReader(path)
+      for name in reader.iter_names():
+        self._name_table.intern(name)
+      # Discard any truncated final record before appending.
+      with open(path, 'r+b') as f:
+        f.truncate(reader.complete_size())
+      self._file = open(path, 'ab')
+    else:
+      self._file = open(path, 'ab')
+      self._file.write(_HEADER.pack(_MAGIC, _VERSION))
+
+  def close(self):
+    self._file.close()
+
+  def flush(self):
+    self._file.flush()
+
+  def _write_name(self, name_id, name):
+    self._file.write(
+        _RECORD_HEADER.pack(_NAME_RECORD, _NAME_ID.size + len(name)) +
+        _NAME_ID.pack(name_id) + name)
+
+  def record(self, timestamp, players):
+    """Appends a snapshot of the given players, and flushes it to the file.
+
+    Parameter players is the sequence of player dicts returned by
+    SourceQuery.player.
+    """
+    parts = [None, _SNAPSHOT_HEADER.pack(timestamp, len(players))]
+    for player in players:
+      name = player['name']
+      name_id = self._name_table.lookup(name)
+      if name_id is None:
+        name_id = self._name_table.intern(name)
+        self._write_name(name_id, name)
+      parts.append(_SNAPSHOT_PLAYER.pack(name_id, player['kills'], player['time']))
+
+    length = sum(len(part) for part in parts[1:])
+    parts[0] = _RECORD_HEADER.pack(_SNAPSHOT_RECORD, length)
+    self._file.write(''.join(parts))
+    # Flush each snapshot, so that a reader or a crash loses none.
+    self._file.flush()
+
+
+class _RecordingReader(object):
+  """Reads the records of a recording from a memory map of its file."""
+
+  def __init__(self, path):
+    self._path = path
+
+  def _map(self):
+    with open(self._path, 'rb') as f:
+      size = os.fstat(f.fileno()).st_size
+      if not size:
+        raise RecordingError('Recording is missing its header')
+      return mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+
+  def iter_names(self):
+    """Yields each name, in the order of its id."""
+    data = self._map()
+    try:
+      _check_header(data)
+      for record_type, offset, end in _iter_records(data, _HEADER.size):
+        if record_type == _NAME_RECORD:
+          yield data[offset + _NAME_ID.size:end]
+    finally:
+      data.close()
+
+  def complete_size(self):
+    """Returns the size of the recording up to the end of its last record."""
+    data = self._map()
+    try:
+      _check_header(data)
+      size = _HEADER.size
+      for record_type, offset, end in _iter_records(data, _HEADER.size):
+        size = end
+      return size
+    finally:
+      data.close()
+
+  def iter_snapshots(self):
+    """Yields a Snapshot instance for each snapshot record."""
+    data = self._map()
+    try:
+      _check_header(data)
+      names = []
+      for record_type, offset, end in _iter_records(data, _HEADER.size):
+        if record_type == _NAME_RECORD:
+          name_id = _NAME_ID.unpack_from(data, offset)[0]
+          if name_id != len(names):
+            raise RecordingError('Name ids are out of order')
+          names.append(data[offset + _NAME_ID.size:end])
+        elif record_type == _SNAPSHOT_RECORD:
+          timestamp, num_players = _SNAPSHOT_HEADER.unpack_from(data, offset)
+          offset += _SNAPSHOT_HEADER.size
+          players = []
+          for i in xrange(num_players):
+            name_id, kills, connect_duration = _SNAPSHOT_PLAYER.unpack_from(
+                data, offset)
+            offset += _SNAPSHOT_PLAYER.size
+            players.append(RecordedPlayer(names[name_id], kills, connect_duration))
+          yield Snapshot(timestamp, players)
+    finally:
+      data.close()
+
+
+class PollRecording(object):
+  """A recording that may be iterated for each Snapshot without loading it all."""
+
+  def __init__(self, path):
+    self._reader = _RecordingReader(path)
+
+  def __iter__(self):
+    return self._reader.iter_snapshots()
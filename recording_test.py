@@ -0,0 +1,126 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from names import NameTable
+from recording import *
+
+
+def _player(name, kills, connect_duration):
+  return {'index': 0, 'name': name, 'kills': kills, 'time': connect_duration}
+
+
+class NameTableTest(unittest.TestCase):
+  """Test case for NameTable."""
+
+  def test_intern(self):
+    name_table = NameTable()
+    self.assertIsNone(name_table.lookup('player_name1'))
+    self.assertEqual(0, name_table.intern('player_name1'))
+    self.assertEqual(1, name_table.intern('player_name2'))
+    self.assertEqual(0, name_table.intern('player_name1'))
+    self.assertEqual(1, name_table.lookup('player_name2'))
+    self.assertEqual('player_name2', name_table.name(1))
+    self.assertEqual(2, len(name_table))
+    self.assertIn('player_name1', name_table)
+
+  def test_release(self):
+    name_table = NameTable()
+    name_table.intern('player_name1')
+    name_table.intern('player_name2')
+    name_table.release(0)
+    self.assertNotIn('player_name1', name_table)
+    self.assertEqual(1, len(name_table))
+    # The released id is reused.
+    self.assertEqual(0, name_table.intern('player_name3'))
+    self.assertEqual('player_name3', name_table.name(0))
+    self.assertEqual(2, name_table.intern('player_name1'))
+
+
+class RecordingTest(unittest.TestCase):
+  """Test case for PollRecorder and PollRecording."""
+
+  def setUp(self):
+    directory = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, directory)
+    self.path = recording_path(directory, '127.0.0.1', 27015)
+
+  def _read(self):
+    return list(PollRecording(self.path))
+
+  def test_record(self):
+    recorder = PollRecorder(self.path)
+    recorder.record(10.0, [_player('player_name1', 1, 30.0), _player('player_name2', 2, 40.0)])
+    recorder.record(30.0, [_player('player_name2', 5, 60.0)])
+    recorder.record(50.0, [])
+    recorder.close()
+
+    snapshots = self._read()
+    self.assertEqual([
+        Snapshot(10.0, [RecordedPlayer('player_name1', 1, 30.0),
+            RecordedPlayer('player_name2', 2, 40.0)]),
+        Snapshot(30.0, [RecordedPlayer('player_name2', 5, 60.0)]),
+        Snapshot(50.0, []),
+    ], snapshots)
+
+  def test_record_flushes(self):
+    recorder = PollRecorder(self.path)
+    self.addCleanup(recorder.close)
+    recorder.record(10.0, [_player('player_name1', 1, 30.0)])
+    # The snapshot is readable while the recorder is open.
+    self.assertEqual(
+        [Snapshot(10.0, [RecordedPlayer('player_name1', 1, 30.0)])],
+        self._read())
+
+  def test_recording_path(self):
+    directory = os.path.dirname(self.path)
+    self.assertEqual(os.path.join(directory, '127.0.0.1_27015.rec'), self.path)
+    path = recording_path(directory, 'fe80::1%eth0', 27015)
+    self.assertEqual(
+        os.path.join(directory, 'fe80__1_eth0_27015.rec'), path)
+    recorder = PollRecorder(path)
+    recorder.record(10.0, [])
+    recorder.close()
+    self.assertEqual([Snapshot(10.0, [])], list(PollRecording(path)))
+
+  def test_append(self):
+    recorder = PollRecorder(self.path)
+    recorder.record(10.0, [_player('player_name1', 1, 30.0)])
+    recorder.close()
+
+    # Reopening continues with the same name ids.
+    recorder = PollRecorder(self.path)
+    recorder.record(30.0, [_player('player_name2', 2, 10.0), _player('player_name1', 3, 50.0)])
+    recorder.close()
+
+    snapshots = self._read()
+    self.assertEqual(2, len(snapshots))
+    self.assertEqual(
+        [RecordedPlayer('player_name2', 2, 10.0), RecordedPlayer('player_name1', 3, 50.0)],
+        snapshots[1].players)
+
+  def test_truncated_record(self):
+    recorder = PollRecorder(self.path)
+    recorder.record(10.0, [_player('player_name1', 1, 30.0)])
+    recorder.record(30.0, [_player('player_name1', 2, 50.0)])
+    recorder.close()
+    with open(self.path, 'r+b') as f:
+      f.truncate(os.path.getsize(self.path) - 3)
+
+    self.assertEqual([10.0], [snapshot.timestamp for snapshot in self._read()])
+
+    # Appending discards the truncated record.
+    recorder = PollRecorder(self.path)
+    recorder.record(50.0, [_player('player_name1', 3, 70.0)])
+    recorder.close()
+    self.assertEqual([10.0, 50.0], [snapshot.timestamp for snapshot in self._read()])
+
+  def test_not_a_recording(self):
+    with open(self.path, 'wb') as f:
+      f.write('not a recording')
+    self.assertRaises(RecordingError, self._read)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,52 @@
+"""Replays recordings through Monitor to backtest its rankings.
+
+Each snapshot of a recording is fed straight into the ranking pipeline of a
+Monitor, with no sockets or sleeps, so a recording replays as fast as it
+decodes and ranks. Each ranking is written as a line with the timestamp of its
+snapshot followed by the players in order of rank.
+
+Run with: python replay.py [--stddev-weight W] RECORDING...
+"""
+
+import argparse
+import sys
+import time
+
+from monitor import Monitor
+from recording import PollRecording
+
+
+def replay_recording(path, stddev_weight):
+  """Yields a RankedSnapshot for each snapshot in the recording that ranks players."""
+  monitor = Monitor(None, -1, -1)
+  monitor.set_stddev_weight(stddev_weight)
+  return monitor.replay(PollRecording(path))
+
+def format_ranks(ranked_snapshot):
+  """Returns a line with the timestamp and each player in order of rank."""
+  ranks = sorted(ranked_snapshot.ranks.iteritems(), key=lambda item: (item[1], item[0]))
+  return '%.3f\t%s' % (ranked_snapshot.timestamp,
+      '\t'.join('%d:%s' % (rank, name) for name, rank in ranks))
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Replays recordings through Monitor.')
+  parser.add_argument('--stddev-weight', type=int, default=50)
+  parser.add_argument('--quiet', action='store_true',
+      help='only report the time to replay each recording')
+  parser.add_argument('recordings', nargs='+')
+  args = parser.parse_args()
+
+  for path in args.recordings:
+    before = time.time()
+    num_rankings = 0
+    for ranked_snapshot in replay_recording(path, args.stddev_weight):
+      num_rankings += 1
+      if not args.quiet:
+        print format_ranks(ranked_snapshot)
+    sys.stderr.write('%s: %d rankings in %.3f secs\n' % (
+        path, num_rankings, time.time() - before))
+
+
+if __name__ == '__main__':
+  main()
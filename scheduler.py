@@ -0,0 +1,218 @@
+"""A scheduler of timed jobs that runs on a single thread.
+
+Jobs are kept in a priority queue ordered by the time at which each is due,
+measured by a monotonic clock where available. Scheduling or rescheduling a job
+is O(log n) and cancelling a job is O(1): a cancelled job is only marked, and
+is discarded when it reaches the front of the queue.
+
+Each job records its lateness, which is how long after its due time it began
+running. Lateness that grows means that the jobs cannot keep up.
+
+An action that raises an exception does not stop the other jobs. Its traceback
+is written to stderr and counted by the job, which runs again after its
+interval, if it has one. The interval may be a function, such as one that
+returns the adaptive interval of a Monitor, so that a job which polls runs again
+after an error as after any other poll.
+"""
+
+import heapq
+import itertools
+import threading
+import traceback
+
+from clock import monotonic
+
+
+class Job(object):
+  """A job that runs an action when due.
+
+  If the action returns a number, the job runs again after that many seconds.
+  Otherwise, if the job has an interval, it runs again after its interval, which
+  is a number of seconds or a function that returns one. Otherwise it runs only
+  once.
+  """
+
+  def __init__(self, name, action, interval):
+    self.name = name
+    self.action = action
+    self.interval = interval
+    self.due_time = None
+    self.num_runs = 0
+    self.last_lateness = None
+    self.max_lateness = 0.0
+    self.total_lateness = 0.0
+    self.cancelled = False
+    # The number of runs that raised an exception, and the last one raised.
+    self.num_errors = 0
+    self.last_error = None
+    # The entry of this job in the queue, or None if not scheduled.
+    self._entry = None
+
+  @property
+  def scheduled(self):
+    return self._entry is not None
+
+  @property
+  def mean_lateness(self):
+    if not self.num_runs:
+      return None
+    return self.total_lateness / self.num_runs
+
+  def _record_lateness(self, lateness):
+    self.num_runs += 1
+    self.last_lateness = lateness
+    self.max_lateness = max(self.max_lateness, lateness)
+    self.total_lateness += lateness
+
+
+class Scheduler(object):
+  """Runs jobs when they are due.
+
+  Call run_pending to run due jobs from an existing loop, or start to run them
+  on a new thread. All methods may be called from any thread.
+  """
+
+  def __init__(self, clock=monotonic):
+    self._clock = clock
+    self._queue = []
+    # Breaks ties between jobs with equal due times, in scheduling order.
+    self._counter = itertools.count()
+    self._condition = threading.Condition()
+    self._thread = None
+    self._running = False
+
+  def __len__(self):
+    with self._condition:
+      return sum(1 for entry in self._queue if entry[2] is not None)
+
+  def _push(self, job, delay):
+    """Adds the job to the queue, which must be locked."""
+    job.cancelled = False
+    job.due_time = self._clock() + max(0.0, delay)
+    entry = [job.due_time, next(self._counter), job]
+    job._entry = entry
+    heapq.heappush(self._queue, entry)
+    self._condition.notify()
+
+  def _remove(self, job):
+    """Marks the entry of the job as removed, if scheduled."""
+    if job._entry is not None:
+      job._entry[2] = None
+      job._entry = None
+
+  def schedule(self, delay, action, name=None, interval=None):
+    """Schedules an action to run after the given delay in seconds.
+
+    Returns the Job instance.
+    """
+    job = Job(name, action, interval)
+    with self._condition:
+      self._push(job, delay)
+    return job
+
+  def reschedule(self, job, delay):
+    """Changes when the job next runs to after the given delay in seconds.
+
+    The job is scheduled even if it was cancelled or had completed.
+    """
+    with self._condition:
+      self._remove(job)
+      self._push(job, delay)
+
+  def cancel(self, job):
+    """Cancels the job, so that it does not run again."""
+    with self._condition:
+      self._remove(job)
+      job.cancelled = True
+
+  def _pop_due_job(self, now):
+    """Returns a job that is due, or the seconds until the next job is due.
+
+    The queue must be locked. Returns None if the queue is empty.
+    """
+    queue = self._queue
+    while queue:
+      due_time, _, job = queue[0]
+      if job is None:
+        # Discard the entry of a cancelled or rescheduled job.
+        heapq.heappop(queue)
+      elif due_time <= now:
+        heapq.heappop(queue)
+        job._entry = None
+        return job
+      else:
+        return due_time - now
+    return None
+
+  def _run_job(self, job, now):
+    job._record_lateness(now - job.due_time)
+    try:
+      delay = job.action()
+    except Exception as e:
+      job.num_errors += 1
+      job.last_error = e
+      traceback.print_exc()
+      delay = None
+    if isinstance(delay, (int, long, float)):
+      next_delay = delay
+    else:
+      next_delay = job.interval
+      if callable(next_delay):
+        next_delay = next_delay()
+    if next_delay is not None:
+      with self._condition:
+        # The action may have rescheduled or cancelled the job itself.
+        if job._entry is None and not job.cancelled:
+          self._push(job, next_delay)
+
+  def run_pending(self):
+    """Runs each job that is due.
+
+    Jobs that become due while running are not run, so that a job with no delay
+    cannot run forever. Returns the seconds until the next job is due, or None
+    if there are no jobs.
+    """
+    start_time = self._clock()
+    while True:
+      with self._condition:
+        result = self._pop_due_job(start_time)
+      if not isinstance(result, Job):
+        if result is not None:
+          result -= self._clock() - start_time
+        return result
+      self._run_job(result, self._clock())
+
+  def _run(self):
+    while True:
+      with self._condition:
+        if not self._running:
+          return
+        now = self._clock()
+        result = self._pop_due_job(now)
+        if not isinstance(result, Job):
+          # Wait until the next job is due, or until the queue changes.
+          self._condition.wait(result)
+          continue
+      self._run_job(result, now)
+
+  def start(self):
+    """Starts running jobs on a new daemon thread."""
+    with self._condition:
+      self._running = True
+    self._thread = threading.Thread(target=self._run, name='Scheduler')
+    self._thread.daemon = True
+    self._thread.start()
+
+  def stop(self):
+    """Stops the thread that runs jobs, after any job that is running."""
+    with self._condition:
+      self._running = False
+      self._condition.notify()
+    if self._thread and self._thread is not threading.current_thread():
+      self._thread.join()
+    self._thread = None
+
+  def jobs(self):
+    """Returns each scheduled Job instance, such as to inspect its lateness."""
+    with self._condition:
+      return [entry[2] for entry in self._queue if entry[2] is not None]
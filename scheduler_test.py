@@ -0,0 +1,150 @@
+import StringIO
+import sys
+import threading
+import unittest
+
+from scheduler import *
+
+
+class FakeClock(object):
+  """A clock that only advances when told to."""
+
+  def __init__(self):
+    self.now = 100.0
+
+  def __call__(self):
+    return self.now
+
+
+class SchedulerTest(unittest.TestCase):
+  """Test case for Scheduler."""
+
+  def setUp(self):
+    self.clock = FakeClock()
+    self.scheduler = Scheduler(self.clock)
+    self.runs = []
+
+  def _action(self, name, result=None):
+    def action():
+      self.runs.append(name)
+      return result
+    return action
+
+  def test_run_in_order(self):
+    self.scheduler.schedule(2, self._action('second'))
+    self.scheduler.schedule(1, self._action('first'))
+    self.scheduler.schedule(3, self._action('third'))
+
+    self.assertEqual(1.0, self.scheduler.run_pending())
+    self.assertEqual([], self.runs)
+    self.clock.now += 2
+    self.assertEqual(1.0, self.scheduler.run_pending())
+    self.assertEqual(['first', 'second'], self.runs)
+    self.clock.now += 1
+    self.assertIsNone(self.scheduler.run_pending())
+    self.assertEqual(['first', 'second', 'third'], self.runs)
+
+  def test_cancel(self):
+    job = self.scheduler.schedule(1, self._action('cancelled'), interval=1)
+    self.scheduler.schedule(2, self._action('kept'))
+    self.scheduler.cancel(job)
+    self.assertFalse(job.scheduled)
+    self.assertEqual(1, len(self.scheduler))
+
+    self.clock.now += 5
+    self.scheduler.run_pending()
+    self.assertEqual(['kept'], self.runs)
+
+  def test_reschedule(self):
+    job = self.scheduler.schedule(1, self._action('job'))
+    self.scheduler.reschedule(job, 5)
+    self.clock.now += 1
+    self.assertEqual(4.0, self.scheduler.run_pending())
+    self.assertEqual([], self.runs)
+    self.clock.now += 4
+    self.scheduler.run_pending()
+    self.assertEqual(['job'], self.runs)
+
+  def test_interval_and_lateness(self):
+    job = self.scheduler.schedule(1, self._action('job'), interval=10)
+    self.clock.now += 3
+    self.assertEqual(10.0, self.scheduler.run_pending())
+    self.assertEqual(1, job.num_runs)
+    self.assertEqual(2.0, job.last_lateness)
+
+    self.clock.now += 10
+    self.scheduler.run_pending()
+    self.assertEqual(['job', 'job'], self.runs)
+    self.assertEqual(0.0, job.last_lateness)
+    self.assertEqual(2.0, job.max_lateness)
+    self.assertEqual(1.0, job.mean_lateness)
+
+  def test_action_returns_delay(self):
+    job = self.scheduler.schedule(0, self._action('job', 7), interval=1)
+    self.assertEqual(7.0, self.scheduler.run_pending())
+    self.assertTrue(job.scheduled)
+
+  def test_action_cancels_job(self):
+    jobs = []
+    def action():
+      self.scheduler.cancel(jobs[0])
+    jobs.append(self.scheduler.schedule(0, action, interval=1))
+    self.assertIsNone(self.scheduler.run_pending())
+    self.assertFalse(jobs[0].scheduled)
+
+  def test_action_raises(self):
+    def fail():
+      self.runs.append('fail')
+      raise ValueError('failed')
+    job = self.scheduler.schedule(0, fail, interval=5)
+    self.scheduler.schedule(0, self._action('other'))
+
+    stderr = sys.stderr
+    sys.stderr = StringIO.StringIO()
+    try:
+      self.assertEqual(5.0, self.scheduler.run_pending())
+      self.assertIn('ValueError: failed', sys.stderr.getvalue())
+    finally:
+      sys.stderr = stderr
+    # The other job still ran, and the failed job runs again after its interval.
+    self.assertEqual(['fail', 'other'], self.runs)
+    self.assertTrue(job.scheduled)
+    self.assertEqual(1, job.num_errors)
+    self.assertIsInstance(job.last_error, ValueError)
+
+  def test_interval_function(self):
+    def poll():
+      self.runs.append('poll')
+      if len(self.runs) == 2:
+        raise ValueError('failed')
+    intervals = [3, 4, 5]
+    self.scheduler.schedule(0, poll, interval=lambda: intervals.pop(0))
+
+    stderr = sys.stderr
+    sys.stderr = StringIO.StringIO()
+    try:
+      self.assertEqual(3.0, self.scheduler.run_pending())
+      self.clock.now += 3
+      # The poll raises, and still runs again after the next interval.
+      self.assertEqual(4.0, self.scheduler.run_pending())
+      self.assertIn('ValueError: failed', sys.stderr.getvalue())
+    finally:
+      sys.stderr = stderr
+    self.clock.now += 4
+    self.assertEqual(5.0, self.scheduler.run_pending())
+    self.assertEqual(['poll'] * 3, self.runs)
+
+  def test_thread(self):
+    scheduler = Scheduler()
+    ran = threading.Event()
+    scheduler.start()
+    try:
+      scheduler.schedule(0.01, ran.set)
+      ran.wait(5)
+    finally:
+      scheduler.stop()
+    self.assertTrue(ran.is_set())
+
+
+if __name__ == '__main__':
+  unittest.main()
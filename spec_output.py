@@ -0,0 +1,217 @@
+"""Writes the player to spectate to sinks that a game client or overlay reads.
+
+SpecOutput writes a line such as spec_player "name" to each of its sinks when
+the player to spectate changes. It skips writes of the player already written,
+and writes at most once per minimum dwell time, so that a burst of changes is
+coalesced into a write of the last player of the burst.
+
+There are three types of sinks:
+
+  * FileSink replaces a file atomically, by writing a temporary file in the
+    same directory and renaming it over the file. A reader never sees a
+    partially written file. On Windows, where a rename cannot replace a file,
+    the temporary file is moved over the file with MoveFileEx, which is not
+    guaranteed to be atomic.
+  * FifoSink writes each line to a named pipe, if a reader has it open.
+  * UnixSocketSink sends each line as a datagram to a Unix domain socket that a
+    consumer has bound.
+
+A pipe or socket pushes each change to the consumer, instead of the consumer
+polling a file. Each write to a pipe or socket is dropped if no consumer is
+ready, so that a missing consumer never blocks the monitor.
+"""
+
+import errno
+import os
+import socket
+import sys
+import tempfile
+
+from clock import monotonic
+
+
+def spec_command(player_name):
+  """Returns the console command to spectate the given player."""
+  return 'spec_player "%s"' % player_name
+
+
+# Flags of MoveFileEx on Windows.
+_MOVEFILE_REPLACE_EXISTING = 0x1
+_MOVEFILE_WRITE_THROUGH = 0x8
+
+
+def _replace(src, dst):
+  """Renames the file src to dst, replacing dst if it exists.
+
+  On Windows, os.rename fails if dst exists, so MoveFileEx replaces it instead.
+  Unlike a rename on POSIX, this is not guaranteed to be atomic.
+  """
+  if os.name != 'nt':
+    os.rename(src, dst)
+    return
+  import ctypes
+
+  encoding = sys.getfilesystemencoding()
+  if isinstance(src, str):
+    src = src.decode(encoding)
+  if isinstance(dst, str):
+    dst = dst.decode(encoding)
+  if not ctypes.windll.kernel32.MoveFileExW(
+      src, dst, _MOVEFILE_REPLACE_EXISTING | _MOVEFILE_WRITE_THROUGH):
+    raise ctypes.WinError()
+
+
+class FileSink(object):
+  """Replaces the contents of a file atomically for each write."""
+
+  def __init__(self, path):
+    self.path = path
+
+  def write(self, data):
+    directory, filename = os.path.split(os.path.abspath(self.path))
+    fd, temp_path = tempfile.mkstemp(prefix='.%s.' % filename, dir=directory)
+    try:
+      with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+      _replace(temp_path, self.path)
+    except:
+      os.unlink(temp_path)
+      raise
+
+  def close(self):
+    pass
+
+
+class FifoSink(object):
+  """Writes each line to a named pipe, which is created if missing.
+
+  The pipe is opened when a reader is present, and reopened after the reader
+  closes it.
+  """
+
+  def __init__(self, path):
+    self.path = path
+    self._fd = None
+    if not os.path.exists(path):
+      os.mkfifo(path)
+
+  def _open(self):
+    try:
+      self._fd = os.open(self.path, os.O_WRONLY | os.O_NONBLOCK)
+    except OSError as e:
+      if e.errno != errno.ENXIO:
+        raise
+      # No reader has the pipe open.
+      self._fd = None
+
+  def write(self, data):
+    if self._fd is None:
+      self._open()
+      if self._fd is None:
+        return
+    try:
+      os.write(self._fd, data + '\n')
+    except OSError as e:
+      if e.errno == errno.EPIPE:
+        # The reader closed the pipe.
+        self.close()
+      elif e.errno != errno.EAGAIN:
+        raise
+
+  def close(self):
+    if self._fd is not None:
+      os.close(self._fd)
+      self._fd = None
+
+
+class UnixSocketSink(object):
+  """Sends each line as a datagram to a Unix domain socket."""
+
+  def __init__(self, path):
+    self.path = path
+    self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    self._socket.setblocking(False)
+
+  def write(self, data):
+    try:
+      self._socket.sendto(data + '\n', self.path)
+    except socket.error as e:
+      # Drop the line if no consumer is bound or it is not keeping up.
+      if e.errno not in (errno.ENOENT, errno.ECONNREFUSED, errno.EAGAIN):
+        raise
+
+  def close(self):
+    self._socket.close()
+
+
+class SpecOutput(object):
+  """Writes the player to spectate to sinks, skipping and coalescing writes.
+
+  Parameter sinks is a sequence of sinks such as FileSink instances.
+  Parameter min_dwell_secs is the least seconds between writes.
+  """
+
+  def __init__(self, sinks, min_dwell_secs=5.0, clock=monotonic):
+    self._sinks = list(sinks)
+    self._min_dwell_secs = min_dwell_secs
+    self._clock = clock
+    self._player_name = None
+    self._write_time = None
+    self._pending_player_name = None
+    self.num_writes = 0
+
+  @property
+  def player_name(self):
+    """Returns the name of the player last written, or None."""
+    return self._player_name
+
+  def _secs_until_writable(self, now):
+    if self._write_time is None:
+      return 0
+    return self._write_time + self._min_dwell_secs - now
+
+  def _write(self, player_name, now):
+    data = spec_command(player_name)
+    for sink in self._sinks:
+      sink.write(data)
+    self._player_name = player_name
+    self._write_time = now
+    self._pending_player_name = None
+    self.num_writes += 1
+
+  def set_player(self, player_name):
+    """Sets the player to spectate.
+
+    Returns None if the player was written or is already written. Otherwise the
+    player is pending, and this returns the seconds until flush writes it.
+    """
+    if player_name == self._player_name:
+      # Discard any pending player, because this player is still spectated.
+      self._pending_player_name = None
+      return None
+    now = self._clock()
+    secs_until_writable = self._secs_until_writable(now)
+    if secs_until_writable > 0:
+      self._pending_player_name = player_name
+      return secs_until_writable
+    self._write(player_name, now)
+    return None
+
+  def flush(self):
+    """Writes any pending player once the minimum dwell time has passed.
+
+    Returns None if no player is pending after this call, or the seconds until
+    the pending player may be written, so that this may run as a Scheduler job.
+    """
+    if self._pending_player_name is None:
+      return None
+    now = self._clock()
+    secs_until_writable = self._secs_until_writable(now)
+    if secs_until_writable > 0:
+      return secs_until_writable
+    self._write(self._pending_player_name, now)
+    return None
+
+  def close(self):
+    for sink in self._sinks:
+      sink.close()
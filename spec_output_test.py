@@ -0,0 +1,113 @@
+import os
+import shutil
+import socket
+import tempfile
+import unittest
+
+from spec_output import *
+
+
+class FakeClock(object):
+  def __init__(self):
+    self.now = 100.0
+
+  def __call__(self):
+    return self.now
+
+
+class ListSink(object):
+  def __init__(self):
+    self.lines = []
+
+  def write(self, data):
+    self.lines.append(data)
+
+  def close(self):
+    pass
+
+
+class SpecOutputTest(unittest.TestCase):
+  """Test case for SpecOutput."""
+
+  def setUp(self):
+    self.clock = FakeClock()
+    self.sink = ListSink()
+    self.spec_output = SpecOutput([self.sink], min_dwell_secs=5, clock=self.clock)
+
+  def test_skip_unchanged(self):
+    self.assertIsNone(self.spec_output.set_player('player_name1'))
+    self.clock.now += 10
+    self.assertIsNone(self.spec_output.set_player('player_name1'))
+    self.assertEqual([spec_command('player_name1')], self.sink.lines)
+
+  def test_coalesce(self):
+    self.spec_output.set_player('player_name1')
+    self.clock.now += 1
+    self.assertEqual(4, self.spec_output.set_player('player_name2'))
+    self.clock.now += 1
+    self.assertEqual(3, self.spec_output.set_player('player_name3'))
+    self.assertEqual(3, self.spec_output.flush())
+
+    # Only the last player of the burst is written.
+    self.clock.now += 3
+    self.assertIsNone(self.spec_output.flush())
+    self.assertEqual([spec_command('player_name1'), spec_command('player_name3')],
+        self.sink.lines)
+    self.assertEqual('player_name3', self.spec_output.player_name)
+
+  def test_coalesce_to_unchanged(self):
+    self.spec_output.set_player('player_name1')
+    self.clock.now += 1
+    self.spec_output.set_player('player_name2')
+    self.spec_output.set_player('player_name1')
+    self.clock.now += 5
+    self.assertIsNone(self.spec_output.flush())
+    self.assertEqual(1, self.spec_output.num_writes)
+
+
+class SinkTest(unittest.TestCase):
+  """Test case for the sinks."""
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.directory)
+
+  def test_file_sink(self):
+    path = os.path.join(self.directory, 'spec.cfg')
+    sink = FileSink(path)
+    sink.write('spec_player "player_name1"')
+    # The second write replaces the file, including on Windows.
+    sink.write('spec_player "player_name2"')
+    with open(path) as f:
+      self.assertEqual('spec_player "player_name2"', f.read())
+    # No temporary files are left behind.
+    self.assertEqual(['spec.cfg'], os.listdir(self.directory))
+
+  def test_fifo_sink(self):
+    path = os.path.join(self.directory, 'spec.fifo')
+    sink = FifoSink(path)
+    self.addCleanup(sink.close)
+    # The line is dropped without a reader.
+    sink.write('spec_player "player_name1"')
+
+    fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+    self.addCleanup(os.close, fd)
+    sink.write('spec_player "player_name2"')
+    self.assertEqual('spec_player "player_name2"\n', os.read(fd, 1024))
+
+  def test_unix_socket_sink(self):
+    path = os.path.join(self.directory, 'spec.sock')
+    sink = UnixSocketSink(path)
+    self.addCleanup(sink.close)
+    # The line is dropped without a consumer.
+    sink.write('spec_player "player_name1"')
+
+    consumer = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    self.addCleanup(consumer.close)
+    consumer.bind(path)
+    sink.write('spec_player "player_name2"')
+    self.assertEqual('spec_player "player_name2"\n', consumer.recv(1024))
+
+
+if __name__ == '__main__':
+  unittest.main()
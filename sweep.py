@@ -0,0 +1,136 @@
+"""Sweeps the weight for standard deviation over recorded matches.
+
+For each weight, every recorded match is replayed through Monitor, and each top
+pick (the players ranked first) is compared against the players with the most
+kills in the following interval. The hit rate of a weight is the fraction of
+top picks that were among those players, counting a split pick fractionally.
+
+The recordings are decoded once in the parent process, along with the players
+with the most kills in each interval, which do not depend on the weight. Each
+worker of the process pool receives them once when it starts, which on POSIX is
+by forking, and then replays them for each weight that it is given.
+
+Run with: python sweep.py [--step STEP] [--processes N] RECORDING...
+"""
+
+import argparse
+from collections import namedtuple
+import multiprocessing
+
+from monitor import Monitor
+from recording import PollRecording
+
+
+# The snapshots of a recorded match, and the names of the players with the most
+# new kills in the interval following each snapshot, by its timestamp.
+Match = namedtuple('Match', ['snapshots', 'next_best_players'])
+WeightScore = namedtuple('WeightScore', ['stddev_weight', 'hit_rate', 'num_picks'])
+
+
+def _new_kills(prev_player, player):
+  """Returns the new kills by a player between two snapshots."""
+  if prev_player is None:
+    return 0
+  elif (player.connect_duration < prev_player.connect_duration or
+      player.kills < prev_player.kills):
+    # The player reconnected or its score was reset.
+    return player.kills
+  return player.kills - prev_player.kills
+
+def _next_best_players(snapshots):
+  """Returns the names of the players with the most kills after each snapshot.
+
+  Returns a map from the timestamp of each snapshot to a set of names. The set
+  is empty if no player had kills in the following interval.
+  """
+  next_best_players = {}
+  for snapshot, next_snapshot in zip(snapshots, snapshots[1:]):
+    prev_players = {player.name: player for player in snapshot.players}
+    new_kills = [(_new_kills(prev_players.get(player.name, None), player), player.name)
+        for player in next_snapshot.players]
+    most_new_kills = max(new_kills)[0] if new_kills else 0
+    next_best_players[snapshot.timestamp] = (
+        {name for kills, name in new_kills if kills == most_new_kills}
+        if most_new_kills else set())
+  return next_best_players
+
+def make_match(snapshots):
+  """Returns a Match instance for the given sequence of snapshots."""
+  snapshots = list(snapshots)
+  return Match(snapshots, _next_best_players(snapshots))
+
+def load_match(path):
+  """Decodes a recording into a Match instance."""
+  return make_match(PollRecording(path))
+
+def score_weight(matches, stddev_weight):
+  """Returns the WeightScore of the given weight over all matches."""
+  hits = 0.0
+  num_picks = 0
+  for match in matches:
+    monitor = Monitor(None, -1, -1)
+    monitor.set_stddev_weight(stddev_weight)
+    for ranked_snapshot in monitor.replay(match.snapshots):
+      next_best_players = match.next_best_players.get(ranked_snapshot.timestamp)
+      if not next_best_players:
+        # This is the last snapshot, or nobody had kills in the next interval.
+        continue
+      top_players = [name for name, rank in ranked_snapshot.ranks.iteritems()
+          if rank == 1]
+      num_picks += 1
+      hits += (sum(1 for name in top_players if name in next_best_players) /
+          float(len(top_players)))
+  hit_rate = hits / num_picks if num_picks else None
+  return WeightScore(stddev_weight, hit_rate, num_picks)
+
+
+# The matches shared by each worker process.
+_worker_matches = None
+
+def _init_worker(matches):
+  global _worker_matches
+  _worker_matches = matches
+
+def _score_worker_weight(stddev_weight):
+  return score_weight(_worker_matches, stddev_weight)
+
+def sweep(matches, stddev_weights, processes=None):
+  """Returns the WeightScore of each weight, in order of weight.
+
+  Parameter processes is the number of worker processes, or None for one per
+  CPU.
+  """
+  pool = multiprocessing.Pool(processes, _init_worker, (matches,))
+  try:
+    scores = list(pool.imap_unordered(_score_worker_weight, stddev_weights))
+  finally:
+    pool.close()
+    pool.join()
+  return sorted(scores)
+
+
+def main():
+  parser = argparse.ArgumentParser(
+      description='Sweeps the weight for standard deviation over recordings.')
+  parser.add_argument('--step', type=int, default=1,
+      help='the step between weights from 0 to 100')
+  parser.add_argument('--processes', type=int, default=None)
+  parser.add_argument('recordings', nargs='+')
+  args = parser.parse_args()
+
+  matches = [load_match(path) for path in args.recordings]
+  stddev_weights = range(0, Monitor._MAX_STDDEV_WEIGHT + 1, args.step)
+  if stddev_weights[-1] != Monitor._MAX_STDDEV_WEIGHT:
+    stddev_weights.append(Monitor._MAX_STDDEV_WEIGHT)
+
+  scores = sweep(matches, stddev_weights, args.processes)
+  print 'weight  hit rate  picks'
+  for score in scores:
+    hit_rate = '-' if score.hit_rate is None else '%.4f' % score.hit_rate
+    print '%6d  %8s  %5d' % (score.stddev_weight, hit_rate, score.num_picks)
+  best_score = max(scores, key=lambda score: score.hit_rate)
+  print 'best weight: %d' % best_score.stddev_weight
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,44 @@
+import unittest
+
+from recording import RecordedPlayer, Snapshot
+from sweep import *
+
+
+class SweepTest(unittest.TestCase):
+  """Test case for the sweep over weights."""
+
+  def setUp(self):
+    # The first player has steady kills, while the second has a burst of kills
+    # in the third interval and then keeps scoring in the fourth.
+    kills = [(0, 0), (2, 0), (4, 0), (6, 5), (7, 7), (9, 7)]
+    snapshots = [
+        Snapshot(20.0 * i, [RecordedPlayer('player_name1', kills1, 20.0 * i),
+            RecordedPlayer('player_name2', kills2, 20.0 * i)])
+        for i, (kills1, kills2) in enumerate(kills)
+    ]
+    self.match = make_match(snapshots)
+
+  def test_next_best_players(self):
+    self.assertEqual({
+        0.0: {'player_name1'},
+        20.0: {'player_name1'},
+        40.0: {'player_name2'},
+        60.0: {'player_name2'},
+        80.0: {'player_name1'},
+    }, self.match.next_best_players)
+
+  def test_score_weight(self):
+    score = score_weight([self.match], 0)
+    # Ranking by new kills picks the first player at 20 and 40, and the second
+    # player at 60 and 80. The picks at 40 and 80 miss the next best player.
+    self.assertEqual(4, score.num_picks)
+    self.assertEqual(0.5, score.hit_rate)
+
+  def test_sweep(self):
+    scores = sweep([self.match], [0, 50, 100], processes=2)
+    self.assertEqual([0, 50, 100], [score.stddev_weight for score in scores])
+    self.assertEqual(score_weight([self.match], 100), scores[2])
+
+
+if __name__ == '__main__':
+  unittest.main()